@@ -0,0 +1,59 @@
+# Compare the throughput of the entity hash algorithms used by the delta export.
+#
+# Loads the consolidated entities of a dataset from its store (as the exporter
+# sees them) and times each hash algorithm over them:
+#
+#   python contrib/bench_hashes.py datasets/us/ofac/us_ofac_sdn.yml
+#
+import logging
+import time
+from pathlib import Path
+
+import click
+from followthemoney.cli.util import InPath
+from nomenklatura.resolver import Linker
+
+from zavod.cli import _load_datasets
+from zavod.entity import Entity
+from zavod.exporters.consolidate import consolidate_entity
+from zavod.logs import configure_logging
+from zavod.runtime.delta import HASH_LENGTHS, hash_entity
+from zavod.store import get_store
+
+
+@click.command()
+@click.argument("dataset_paths", type=InPath, nargs=-1)
+@click.option("-l", "--limit", type=int, default=None)
+@click.option("-r", "--rounds", type=int, default=3)
+def main(dataset_paths: list[Path], limit: int | None, rounds: int) -> None:
+    configure_logging(level=logging.INFO)
+    dataset = _load_datasets(dataset_paths)
+    linker = Linker[Entity]({})
+    store = get_store(dataset, linker)
+    store.sync()
+    view = store.view(dataset)
+
+    entities: list[Entity] = []
+    for entity in view.entities():
+        entities.append(consolidate_entity(linker, entity))
+        if limit is not None and len(entities) >= limit:
+            break
+    values = sum(len(v) for e in entities for v in e.properties.values())
+    print(f"Loaded {len(entities)} entities with {values} values")
+
+    for algorithm in HASH_LENGTHS:
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for entity in entities:
+                hash_entity(entity, algorithm)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert best is not None
+        rate = len(entities) / best if best > 0 else float("inf")
+        print(f"{algorithm}: {best:.3f}s, {rate:,.0f} entities/s")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Compare the LevelDB and the sorted-file timestamp indexes.
+#
+# Builds both indexes from the statements of a dataset (or a given statements
+# pack file) and times the build and an entity lookup for every indexed entity:
+#
+#   python contrib/bench_timestamps.py datasets/us/ofac/us_ofac_sdn.yml
+#
+import logging
+import random
+import time
+from pathlib import Path
+
+import click
+from followthemoney.cli.util import InPath
+from followthemoney.statement.serialize import read_pack_statements_decoded
+
+from zavod.archive import iter_dataset_statements
+from zavod.cli import _load_datasets
+from zavod.logs import configure_logging
+from zavod.runtime.timestamps import Row, TimeStampFile, TimeStampIndex
+
+
+@click.command()
+@click.argument("dataset_paths", type=InPath, nargs=-1)
+@click.option("-p", "--pack", type=InPath, default=None)
+@click.option("-l", "--lookups", type=int, default=100_000)
+def main(dataset_paths: list[Path], pack: Path | None, lookups: int) -> None:
+    configure_logging(level=logging.WARNING)
+    dataset = _load_datasets(dataset_paths)
+    if pack is not None:
+        with open(pack) as fh:
+            stmts = list(read_pack_statements_decoded(fh))
+    else:
+        stmts = list(iter_dataset_statements(dataset, external=False))
+    rows: list[Row] = [(s.entity_id, s.id, s.first_seen) for s in stmts]
+    entity_ids = list({s.entity_id for s in stmts})
+    sample = [random.choice(entity_ids) for _ in range(lookups)]
+    print(f"{len(rows)} statements, {len(entity_ids)} entities")
+
+    for clazz in (TimeStampIndex, TimeStampFile):
+        start = time.perf_counter()
+        index = clazz(dataset)
+        index.index_rows(rows)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        found = 0
+        for entity_id in sample:
+            found += len(index.get(entity_id))
+        lookup = time.perf_counter() - start
+        index.close()
+        print(
+            f"{clazz.__name__}: build {built:.2f}s, "
+            f"{len(sample) / lookup:,.0f} lookups/s ({found} timestamps)"
+        )
+
+
+if __name__ == "__main__":
+    main()
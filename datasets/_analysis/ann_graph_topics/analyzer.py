@@ -26,6 +26,13 @@ Propagation rules are applied per (entity, adjacent) pair:
   ``export.control.linked`` entity is itself tagged ``export.control.linked``.
     Ownership-only, downward-only, one hop per run.
 
+With the ``fixpoint`` dataset config option, the two descent rules are replaced
+by ``propagate_control``, which walks the whole ownership chain in a single
+run: the descent is run to convergence as a breadth-first search over the
+ownership edges of a ``zavod.graph`` projection of the graph, from the seed
+entities. It emits the same patches the per-hop rules converge to. The option
+is off by default.
+
 Requirements and invariants that make this correct:
 
 - **Self-exclusion.** ``non_graph_topics`` ignores topic statements contributed
@@ -37,7 +44,9 @@ Requirements and invariants that make this correct:
 - **Iterative convergence.** Because ownership propagation advances a single
   hop per run, a multi-tier corporate hierarchy only materializes over
   successive runs. The dataset must be re-run for the graph to converge; a
-  single pass is not sufficient.
+  single pass is not sufficient. In ``fixpoint`` mode, the descent is seeded
+  only by topics from other datasets and converges within one run, so the
+  analyzer does not need to observe its own prior emits at all.
 - **External vs. internal, and why the view is ``external=True``.** A statement
   is "external" when it is excluded from the published ``default`` exports.
   Enrichers emit adjacency "passengers" — entities pulled in only because they
@@ -67,7 +76,10 @@ Requirements and invariants that make this correct:
   target entities downstream rather than replacing them.
 """
 
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator, Sequence
+from functools import partial
+
+import numpy as np
 
 from followthemoney import registry
 from followthemoney.property import Property
@@ -77,6 +89,8 @@ from nomenklatura.store.base import View as BaseView
 from zavod import Context, Entity
 from zavod.meta import Dataset, get_catalog, get_multi_dataset
 from zavod.constants import ANALYZER_DATASETS, ORIGIN_INFERRED
+from zavod.graph import GraphProjection, project_graph
+from zavod.runner.analyze import run_analyzer
 from zavod.store import get_store
 from zavod.integration import get_dataset_linker
 
@@ -320,15 +334,77 @@ def rule_export_control_descent(
         emit_patch(context, source, target, "export.control.linked", target_topics)
 
 
-RULES = (
+Rule = Callable[[Context, View, Entity, set[str], Property, Entity], None]
+
+RULES: tuple[Rule, ...] = (
     rule_pep_family_to_rca,
     rule_sanction_adjacency,
     rule_sanction_control_descent,
     rule_export_control_descent,
 )
 
+# Rules applied per entity in fixpoint mode, where ``propagate_control`` handles
+# the ownership descent.
+ADJACENCY_RULES: tuple[Rule, ...] = (
+    rule_pep_family_to_rca,
+    rule_sanction_adjacency,
+)
+
+
+# ---- Fixpoint ownership descent ------------------------------------------
+
+
+def descend_control(
+    context: Context,
+    view: View,
+    graph: GraphProjection,
+    seed_topics: frozenset[str],
+    emits: Sequence[tuple[str, frozenset[str]]],
+) -> None:
+    """Walk the ownership edges of the graph from every entity with one of the
+    ``seed_topics`` down to every asset it controls, directly or indirectly.
 
-def analyze_entity(context: Context, view: View, entity: Entity) -> None:
+    Every reached asset which is not a seed itself is tagged with each topic in
+    ``emits`` it does not already have (per the topic's set of superseding
+    topics). The risk source of a patch is the owner the asset was reached from.
+    """
+    seeds = graph.topic_mask(seed_topics)
+    edges = graph.edge_mask(schema="Ownership", prop="Ownership:asset", ended=False)
+    parents = graph.propagate(seeds, edges)
+    for node in np.flatnonzero((parents >= 0) & ~seeds):
+        target = view.get_entity(graph.ids[node])
+        source = view.get_entity(graph.ids[parents[node]])
+        if target is None or source is None:
+            continue
+        target_topics = non_graph_topics(context, target)
+        for topic, supersede in emits:
+            if target_topics & supersede:
+                continue
+            emit_patch(context, source, target, topic, target_topics)
+
+
+def propagate_control(context: Context, view: View, graph: GraphProjection) -> None:
+    """Run the ``rule_sanction_control_descent`` and ``rule_export_control_descent``
+    rules to convergence over a projection of the graph, which must exclude the
+    topics emitted by this dataset."""
+    context.log.info(
+        "Propagating control down the ownership graph",
+        nodes=len(graph),
+        edges=graph.edge_count,
+    )
+    sanction_emits = [
+        ("sanction.control", SANCTION_CONTROL_SEEDS),
+        # Anything that's under sanctioned control is also sanction-linked.
+        ("sanction.linked", SANCTION_SEEDS),
+    ]
+    descend_control(context, view, graph, SANCTION_CONTROL_SEEDS, sanction_emits)
+    export_emits = [("export.control.linked", EXPORT_CONTROL_SEEDS)]
+    descend_control(context, view, graph, EXPORT_CONTROL_SEEDS, export_emits)
+
+
+def analyze_entity(
+    context: Context, view: View, entity: Entity, rules: Sequence[Rule] = RULES
+) -> None:
     source_topics: set[str] = set(entity.get_type_values(registry.topic))
     for prop, adjacent in view.get_adjacent(entity):
         if len(adjacent.get("endDate", quiet=True)) > 0:
@@ -339,7 +415,7 @@ def analyze_entity(context: Context, view: View, entity: Entity) -> None:
                 end=adjacent.get("endDate"),
             )
             continue
-        for rule in RULES:
+        for rule in rules:
             rule(context, view, entity, source_topics, prop, adjacent)
 
 
@@ -350,7 +426,9 @@ def crawl(context: Context) -> None:
     store.sync()
     view = store.view(scope, external=True)
 
-    for entity_idx, entity in enumerate(view.entities()):
-        if entity_idx > 0 and entity_idx % 1000 == 0:
-            context.log.info(f"Processed {entity_idx} entities")
-        analyze_entity(context, view, entity)
+    if not context.dataset.config.get("fixpoint", False):
+        run_analyzer(context, view, analyze_entity)
+        return
+    graph = project_graph(view, exclude=[context.dataset.name])
+    run_analyzer(context, view, partial(analyze_entity, rules=ADJACENCY_RULES))
+    propagate_control(context, view, graph)
@@ -11,7 +11,10 @@ from nomenklatura.store.memory import MemoryStore
 from zavod import Context, Dataset, Entity
 from zavod.logs import get_logger
 
-from .analyzer import analyze_entity, non_graph_topics
+from zavod.graph import GraphBuilder
+
+from .analyzer import ADJACENCY_RULES
+from .analyzer import analyze_entity, non_graph_topics, propagate_control
 
 SOURCE = Dataset({"name": "src", "title": "Source"})
 GRAPH = Dataset({"name": "ann_graph_topics", "title": "Graph"})
@@ -472,6 +475,107 @@ def test_export_control_descent_does_not_coemit_sanction_linked() -> None:
     assert "sanction.control" not in topics
 
 
+# ---- propagate_control (fixpoint mode) -----------------------------------
+
+
+def _propagate(entities: list[Entity]) -> FakeContext:
+    store = _store(entities)
+    view = store.view(SOURCE, external=True)
+    ctx = FakeContext()
+    graph = GraphBuilder(exclude=[GRAPH.name])
+    for entity in view.entities():
+        analyze_entity(ctx, view, entity, ADJACENCY_RULES)
+        graph.add(entity)
+    propagate_control(ctx, view, graph.build())
+    return ctx
+
+
+def _ownership(owner: str, asset: str, **props: list[str]) -> Entity:
+    data = {"owner": [owner], "asset": [asset], **props}
+    return _entity("Ownership", f"own-{owner}-{asset}", data)
+
+
+def test_fixpoint_descends_full_chain_in_one_run() -> None:
+    ctx = _propagate(
+        [
+            _entity("Person", "boss", {"topics": ["sanction"]}),
+            _entity("Company", "a"),
+            _entity("Company", "b"),
+            _entity("Company", "c"),
+            _ownership("boss", "a"),
+            _ownership("a", "b"),
+            _ownership("b", "c"),
+        ]
+    )
+    emits = _emits(ctx)
+    for target in ("a", "b", "c"):
+        assert emits.count((target, "sanction.control")) == 1
+        assert (target, "sanction.linked") in emits
+    assert not any(target == "boss" for target, _ in emits)
+
+
+def test_fixpoint_matches_converged_per_hop_rules() -> None:
+    entities = [
+        _entity("Company", "parent", {"topics": ["export.control"]}),
+        _entity("Company", "child", {"topics": ["sanction"]}),
+        _entity("Company", "grandchild"),
+        _entity("Company", "former"),
+        _ownership("parent", "child"),
+        _ownership("child", "grandchild"),
+        _ownership("grandchild", "parent"),
+        _ownership("child", "former", endDate=["2020-01-01"]),
+    ]
+    ctx = _propagate(entities)
+    # Run the per-hop rules until no new topics are emitted:
+    graph: list[Entity] = []
+    per_hop: set[tuple[str, str]] = set()
+    while True:
+        store = _store(entities + graph)
+        view = store.view(SOURCE, external=True)
+        hop = FakeContext()
+        for entity in view.entities():
+            analyze_entity(hop, view, entity)
+        emits = set(_emits(hop))
+        if emits <= per_hop:
+            break
+        per_hop.update(emits)
+        graph = [
+            _entity(e.schema.name, e.id or "", e.to_dict()["properties"], GRAPH)
+            for e, _ in hop.emitted
+        ]
+    assert set(_emits(ctx)) == per_hop
+    assert ("parent", "sanction.control") in per_hop
+    assert ("grandchild", "export.control.linked") in per_hop
+    assert not any(target == "former" for target, _ in per_hop)
+
+
+def test_fixpoint_continues_through_already_controlled_asset() -> None:
+    ctx = _propagate(
+        [
+            _entity("Person", "boss", {"topics": ["sanction"]}),
+            _entity("Company", "a", {"topics": ["sanction.control"]}),
+            _entity("Company", "b"),
+            _ownership("boss", "a"),
+            _ownership("a", "b"),
+        ]
+    )
+    emits = _emits(ctx)
+    assert ("a", "sanction.control") not in emits
+    assert ("b", "sanction.control") in emits
+
+
+def test_fixpoint_ignores_own_prior_emits_as_seeds() -> None:
+    ctx = _propagate(
+        [
+            _entity("Company", "a", {"topics": ["sanction.control"]}, dataset=GRAPH),
+            _entity("Company", "a", {"name": ["A"]}),
+            _entity("Company", "b"),
+            _ownership("a", "b"),
+        ]
+    )
+    assert _emits(ctx) == []
+
+
 # ---- analyze_entity plumbing --------------------------------------------
 
 
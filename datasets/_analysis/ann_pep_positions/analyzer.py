@@ -5,7 +5,8 @@ from zavod.constants import ORIGIN_INFERRED
 from zavod.integration import get_dataset_linker
 from zavod.meta import get_catalog, get_multi_dataset
 from zavod.stateful.positions import OccupancyStatus, categorise_many
-from zavod.store import get_store
+from zavod.runner.analyze import run_analyzer
+from zavod.store import View, get_store
 
 INFLUENCE_TOPIC_LABELS = {
     "gov.national": "National government",
@@ -108,58 +109,50 @@ def analyze_position(context: Context, entity: Entity) -> set[str]:
     return topics
 
 
-def crawl(context: Context) -> None:
-    scope = get_multi_dataset(get_catalog(), context.dataset.inputs)
-    linker = get_dataset_linker(scope)
-    store = get_store(scope, linker)
-    store.sync()
-    view = store.view(scope)
-    pep_count = 0
+def analyze_entity(context: Context, view: View, entity: Entity) -> None:
+    if not entity.schema.is_a("Person") or "role.pep" not in entity.get("topics"):
+        return
 
-    for entity_idx, entity in enumerate(view.entities()):
-        if entity_idx > 0 and entity_idx % 10000 == 0:
-            context.log.info(f"Processed {entity_idx} entities")
+    # Skip if this is the only dataset containing this PEP. This should be implicit
+    # from other conditions, but let's be sure this dataset doesn't feed itself
+    # removed PEPs.
+    if entity.datasets == {context.dataset.name}:
+        return
 
-        if not entity.schema.is_a("Person") or "role.pep" not in entity.get("topics"):
-            continue
+    topic_to_seen_statuses: dict[str, set[OccupancyStatus]] = defaultdict(set)
 
-        # Skip if this is the only dataset containing this PEP. This should be implicit
-        # from other conditions, but let's be sure this dataset doesn't feed itself
-        # removed PEPs.
-        if entity.datasets == {context.dataset.name}:
+    for prop, adjacent in view.get_adjacent(entity):
+        if prop.name != "positionOccupancies":
             continue
 
-        pep_count += 1
-        if pep_count > 0 and pep_count % 10000 == 0:
-            context.log.info(f"Processed {pep_count} PEPs")
+        occupancy = adjacent
 
-        topic_to_seen_statuses: dict[str, set[OccupancyStatus]] = defaultdict(set)
-
-        for prop, adjacent in view.get_adjacent(entity):
-            if prop.name != "positionOccupancies":
+        # Only one position expected per occupancy but handle surprises
+        for position_id in occupancy.get("post"):
+            position = view.get_entity(position_id)
+            if position is None:
                 continue
+            topics = analyze_position(context, position)
 
-            occupancy = adjacent
-
-            # Only one position expected per occupancy but handle surprises
-            for position_id in occupancy.get("post"):
-                position = view.get_entity(position_id)
-                if position is None:
+            for topic in topics:
+                if topic not in INFLUENCE_TOPIC_LABELS:
                     continue
-                topics = analyze_position(context, position)
-
-                for topic in topics:
-                    if topic not in INFLUENCE_TOPIC_LABELS:
-                        continue
-                    topic_to_seen_statuses[topic].add(
-                        get_best_occupancy_status(occupancy)
-                    )
-
-        # For each topic, we determine the best status seen and build the label from it.
-        influence_labels = build_consolidated_influence_labels(topic_to_seen_statuses)
-        if not influence_labels:
-            continue
-        person_proxy = context.make("Person")
-        person_proxy.id = entity.id
-        person_proxy.add("classification", influence_labels, origin=ORIGIN_INFERRED)
-        context.emit(person_proxy)
+                topic_to_seen_statuses[topic].add(get_best_occupancy_status(occupancy))
+
+    # For each topic, we determine the best status seen and build the label from it.
+    influence_labels = build_consolidated_influence_labels(topic_to_seen_statuses)
+    if not influence_labels:
+        return
+    person_proxy = context.make("Person")
+    person_proxy.id = entity.id
+    person_proxy.add("classification", influence_labels, origin=ORIGIN_INFERRED)
+    context.emit(person_proxy)
+
+
+def crawl(context: Context) -> None:
+    scope = get_multi_dataset(get_catalog(), context.dataset.inputs)
+    linker = get_dataset_linker(scope)
+    store = get_store(scope, linker)
+    store.sync()
+    view = store.view(scope)
+    run_analyzer(context, view, analyze_entity)
@@ -13,8 +13,12 @@ Layout
 `/artifacts/{dataset}/{version}/` is the canonical, immutable location for all
 outputs of a given run, and is what we point to in the metadata. It holds both
 the listed resources (e.g. `entities.ftm.json`) and run artifacts such as
-`index.json`, `statistics.json`, `issues.json`, `statements.pack`,
-`entities.delta.json`, `delta.json` and a `versions.json` snapshot.
+`index.json`, `statistics.json`, `issues.json`, `statements.pack` (and,
+optionally, its columnar copy `statements.columns` and the timestamp index
+`timestamps.idx`), `entities.delta.json`, `delta.json` and a `versions.json`
+snapshot. Local enrichers also archive the blocking index of their target dataset
+(`enrich-index.duckdb`), to be updated incrementally by the next run, and
+incremental enrichers the matches of each subject (`enrich.subjects.json`).
 
 `/artifacts/{dataset}/versions.json` is the root version file: a window of the
 most recent version IDs of the dataset (oldest first, up to
@@ -71,6 +75,7 @@ from followthemoney.dataset import Version, VersionHistory
 from zavod import settings
 from zavod.logs import get_logger
 from zavod.archive.backend import get_archive_backend, ArchiveObject
+from zavod.archive.columns import StatementColumns
 from zavod.archive.cdn import invalidate_archive_cache
 
 if TYPE_CHECKING:
@@ -82,8 +87,14 @@ DATASETS = "datasets"
 ARTIFACTS = "artifacts"
 LATEST = "latest"
 STATEMENTS_FILE = "statements.pack"
+STATEMENTS_COLUMNS_FILE = "statements.columns"
+TIMESTAMPS_FILE = "timestamps.idx"
+ENRICH_INDEX_FILE = "enrich-index.duckdb"
+ENRICH_SUBJECTS_FILE = "enrich.subjects.json"
+SOURCES_FILE = "sources.json"
 HASH_FILE = "entities.hash"
 DELTA_EXPORT_FILE = "entities.delta.json"
+STATEMENTS_DELTA_FILE = "statements.delta.json"
 DELTA_INDEX_FILE = "delta.json"
 STATISTICS_FILE = "statistics.json"
 ISSUES_LOG = "issues.log"
@@ -92,6 +103,7 @@ RESOURCES_FILE = "resources.json"
 INDEX_FILE = "index.json"
 CATALOG_FILE = "catalog.json"
 VERSIONS_FILE = "versions.json"
+STORE_DIR = "store"
 # HACK: DatasetResources are defined as downloadable files of a dataset.
 # A couple of exporters use this as a mechanism to get files archived,
 # but their files are listed elsewhere in the dataset metadata so we don't
@@ -106,6 +118,11 @@ EXTRA_ARTIFACTS = [
     ISSUES_LOG,
     INDEX_FILE,
     STATEMENTS_FILE,
+    STATEMENTS_COLUMNS_FILE,
+    TIMESTAMPS_FILE,
+    ENRICH_INDEX_FILE,
+    ENRICH_SUBJECTS_FILE,
+    SOURCES_FILE,
     VERSIONS_FILE,
     RESOURCES_FILE,
     HASH_FILE,
@@ -134,9 +151,29 @@ def dataset_state_path(dataset_name: str) -> Path:
     return path.resolve()
 
 
-def clear_data_path(dataset_name: str) -> None:
-    """Delete all recorded data for a given dataset."""
-    shutil.rmtree(dataset_data_path(dataset_name), ignore_errors=True)
+def clear_data_path(dataset_name: str, keep_store: bool = False) -> None:
+    """Delete all recorded data for a given dataset. If `keep_store` is set, the
+    aggregator store in the state directory is retained so it can be synced
+    incrementally on the next export."""
+    data_path = dataset_data_path(dataset_name)
+    if not keep_store:
+        shutil.rmtree(data_path, ignore_errors=True)
+        return
+    for path in data_path.iterdir():
+        if path.name == "_state" and path.is_dir():
+            for state_path in path.iterdir():
+                if state_path.name == STORE_DIR:
+                    continue
+                _remove_path(state_path)
+            continue
+        _remove_path(path)
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
 
 
 def dataset_resource_path(dataset_name: str, resource: str) -> Path:
@@ -278,17 +315,41 @@ def iter_dataset_statements(dataset: "Dataset", external: bool = True) -> Statem
 
 
 def iter_local_statements(dataset: "Dataset", external: bool = True) -> StatementGen:
-    """Create a generator that yields all statements in the given dataset."""
+    """Create a generator that yields all statements in the given dataset. With
+    `ZAVOD_STATEMENTS_COLUMNS`, they are read from the columnar file if it exists."""
     assert not dataset.is_collection
     path = dataset_resource_path(dataset.name, STATEMENTS_FILE)
     if settings.ARCHIVE_BACKFILL_STATEMENTS:
         get_dataset_artifact(dataset.name, STATEMENTS_FILE)
     if not path.exists():
         raise FileNotFoundError(f"Statements not found: {dataset.name}")
+    columns_path = dataset_resource_path(dataset.name, STATEMENTS_COLUMNS_FILE)
+    if settings.STATEMENTS_COLUMNS and columns_path.exists():
+        with StatementColumns(columns_path) as columns:
+            yield from columns.statements(external=external)
+        return
     with open(path) as fh:
         yield from _read_fh_statements(fh, external)
 
 
+def get_statements_version(dataset: "Dataset") -> str | None:
+    """Identify the statements file that `iter_dataset_statements` would read for
+    the given leaf dataset. The local file is identified by its size and modification
+    time, the archived file by its versioned object name. Returns `None` if no
+    statements are available for the dataset."""
+    assert not dataset.is_collection
+    path = dataset_resource_path(dataset.name, STATEMENTS_FILE)
+    if settings.ARCHIVE_BACKFILL_STATEMENTS:
+        get_dataset_artifact(dataset.name, STATEMENTS_FILE)
+    if path.exists():
+        stat = path.stat()
+        return f"local:{stat.st_size}:{stat.st_mtime_ns}"
+    object = get_artifact_object(dataset.name, STATEMENTS_FILE)
+    if object is not None:
+        return f"{object.name}:{object.size()}"
+    return None
+
+
 def _iter_scope_statements(dataset: "Dataset", external: bool = True) -> StatementGen:
     try:
         yield from iter_local_statements(dataset, external=external)
@@ -309,6 +370,17 @@ def _iter_scope_statements(dataset: "Dataset", external: bool = True) -> Stateme
     log.error(f"Cannot load statements for: {dataset.name}")
 
 
+def get_previous_columns(dataset: "Dataset") -> Path | None:
+    """Fetch the columnar statements of the previous release of a leaf dataset into
+    its state directory. Returns `None` if the release has no columns file."""
+    object = get_artifact_object(dataset.name, STATEMENTS_COLUMNS_FILE)
+    if object is None:
+        return None
+    path = dataset_state_path(dataset.name) / STATEMENTS_COLUMNS_FILE
+    object.backfill(path)
+    return path
+
+
 def iter_previous_statements(
     dataset: "Dataset", external: bool = True, version: str | None = None
 ) -> StatementGen:
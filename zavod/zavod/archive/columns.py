@@ -0,0 +1,246 @@
+"""
+A columnar, block-indexed copy of a dataset's statements (`statements.columns`).
+
+Statements are sorted by entity ID and stored in blocks of up to `BLOCK_SIZE`
+statements; an entity is never split across blocks. Within a block, each column
+(the fields of `statements.pack`) is stored as a separately compressed JSON array.
+A footer indexes every block by its first and last entity ID and the offsets of
+its columns. The file is read via `mmap`, so a consumer only decompresses the
+columns it needs, and can skip to the block holding an entity.
+
+Layout: `MAGIC`, the column data, the JSON footer, the footer offset as a
+little-endian unsigned 64-bit integer, and `MAGIC` again.
+"""
+
+import mmap
+import struct
+import zlib
+from bisect import bisect_left
+from pathlib import Path
+from types import TracebackType
+from typing import Any, BinaryIO, Self
+from collections.abc import Generator, Iterable, Sequence
+
+import orjson
+from followthemoney import Statement
+from followthemoney.statement.serialize import read_pack_statements_decoded
+from followthemoney.statement.util import unpack_prop
+
+from zavod.logs import get_logger
+from zavod.runtime.sort import ExternalSorter
+
+log = get_logger(__name__)
+
+MAGIC = b"ZVCOLS01"
+OFFSET = struct.Struct("<Q")
+BLOCK_SIZE = 50_000
+COLUMNS = (
+    "entity_id",
+    "prop",
+    "value",
+    "dataset",
+    "lang",
+    "original_value",
+    "origin",
+    "external",
+    "first_seen",
+    "last_seen",
+    "id",
+)
+Row = tuple[str | None, ...]
+
+
+def statement_row(stmt: Statement) -> Row:
+    """Convert a statement to a row of column values, encoded as in the pack file."""
+    return (
+        stmt.entity_id,
+        f"{stmt.schema}:{stmt.prop}",
+        stmt.value,
+        stmt.dataset,
+        stmt.lang,
+        stmt.original_value,
+        stmt.origin,
+        "t" if stmt.external else None,
+        stmt.first_seen,
+        stmt.last_seen,
+        stmt.id,
+    )
+
+
+class ColumnsWriter:
+    """Write rows, which must be sorted by entity ID, into column blocks."""
+
+    def __init__(self, fh: BinaryIO) -> None:
+        self.fh = fh
+        self.fh.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.blocks: list[dict[str, Any]] = []
+        self.rows: list[Row] = []
+
+    def write(self, row: Row) -> None:
+        if len(self.rows) >= BLOCK_SIZE and self.rows[-1][0] != row[0]:
+            self.flush()
+        self.rows.append(row)
+
+    def flush(self) -> None:
+        if not len(self.rows):
+            return
+        offsets: list[tuple[int, int]] = []
+        for values in zip(*self.rows):
+            data = zlib.compress(orjson.dumps(values))
+            self.fh.write(data)
+            offsets.append((self.offset, len(data)))
+            self.offset += len(data)
+        block = {
+            "first": self.rows[0][0],
+            "last": self.rows[-1][0],
+            "count": len(self.rows),
+            "offsets": offsets,
+        }
+        self.blocks.append(block)
+        self.rows = []
+
+    def close(self) -> None:
+        self.flush()
+        footer = {"columns": COLUMNS, "blocks": self.blocks}
+        self.fh.write(orjson.dumps(footer))
+        self.fh.write(OFFSET.pack(self.offset))
+        self.fh.write(MAGIC)
+
+
+def write_columns(statements: Iterable[Statement], path: Path) -> int:
+    """Sort the given statements by entity ID and write them as a columns file.
+    Returns the number of statements written."""
+    sort_path = path.with_name(f"{path.name}.sort")
+    sorter = ExternalSorter(sort_path)
+    for stmt in statements:
+        if stmt.entity_id is None or stmt.id is None:
+            continue
+        # Keys are unique per statement, so that the sort keeps all of them:
+        key = f"{stmt.entity_id}\x00{stmt.id}"
+        sorter.add(key, orjson.dumps(statement_row(stmt)).decode("utf-8"))
+    count = 0
+    try:
+        with open(path, "wb") as fh:
+            writer = ColumnsWriter(fh)
+            for _, data in sorter.sorted():
+                writer.write(tuple(orjson.loads(data)))
+                count += 1
+            writer.close()
+    finally:
+        for run in sort_path.glob("*.run"):
+            run.unlink()
+        sort_path.rmdir()
+    return count
+
+
+def convert_pack(pack_path: Path, path: Path) -> int:
+    """Convert a `statements.pack` file into a columns file."""
+    with open(pack_path) as fh:
+        count = write_columns(read_pack_statements_decoded(fh), path)
+    log.info("Wrote statement columns", path=path.as_posix(), statements=count)
+    return count
+
+
+class StatementColumns:
+    """Read a columns file via a memory map."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.fh = open(path, "rb")
+        self.map = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        tail = len(self.map) - len(MAGIC)
+        if self.map[: len(MAGIC)] != MAGIC or self.map[tail:] != MAGIC:
+            self.close()
+            raise ValueError(f"Not a statement columns file: {path}")
+        (offset,) = OFFSET.unpack(self.map[tail - OFFSET.size : tail])
+        footer = orjson.loads(self.map[offset : tail - OFFSET.size])
+        self.columns: list[str] = footer["columns"]
+        self.blocks: list[dict[str, Any]] = footer["blocks"]
+        self._lasts = [block["last"] for block in self.blocks]
+
+    def __len__(self) -> int:
+        return sum(block["count"] for block in self.blocks)
+
+    def column(self, block: int, name: str) -> list[str | None]:
+        """Decode a single column of a block."""
+        offset, length = self.blocks[block]["offsets"][self.columns.index(name)]
+        values: list[str | None] = orjson.loads(
+            zlib.decompress(self.map[offset : offset + length])
+        )
+        return values
+
+    def rows(
+        self,
+        columns: Sequence[str] = COLUMNS,
+        start: str | None = None,
+        stop: str | None = None,
+    ) -> Generator[Row, None, None]:
+        """Iterate over the given columns of the statements, optionally only for
+        the entity IDs in the range from `start` to `stop` (both inclusive)."""
+        first = 0 if start is None else bisect_left(self._lasts, start)
+        for idx in range(first, len(self.blocks)):
+            block = self.blocks[idx]
+            if stop is not None and block["first"] > stop:
+                break
+            values = [self.column(idx, name) for name in columns]
+            if start is None and stop is None:
+                yield from zip(*values)
+                continue
+            entity_ids = self.column(idx, "entity_id")
+            for entity_id, row in zip(entity_ids, zip(*values)):
+                if entity_id is None:
+                    continue
+                if start is not None and entity_id < start:
+                    continue
+                if stop is not None and entity_id > stop:
+                    break
+                yield row
+
+    def statements(
+        self,
+        external: bool = True,
+        start: str | None = None,
+        stop: str | None = None,
+    ) -> Generator[Statement, None, None]:
+        """Iterate over the statements, optionally in a range of entity IDs."""
+        for row in self.rows(COLUMNS, start=start, stop=stop):
+            data = dict(zip(COLUMNS, row))
+            if not external and data["external"] == "t":
+                continue
+            schema, _, prop = unpack_prop(data["prop"] or "")
+            yield Statement(
+                entity_id=data["entity_id"] or "",
+                prop=prop,
+                schema=schema,
+                value=data["value"] or "",
+                dataset=data["dataset"] or "",
+                lang=data["lang"] or None,
+                original_value=data["original_value"] or None,
+                origin=data["origin"] or None,
+                first_seen=data["first_seen"],
+                external=data["external"] == "t",
+                canonical_id=data["entity_id"],
+                last_seen=data["last_seen"],
+                id=data["id"],
+            )
+
+    def entity_statements(self, entity_id: str) -> list[Statement]:
+        """Get all statements about an entity."""
+        return list(self.statements(start=entity_id, stop=entity_id))
+
+    def close(self) -> None:
+        if not self.map.closed:
+            self.map.close()
+        self.fh.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        type: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
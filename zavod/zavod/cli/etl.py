@@ -70,13 +70,15 @@ def publish(dataset_path: Path) -> None:
 @cli.command("run", help="Crawl, export and then publish a specific dataset")
 @click.argument("dataset_path", type=DatasetInPath)
 @click.option("--clear-data/--keep-data", is_flag=True, default=True)
+@click.option("--rebuild-store/--keep-store", is_flag=True, default=True)
 def run(
     dataset_path: Path,
     clear_data: bool = False,
+    rebuild_store: bool = True,
 ) -> None:
     dataset = _load_dataset(dataset_path)
     if clear_data:
-        clear_data_path(dataset.name)
+        clear_data_path(dataset.name, keep_store=not rebuild_store)
 
     if dataset.model.disabled:
         log.info(f"Dataset is disabled, skipping: {dataset.name}")
@@ -97,7 +99,7 @@ def run(
     store = get_store(dataset, linker)
     # Export and validation
     try:
-        store.sync(clear=True)
+        store.sync(clear=rebuild_store)
         view = store.view(dataset, external=False)
         export_dataset(dataset, view)
     except Exception:
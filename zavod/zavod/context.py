@@ -1,8 +1,10 @@
 import orjson
 import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Any, cast
-from collections.abc import Mapping
+from collections.abc import Generator, Iterable, Mapping
 from datapatch import Lookup, LookupException, Result
 from followthemoney.dataset import DataResource, Version
 from followthemoney.schema import Schema
@@ -19,6 +21,8 @@ from structlog.contextvars import bind_contextvars, reset_contextvars
 
 from zavod import settings
 from zavod.archive import STATEMENTS_FILE, dataset_data_path, dataset_resource_path
+from zavod.archive import STATEMENTS_COLUMNS_FILE, iter_previous_statements
+from zavod.archive.columns import convert_pack
 from zavod.audit import inspect
 from zavod.entity import Entity
 from zavod.integration.dedupe import get_resolver
@@ -28,13 +32,18 @@ from zavod.runtime.http_ import (
     _Auth,
     _Body,
     _Headers,
+    HostLimiter,
+    conditional_headers,
     fetch_file,
+    get_validators,
     make_session,
     request_hash,
 )
+from zavod.runtime.cache import DatasetCache
 from zavod.runtime.issues import DatasetIssues
 from zavod.runtime.resources import DatasetResources
-from zavod.runtime.timestamps import TimeStampIndex
+from zavod.runtime.sources import DatasetSources
+from zavod.runtime.timestamps import TimeStampFile, TimeStampIndex, write_timestamps
 from zavod.runtime.versions import get_latest, make_version
 from zavod.util import Element, join_slug, prefixed_hash_id
 
@@ -69,17 +78,19 @@ class Context:
         self.stats = ContextStats()
         self.issues = DatasetIssues(dataset)
         self.resources = DatasetResources(dataset)
+        self.sources = DatasetSources(dataset)
         self.log = get_logger(dataset.name)
         self.http = make_session(dataset.http)
         self._db: Session | None = None
-        self._cache: Cache | None = None
-        self._timestamps: TimeStampIndex | None = None
+        self._cache: DatasetCache | None = None
+        self._timestamps: TimeStampFile | TimeStampIndex | None = None
         self._resolver: Resolver[Entity] | None = None
         self._structlog_contextvars_tokens: (
             Mapping[str, contextvars.Token[Any]] | None
         ) = None
         self._writer_path = dataset_resource_path(dataset.name, STATEMENTS_FILE)
         self._writer: PackStatementWriter | None = None
+        self._skipped = False
 
         self.lang: str | None = None
         """Default language for statements emitted from this dataset"""
@@ -103,7 +114,7 @@ class Context:
     def cache(self) -> Cache:
         """A cache object for storing HTTP responses and other data."""
         if self._cache is None:
-            self._cache = Cache(self.db, self.dataset, create=True)
+            self._cache = DatasetCache(self.db, self.dataset, create=True)
         return self._cache
 
     @property
@@ -126,11 +137,14 @@ class Context:
         return get_latest(self.dataset.name, backfill=False) or settings.RUN_VERSION
 
     @property
-    def timestamps(self) -> TimeStampIndex:
+    def timestamps(self) -> TimeStampFile | TimeStampIndex:
         """An index of the first_seen time of every statement previous emitted by
         the dataset. This is used to determine if a statement is new or not."""
         if self._timestamps is None:
-            self._timestamps = TimeStampIndex.build(self.dataset)
+            if settings.TIMESTAMP_INDEX == "file":
+                self._timestamps = TimeStampFile.build(self.dataset)
+            else:
+                self._timestamps = TimeStampIndex.build(self.dataset)
         return self._timestamps
 
     @property
@@ -184,6 +198,8 @@ class Context:
 
     def flush(self) -> None:
         """Flush the context to ensure all data is written to disk."""
+        if self._cache is not None:
+            self._cache.flush()
         if self._db is not None:
             self._db.checkpoint()
 
@@ -200,24 +216,91 @@ class Context:
         file is never created earlier than it would by emitting entities.
         This can be important while e.g. enrichers backfill from the most recent
         statements file.
+
+        With `ZAVOD_STATEMENTS_COLUMNS`, the statements are also converted to the
+        columnar format here, and with `ZAVOD_TIMESTAMP_ARCHIVE` they are indexed
+        for the timestamp lookups of the next crawl.
         """
-        if not self.dry_run and self._writer is None:
+        if self.dry_run:
+            return
+        if self._writer is None:
             self._writer_path.touch()
+        else:
+            self._writer.close()
+            self._writer = None
+        columns_path = dataset_resource_path(self.dataset.name, STATEMENTS_COLUMNS_FILE)
+        if settings.STATEMENTS_COLUMNS:
+            convert_pack(self._writer_path, columns_path)
+        else:
+            # Don't leave the columns of an earlier run next to these statements:
+            columns_path.unlink(missing_ok=True)
+        if settings.TIMESTAMP_ARCHIVE:
+            write_timestamps(self.dataset)
 
     def close(self) -> None:
         """Flush and tear down the context."""
         self.http.close()
+        if self._cache is not None:
+            self._cache.close()
         if self._db is not None:
             self._db.commit()
         if self._timestamps is not None:
             self._timestamps.close()
         if self._writer is not None:
             self._writer.close()
+            self._writer = None
         reset_contextvars(**(self._structlog_contextvars_tokens or {}))
         self.issues.close()
         if not self.dry_run:
             self.issues.export()
 
+    def register_source(self, name: str, source: Path | bytes | str) -> None:
+        """Register a source fetched by the crawler, whose fingerprint is compared
+        with that of the previous run by `skip_if_unchanged`.
+
+        Args:
+            name: A name for the source, e.g. its file name or URL.
+            source: The path of the fetched source file, or the fetched data.
+        """
+        self.sources.add(name, source)
+
+    def skip_if_unchanged(self) -> bool:
+        """Check if the sources registered with `register_source`, the crawler's
+        code and its metadata are the same as in the last successful run. If so,
+        the statements and issues of that run are re-used and the crawler must
+        return without emitting any entities:
+
+            if context.skip_if_unchanged():
+                return
+
+        Must be called after registering all sources, and before emitting any
+        entities.
+
+        Returns:
+            Whether the crawler should return.
+        """
+        if self.dry_run:
+            return False
+        if self._writer is not None:
+            self.log.warning("Cannot skip the crawl, entities have been emitted")
+            return False
+        if not self.sources.unchanged():
+            return False
+        self.log.info("Sources are unchanged, re-using previous statements")
+        self.issues.extend(self.sources.issues or [])
+        fh = self._writer_path.open("w", encoding=ENCODING)
+        self._writer = PackStatementWriter(fh)
+        entity_id: str | None = None
+        for stmt in iter_previous_statements(self.dataset):
+            if stmt.entity_id != entity_id:
+                entity_id = stmt.entity_id
+                self.stats.entities += 1
+            stmt.last_seen = settings.RUN_TIME_ISO
+            self._writer.write(stmt)
+            self.stats.statements += 1
+        self._skipped = True
+        return True
+
     def get_resource_path(self, name: PathLike) -> Path:
         """Get the path to a file in the dataset data folder.
 
@@ -331,7 +414,9 @@ class Context:
     ) -> str | None:
         """Execute an HTTP request using the contexts' session and return
         the decoded response body. If a `cache_days` argument is provided, a
-        cache will be used for the given number of days.
+        cache will be used for the given number of days. Once a cached response
+        has expired, it is re-validated with a conditional request if the server
+        sent an `ETag` or `Last-Modified` header, and kept if it is unchanged.
 
         Args:
             url: The URL to be fetched.
@@ -352,15 +437,31 @@ class Context:
         fingerprint = request_hash(
             url, auth=auth, method=method, data=data, encoding=encoding
         )
+        validators_key = f"{fingerprint}:validators"
+        stale: str | None = None
+        validators: dict[str, Any] | None = None
         if cache_days is not None:
             text = self.cache.get(fingerprint, max_age=cache_days)
             if text is not None:
                 self.log.debug("HTTP cache hit", url=url, fingerprint=fingerprint)
                 return text
+            # An expired response can be re-validated with the server:
+            if method == "GET":
+                stale_validators = self.cache.get(validators_key)
+                stale = self.cache.get(fingerprint)
+                if stale_validators is not None and stale is not None:
+                    validators = orjson.loads(stale_validators)
+                    headers = conditional_headers(headers, validators)
+                else:
+                    stale = None
 
         response = self.fetch_response(
             url, headers=headers, auth=auth, method=method, data=data
         )
+        if response.status_code == 304 and stale is not None:
+            self.log.debug("HTTP not modified", url=url, fingerprint=fingerprint)
+            self.cache.set(fingerprint, stale)
+            return stale
         if encoding is not None:
             response.encoding = encoding
         text = response.text
@@ -369,8 +470,100 @@ class Context:
 
         if cache_days is not None:
             self.cache.set(fingerprint, text)
+            if method == "GET":
+                validators = get_validators(response)
+                if validators is not None:
+                    self.cache.set(validators_key, orjson.dumps(validators).decode())
         return text
 
+    def fetch_many(
+        self,
+        urls: Iterable[str],
+        headers: _Headers = None,
+        auth: _Auth = None,
+        cache_days: int | None = None,
+        method: str = "GET",
+        encoding: str | None = None,
+        ordered: bool = True,
+    ) -> Generator[tuple[str, str | None], None, None]:
+        """Fetch many URLs concurrently and return their decoded response bodies,
+        like `fetch_text`. At most `http.concurrency` requests are sent to the same
+        host at a time, started at least `http.delay` seconds apart (see the
+        dataset metadata). Responses are cached under the same fingerprints as
+        those of `fetch_text`.
+
+        Only the requests are sent from worker threads: the results are yielded to
+        the calling thread, which emits entities as usual. If a request failed, its
+        error is raised when its result is reached.
+
+        Args:
+            urls: The URLs to be fetched.
+            headers: HTTP request headers to be included.
+            auth: HTTP basic authorization username and password to be included.
+            cache_days: Number of days to retain cached responses for. `None` to disable.
+            method: The HTTP method to use for the requests.
+            encoding: Override the response character encoding.
+            ordered: Yield the results in the order of `urls`, rather than as the
+                requests complete.
+
+        Returns:
+            A generator of each URL and its decoded response body.
+        """
+        limiter = HostLimiter(self.dataset.http.concurrency, self.dataset.http.delay)
+        window = settings.HTTP_FETCH_WORKERS * 2
+        # URL, cache fingerprint, response body, and whether it was cached:
+        pending: deque[tuple[str, str, Future[str | None], bool]] = deque()
+
+        def _fetch(url: str) -> str | None:
+            with limiter.request(url):
+                response = self.fetch_response(
+                    url, headers=headers, auth=auth, method=method
+                )
+            if encoding is not None:
+                response.encoding = encoding
+            return response.text
+
+        def _next() -> tuple[str, str | None]:
+            item = pending[0]
+            if not ordered:
+                wait([f for _, _, f, _ in pending], return_when=FIRST_COMPLETED)
+                item = next(i for i in pending if i[2].done())
+            pending.remove(item)
+            url, fingerprint, future, cached = item
+            text = future.result()
+            # The cache is only used from this thread, which owns its connection:
+            if cache_days is not None and not cached and text is not None:
+                self.cache.set(fingerprint, text)
+            return url, text
+
+        with ThreadPoolExecutor(max_workers=settings.HTTP_FETCH_WORKERS) as executor:
+            try:
+                for url in urls:
+                    fingerprint = request_hash(
+                        url, auth=auth, method=method, encoding=encoding
+                    )
+                    text = None
+                    if cache_days is not None:
+                        text = self.cache.get(fingerprint, max_age=cache_days)
+                    if text is not None:
+                        self.log.debug(
+                            "HTTP cache hit", url=url, fingerprint=fingerprint
+                        )
+                        future: Future[str | None] = Future()
+                        future.set_result(text)
+                        pending.append((url, fingerprint, future, True))
+                    else:
+                        run = contextvars.copy_context().run
+                        future = executor.submit(run, _fetch, url)
+                        pending.append((url, fingerprint, future, False))
+                    while len(pending) > window:
+                        yield _next()
+                while len(pending):
+                    yield _next()
+            finally:
+                for _, _, future, _ in pending:
+                    future.cancel()
+
     def fetch_json(
         self,
         url: str,
@@ -644,6 +837,8 @@ class Context:
         """
         if entity.id is None:
             raise ValueError("Entity has no ID: %r", entity)
+        if self._skipped:
+            raise RuntimeError("Cannot emit entities after skipping the crawl")
         if not entity.has_statements:
             self.log.error("Entity has no properties", entity_id=entity.id)
             return
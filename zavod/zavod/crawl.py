@@ -7,6 +7,7 @@ from zavod.context import Context, ContextStats
 from zavod.exc import RunFailedException
 from zavod.archive import dataset_data_path
 from zavod.runtime.loader import load_entry_point
+from zavod.runtime.sources import hash_code
 from zavod.runner.enrich import enrich
 from zavod.reset import reset_caches
 
@@ -32,9 +33,12 @@ def crawl_dataset(dataset: Dataset, dry_run: bool = False) -> ContextStats:
             version=context.version.id,
         )
         entry_point = load_entry_point(dataset)
+        context.sources.code = hash_code(dataset, entry_point)
         entry_point(context)
         context.flush()
         context.finalize_statements()
+        if not dry_run:
+            context.sources.save(context.issues.all())
         context.log.info(
             "Run completed",
             entities=context.stats.entities,
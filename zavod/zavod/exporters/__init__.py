@@ -1,9 +1,17 @@
+import shutil
+from pathlib import Path
+from typing import Any, NamedTuple
+from collections.abc import Iterable
+
+from zavod import settings
+from zavod.archive import ISSUES_LOG, dataset_state_path
 from zavod.exporters.consolidate import consolidate_entity
 from zavod.exc import RunFailedException
 from zavod.logs import get_logger
-from zavod.store import View
+from zavod.store import Store, View, iter_range_entities
 from zavod.context import Context
 from zavod.meta import Dataset
+from zavod.entity import Entity
 from zavod.exporters.common import Exporter
 from zavod.exporters.ftm import FtMExporter
 from zavod.exporters.nested import NestedTargetsJSONExporter
@@ -11,14 +19,18 @@ from zavod.exporters.names import NamesExporter
 from zavod.exporters.simplecsv import SimpleCSVExporter
 from zavod.exporters.senzing import SenzingExporter
 from zavod.exporters.statistics import StatisticsExporter
+from zavod.runtime.issues import DatasetIssues
 from zavod.runtime.statistics import Statistics
+from zavod.runtime.workers import dump_pickle, load_pickle, worker_pool
 from zavod.validators import get_validators
+from zavod.validators.common import BaseValidator
 from zavod.exporters.securities import SecuritiesExporter
 from zavod.exporters.statements import StatementsCSVExporter
 from zavod.exporters.maritime import MaritimeExporter
-from zavod.exporters.delta import DeltaExporter
+from zavod.exporters.delta import DeltaExporter, StatementDeltaExporter
 
 from zavod.exporters.fragment import ViewFragment
+from zavod.exporters.pipeline import ExportPipeline
 from zavod.exporters.metadata import DatasetVersionResult, write_dataset_index
 from zavod.exporters.metadata import write_catalog, write_delta_index
 
@@ -43,6 +55,7 @@ EXPORTERS: dict[str, type[Exporter]] = {
     MaritimeExporter.FILE_NAME: MaritimeExporter,
     StatementsCSVExporter.FILE_NAME: StatementsCSVExporter,
     DeltaExporter.FILE_NAME: DeltaExporter,
+    StatementDeltaExporter.FILE_NAME: StatementDeltaExporter,
 }
 
 __all__ = ["export_dataset", "write_dataset_index"]
@@ -64,36 +77,196 @@ def get_exporters(context: Context, stats: Statistics) -> list[Exporter]:
     return exporters
 
 
+class ExportShard(NamedTuple):
+    """The outputs of a worker process which exported a range of the entities."""
+
+    path: Path
+    stats: Statistics
+    exporters: dict[str, Any]
+    validators: list[Any]
+
+
+class ShardJob(NamedTuple):
+    """The inputs of a worker process which exports a range of the entities."""
+
+    shard: int
+    start: bytes
+    stop: bytes
+    dataset: Dataset
+    store_dataset: Dataset
+    scope: Dataset
+    external: bool
+    linker_path: Path
+    validate: bool
+    path: Path
+
+
+def _feed_entity(
+    view: View,
+    entity: Entity,
+    stats: Statistics,
+    exporters: list[Exporter],
+    validators: list[BaseValidator],
+    pipeline: ExportPipeline | None,
+) -> None:
+    # feed_unconsolidated must be called before consolidate_entity, because
+    # consolidate_entity mutates the entity in place.
+    for exporter in exporters:
+        exporter.feed_unconsolidated(entity)
+
+    entity = consolidate_entity(view.store.linker, entity)
+    fragment = ViewFragment(view, entity)
+    stats.observe(entity)
+    if pipeline is not None:
+        pipeline.feed(entity)
+    else:
+        for exporter in exporters:
+            exporter.feed(entity, fragment)
+    for validator in validators:
+        validator.feed(entity, fragment)
+
+
+def _feed_entities(
+    view: View,
+    entities: Iterable[Entity],
+    stats: Statistics,
+    exporters: list[Exporter],
+    validators: list[BaseValidator],
+    **kwargs: Any,
+) -> None:
+    pipeline: ExportPipeline | None = None
+    if settings.EXPORT_PIPELINE:
+        pipeline = ExportPipeline(view, exporters, settings.EXPORT_QUEUE_SIZE)
+    try:
+        for idx, entity in enumerate(entities):
+            if idx > 0 and idx % 10000 == 0:
+                log.info(f"Exported {idx} entities...", **kwargs)
+            _feed_entity(view, entity, stats, exporters, validators, pipeline)
+    except BaseException:
+        if pipeline is not None:
+            pipeline.abort()
+        raise
+    if pipeline is not None:
+        pipeline.close()
+
+
+def _export_shard(job: ShardJob) -> ExportShard:
+    """Worker process: feed the entities in a key range of a store snapshot to
+    the exporters and validators, writing their outputs to a shard directory."""
+    index, start, stop, dataset = job.shard, job.start, job.stop, job.dataset
+    validate = job.validate
+    linker = load_pickle(job.linker_path)
+    store = Store(job.store_dataset, linker, job.path / f"{index}.store")
+    shard_view = store.view(job.scope, external=job.external)
+    path = job.path / str(index)
+    path.mkdir(parents=True, exist_ok=True)
+    context = Context(dataset)
+    context.issues = DatasetIssues(dataset, path=path / ISSUES_LOG)
+    context.begin(clear=False)
+    stats = Statistics()
+    try:
+        exporters = get_exporters(context, stats)
+        validators = get_validators(context, stats) if validate else []
+        for exporter in exporters:
+            exporter.setup_shard(path / exporter.FILE_NAME)
+        entities = iter_range_entities(shard_view, start, stop)
+        _feed_entities(
+            shard_view,
+            entities,
+            stats,
+            exporters,
+            validators,
+            scope=dataset.name,
+            shard=index,
+        )
+        states = {e.FILE_NAME: e.finish_shard() for e in exporters}
+        checks = [v.finish_shard() for v in validators]
+    finally:
+        context.close()
+        store.close()
+    return ExportShard(path, stats, states, checks)
+
+
+def _export_shards(
+    context: Context, view: View, validate: bool, workers: int, path: Path
+) -> list[ExportShard]:
+    """Split the store into key ranges and export each of them in a worker process.
+    Each worker reads from its own snapshot of the store."""
+    store = view.store
+    assert isinstance(store, Store), "Sharded export requires a zavod store"
+    ranges = store.key_ranges(workers)
+    shutil.rmtree(path, ignore_errors=True)
+    for index in range(len(ranges)):
+        store.snapshot(path / f"{index}.store")
+    log.info(
+        f"Exporting dataset in {len(ranges)} shards...",
+        scope=context.dataset.name,
+        workers=workers,
+    )
+    linker_path = dump_pickle(store.linker, path / "linker.pickle")
+    jobs = [
+        ShardJob(
+            shard=idx,
+            start=start,
+            stop=stop,
+            dataset=context.dataset,
+            store_dataset=store.dataset,
+            scope=view.scope,
+            external=view.external,
+            linker_path=linker_path,
+            validate=validate,
+            path=path,
+        )
+        for idx, (start, stop) in enumerate(ranges)
+    ]
+    with worker_pool(workers) as executor:
+        return list(executor.map(_export_shard, jobs))
+
+
 def export_data(context: Context, view: View, validate: bool = True) -> None:
     stats = Statistics()
     exporters = get_exporters(context, stats)
     validators = get_validators(context, stats) if validate else []
+    workers = settings.EXPORT_WORKERS
+    unsharded = [e.FILE_NAME for e in exporters if not e.is_sharded()]
+    if workers > 1 and len(unsharded):
+        log.warning("Exporters cannot be sharded, using one worker.", names=unsharded)
+        workers = 1
 
     log.info(
         f"Exporting dataset: {context.dataset.name}...",
         exporters=len(exporters),
         validators=len(validators),
     )
+    shards_path = dataset_state_path(context.dataset.name) / "export-shards"
+    shards: list[ExportShard] = []
+    if workers > 1:
+        shards = _export_shards(context, view, validate, workers, shards_path)
+
     for exporter in exporters:
         exporter.setup()
 
     try:
-        for idx, entity in enumerate(view.entities()):
-            if idx > 0 and idx % 10000 == 0:
-                log.info(f"Exported {idx} entities...", scope=context.dataset.name)
-
-            # feed_unconsolidated must be called before consolidate_entity, because
-            # consolidate_entity mutates the entity in place.
-            for exporter in exporters:
-                exporter.feed_unconsolidated(entity)
-
-            entity = consolidate_entity(view.store.linker, entity)
-            fragment = ViewFragment(view, entity)
-            stats.observe(entity)
-            for exporter in exporters:
-                exporter.feed(entity, fragment)
-            for validator in validators:
-                validator.feed(entity, fragment)
+        if workers > 1:
+            # Shards cover the store in key order, so merging them in sequence
+            # produces the same output as a serial export.
+            for shard in shards:
+                stats.merge(shard.stats)
+                context.issues.merge(shard.path / ISSUES_LOG)
+                for exporter in exporters:
+                    state = shard.exporters[exporter.FILE_NAME]
+                    exporter.merge_shard(shard.path / exporter.FILE_NAME, state)
+                for validator, check in zip(validators, shard.validators):
+                    validator.merge_shard(check)
+        else:
+            _feed_entities(
+                view,
+                view.entities(),
+                stats,
+                exporters,
+                validators,
+                scope=context.dataset.name,
+            )
 
         # Validators finish before exporters: on a validation abort, no exporter
         # may register its artifact for publication.
@@ -109,6 +282,7 @@ def export_data(context: Context, view: View, validate: bool = True) -> None:
     finally:
         for exporter in exporters:
             exporter.close()
+        shutil.rmtree(shards_path, ignore_errors=True)
 
 
 def export_dataset(dataset: Dataset, view: View, validate: bool = True) -> None:
@@ -1,3 +1,7 @@
+import shutil
+from io import TextIOWrapper
+from pathlib import Path
+from typing import IO, Any
 from nomenklatura.store import View
 
 from zavod.meta import Dataset
@@ -14,6 +18,9 @@ class Exporter:
     FILE_NAME = ""
     TITLE = ""
     MIME_TYPE = "text/plain"
+    # Whether the exporter can be fed a shard of the entities in a worker process.
+    # Exporters which set it must implement `finish_shard` and `merge_shard`.
+    SHARDED = False
 
     def __init__(self, context: Context, stats: Statistics):
         self.context = context
@@ -22,6 +29,16 @@ class Exporter:
         self.resource_name = f"{self.FILE_NAME}"
         self.path = context.get_resource_path(self.resource_name)
 
+    @classmethod
+    def is_sharded(cls) -> bool:
+        """Whether the exporter can be sharded: it sets `SHARDED` and implements
+        the methods to finish and merge a shard."""
+        return (
+            cls.SHARDED
+            and cls.finish_shard is not Exporter.finish_shard
+            and cls.merge_shard is not Exporter.merge_shard
+        )
+
     def setup(self) -> None:
         pass
 
@@ -35,6 +52,23 @@ class Exporter:
         """Release resources held by the exporter."""
         pass
 
+    def setup_shard(self, path: Path) -> None:
+        """Prepare the exporter to be fed a shard of the entities in a worker
+        process, writing its output to the given path."""
+        self.path = path
+        self.setup()
+
+    def finish_shard(self) -> Any:
+        """Close the output of a shard and return any state that `merge_shard`
+        needs to combine it with the other shards. Required if `SHARDED` is set."""
+        raise NotImplementedError()
+
+    def merge_shard(self, path: Path, state: Any) -> None:
+        """Combine the output of a shard into this exporter, after `setup` and
+        before `finish`. Shards are merged in the order of their entity keys.
+        Required if `SHARDED` is set."""
+        raise NotImplementedError()
+
     def finish(self, view: ExportView) -> None:
         try:
             resource = self.context.export_resource(
@@ -53,3 +87,14 @@ class Exporter:
                 path=self.path,
             )
             return
+
+
+def append_shard(fh: IO[Any], path: Path, skip_lines: int = 0) -> None:
+    """Append the contents of a shard output file to an open output file, skipping
+    the header lines which each shard writes."""
+    fh.flush()
+    target = fh.buffer if isinstance(fh, TextIOWrapper) else fh
+    with open(path, "rb") as src:
+        for _ in range(skip_lines):
+            src.readline()
+        shutil.copyfileobj(src, target)
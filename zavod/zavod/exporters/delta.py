@@ -1,10 +1,13 @@
-from typing import Any
+import orjson
+from pathlib import Path
+from typing import Any, TextIO
 from collections.abc import Generator
 from zavod.entity import Entity
-from zavod.archive import DELTA_EXPORT_FILE
+from zavod.archive import DELTA_EXPORT_FILE, STATEMENTS_DELTA_FILE
 from zavod.exporters.common import Exporter, ExportView
 from zavod.exporters.consolidate import consolidate_entity
-from zavod.runtime.delta import HashDelta
+from zavod.runtime.delta import HashDelta, StatementDelta
+from zavod.runtime.delta import get_hash_algorithms, hash_entity
 from zavod.util import write_json
 
 
@@ -12,9 +15,11 @@ class DeltaExporter(Exporter):
     TITLE = "Delta files"
     FILE_NAME = DELTA_EXPORT_FILE
     MIME_TYPE = "application/json"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
+        self.shard_fh: TextIO | None = None
         self.delta = HashDelta(self.dataset)
         self.delta.backfill()
         self.counts = {
@@ -24,8 +29,32 @@ class DeltaExporter(Exporter):
         }
 
     def feed(self, entity: Entity, view: ExportView) -> None:
+        if self.shard_fh is not None:
+            if entity.id is not None:
+                algorithm, compare = self.algorithms
+                entity_hash = hash_entity(entity, algorithm)
+                compat_hash = hash_entity(entity, compare) if compare else ""
+                self.shard_fh.write(f"{entity.id}\t{entity_hash}\t{compat_hash}\n")
+            return
         self.delta.feed(entity)
 
+    def setup_shard(self, path: Path) -> None:
+        # Shards only compute the entity hashes, which are then recorded in the
+        # delta state by the parent process:
+        self.path = path
+        self.shard_fh = open(path, "w")
+        self.algorithms = get_hash_algorithms(self.dataset)
+
+    def finish_shard(self) -> None:
+        if self.shard_fh is not None:
+            self.shard_fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        with open(path) as fh:
+            for line in fh:
+                entity_id, entity_hash, compat_hash = line.rstrip("\n").split("\t")
+                self.delta.add(entity_id, entity_hash, compat_hash or None)
+
     def generate(self, view: ExportView) -> Generator[Any, None, None]:
         for op, entity_id in self.delta.generate():
             if op == "DEL":
@@ -56,3 +85,55 @@ class DeltaExporter(Exporter):
         )
 
         super().finish(view)
+
+
+class StatementDeltaExporter(Exporter):
+    """Export the statements added and removed since the previous version of the
+    dataset, computed from the previous and current `statements.pack`. Consumers can
+    apply these instead of replacing every modified entity in full."""
+
+    TITLE = "Statement delta file"
+    FILE_NAME = STATEMENTS_DELTA_FILE
+    MIME_TYPE = "application/json"
+    SHARDED = True
+
+    def feed(self, entity: Entity, view: ExportView) -> None:
+        pass
+
+    def setup_shard(self, path: Path) -> None:
+        pass
+
+    def finish_shard(self) -> None:
+        pass
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        pass
+
+    def finish(self, view: ExportView) -> None:
+        if self.dataset.is_collection:
+            self.context.log.warning("Statement deltas are only made for sources.")
+            return
+        counts = {"ADD": 0, "DEL": 0}
+        delta = StatementDelta(self.dataset)
+        try:
+            with open(self.path, "wb") as fh:
+                for op, stmt_id, data in delta.generate():
+                    counts[op] += 1
+                    record: dict[str, Any] = {"op": op, "id": stmt_id}
+                    if data is not None:
+                        # The statement is already serialised by the delta:
+                        record["statement"] = orjson.Fragment(data)
+                    write_json(record, fh)
+        except FileNotFoundError as exc:
+            self.context.log.warning(f"Cannot compute statement delta: {exc}")
+            self.path.unlink(missing_ok=True)
+            return
+        finally:
+            delta.close()
+        self.context.log.info(
+            "Statement delta export complete",
+            version=str(self.context.version),
+            added=counts["ADD"],
+            deleted=counts["DEL"],
+        )
+        super().finish(view)
@@ -1,13 +1,15 @@
+from pathlib import Path
 from followthemoney.cli.util import write_entity
 
 from zavod.entity import Entity
-from zavod.exporters.common import Exporter, ExportView
+from zavod.exporters.common import Exporter, ExportView, append_shard
 
 
 class FtMExporter(Exporter):
     TITLE = "FollowTheMoney entities"
     FILE_NAME = "entities.ftm.json"
     MIME_TYPE = "application/json+ftm"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
@@ -16,6 +18,12 @@ class FtMExporter(Exporter):
     def feed(self, entity: Entity, view: ExportView) -> None:
         write_entity(self.fh, entity)
 
+    def finish_shard(self) -> None:
+        self.fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        append_shard(self.fh, path)
+
     def finish(self, view: ExportView) -> None:
         self.fh.close()
         super().finish(view)
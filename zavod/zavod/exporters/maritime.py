@@ -1,4 +1,5 @@
 import csv
+from pathlib import Path
 from collections.abc import Iterable
 from followthemoney import registry
 
@@ -6,7 +7,7 @@ from normality import squash_spaces
 from zavod.entity import Entity
 from zavod.logs import get_logger
 from zavod.runtime.urls import make_entity_url
-from zavod.exporters.common import Exporter, ExportView
+from zavod.exporters.common import Exporter, ExportView, append_shard
 
 COLUMNS = [
     "type",
@@ -42,6 +43,7 @@ class MaritimeExporter(Exporter):
     TITLE = "Maritime-centric tabular format"
     FILE_NAME = "maritime.csv"
     MIME_TYPE = "text/csv"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
@@ -93,6 +95,15 @@ class MaritimeExporter(Exporter):
             ]
             self.csv.writerow(row)
 
+    def finish_shard(self) -> tuple[int, int]:
+        self.fh.close()
+        return (self._count_vessels, self._count_orgs)
+
+    def merge_shard(self, path: Path, state: tuple[int, int]) -> None:
+        append_shard(self.fh, path, skip_lines=1)
+        self._count_vessels += state[0]
+        self._count_orgs += state[1]
+
     def finish(self, view: ExportView) -> None:
         self.fh.close()
         super().finish(view)
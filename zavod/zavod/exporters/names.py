@@ -1,3 +1,4 @@
+from pathlib import Path
 from normality import squash_spaces
 from followthemoney import registry
 
@@ -9,20 +10,33 @@ class NamesExporter(Exporter):
     TITLE = "Target names text file"
     FILE_NAME = "names.txt"
     MIME_TYPE = "text/plain"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
         self.fh = open(self.path, "w")
         self.seen_hashes: set[int] = set()
 
+    def _write_name(self, name: str) -> None:
+        key = hash(name.lower())
+        if len(name) > 3 and key not in self.seen_hashes:
+            self.seen_hashes.add(key)
+            self.fh.write(f"{name}\n")
+
     def feed(self, entity: Entity, view: ExportView) -> None:
         for name in entity.get_type_values(registry.name):
             name_collapsed = squash_spaces(name)
             if len(name_collapsed) > 0:
-                key = hash(name_collapsed.lower())
-                if len(name_collapsed) > 3 and key not in self.seen_hashes:
-                    self.seen_hashes.add(key)
-                    self.fh.write(f"{name_collapsed}\n")
+                self._write_name(name_collapsed)
+
+    def finish_shard(self) -> None:
+        self.fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        # Names are de-duplicated within each shard, but not across them:
+        with open(path) as fh:
+            for line in fh:
+                self._write_name(line.rstrip("\n"))
 
     def finish(self, view: ExportView) -> None:
         self.fh.close()
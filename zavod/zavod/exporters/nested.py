@@ -1,4 +1,6 @@
-from zavod.exporters.common import Exporter, ExportView
+from pathlib import Path
+
+from zavod.exporters.common import Exporter, ExportView, append_shard
 from zavod.util import write_json
 from zavod.entity import Entity
 
@@ -7,6 +9,7 @@ class NestedTargetsJSONExporter(Exporter):
     TITLE = "Targets as nested JSON"
     FILE_NAME = "targets.nested.json"
     MIME_TYPE = "application/json"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
@@ -17,6 +20,12 @@ class NestedTargetsJSONExporter(Exporter):
             data = entity.to_nested_dict(view)
             write_json(data, self.fh)
 
+    def finish_shard(self) -> None:
+        self.fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        append_shard(self.fh, path)
+
     def finish(self, view: ExportView) -> None:
         self.fh.close()
         super().finish(view)
@@ -0,0 +1,85 @@
+from queue import Queue
+from threading import Thread
+
+from zavod.entity import Entity
+from zavod.exc import RunFailedException
+from zavod.logs import get_logger
+from zavod.store import View
+from zavod.exporters.common import Exporter
+from zavod.exporters.fragment import ViewFragment
+
+log = get_logger(__name__)
+
+
+class ExporterWorker(Thread):
+    """A thread which feeds the entities placed on its queue to one exporter."""
+
+    def __init__(self, exporter: Exporter, view: View, size: int) -> None:
+        super().__init__(name=f"export-{exporter.FILE_NAME}", daemon=True)
+        self.exporter = exporter
+        self.view = view
+        self.queue: Queue[Entity | None] = Queue(maxsize=size)
+        self.error: BaseException | None = None
+
+    def run(self) -> None:
+        while True:
+            entity = self.queue.get()
+            if entity is None:
+                return
+            if self.error is not None:
+                # Keep draining the queue so that the traversal never blocks
+                # on a failed exporter:
+                continue
+            try:
+                # Each worker uses its own fragment, since the fragment caches
+                # are not safe to share between threads:
+                fragment = ViewFragment(self.view, entity)
+                self.exporter.feed(entity, fragment)
+            except BaseException as exc:
+                self.error = exc
+
+
+class ExportPipeline:
+    """Feed consolidated entities to the exporters via bounded per-exporter queues,
+    each consumed by a worker thread. This lets slow exporters (e.g. the nested
+    JSON and Senzing exports, which walk the adjacent entities in the store) run
+    concurrently with the traversal and consolidation of the next entities.
+
+    When a queue is full, the traversal blocks until the exporter catches up. An
+    error in any exporter is raised as a `RunFailedException` on the next `feed`
+    or on `close`. Exporters must not modify the entities they are fed, since
+    they are shared between the worker threads."""
+
+    def __init__(self, view: View, exporters: list[Exporter], size: int) -> None:
+        self.workers = [ExporterWorker(e, view, size) for e in exporters]
+        for worker in self.workers:
+            worker.start()
+
+    def check(self) -> None:
+        for worker in self.workers:
+            if worker.error is not None:
+                name = worker.exporter.FILE_NAME
+                log.error(f"Exporter failed: {name}", error=str(worker.error))
+                raise RunFailedException(f"Exporter failed: {name}") from worker.error
+
+    def feed(self, entity: Entity) -> None:
+        self.check()
+        for worker in self.workers:
+            worker.queue.put(entity)
+
+    def close(self) -> None:
+        """Wait for the exporters to consume their queues and stop the workers."""
+        for worker in self.workers:
+            worker.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.check()
+
+    def abort(self) -> None:
+        """Stop the workers after the traversal failed, discarding queued entities."""
+        for worker in self.workers:
+            if worker.error is None:
+                worker.error = RunFailedException("Export aborted")
+            worker.queue.put(None)
+        for worker in self.workers:
+            worker.join()
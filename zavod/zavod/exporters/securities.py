@@ -31,6 +31,7 @@ securities universe.
 """
 
 import csv
+from pathlib import Path
 from collections.abc import Iterable
 from normality import squash_spaces
 from followthemoney import registry
@@ -39,7 +40,7 @@ from rigour.boolean import bool_text
 from zavod.entity import Entity
 from zavod.logs import get_logger
 from zavod.runtime.urls import make_entity_url
-from zavod.exporters.common import Exporter, ExportView
+from zavod.exporters.common import Exporter, ExportView, append_shard
 
 COLUMNS = [
     "caption",
@@ -83,6 +84,7 @@ class SecuritiesExporter(Exporter):
     TITLE = "Security-centric tabular format"
     FILE_NAME = "securities.csv"
     MIME_TYPE = "text/csv"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
@@ -143,6 +145,16 @@ class SecuritiesExporter(Exporter):
         ]
         self.csv.writerow(row)
 
+    def finish_shard(self) -> tuple[int, int, int]:
+        self.fh.close()
+        return (self._count_entities, self._count_leis, self._count_isins)
+
+    def merge_shard(self, path: Path, state: tuple[int, int, int]) -> None:
+        append_shard(self.fh, path, skip_lines=1)
+        self._count_entities += state[0]
+        self._count_leis += state[1]
+        self._count_isins += state[2]
+
     def finish(self, view: ExportView) -> None:
         self.fh.close()
         super().finish(view)
@@ -6,6 +6,7 @@
 # nomenklatura resolver file and then used to generate integrated FtM entities.
 
 import re
+from pathlib import Path
 from itertools import product
 from pprint import pprint  # noqa
 from typing import Any
@@ -14,7 +15,7 @@ from followthemoney import registry
 from rigour.ids.wikidata import is_qid
 
 from zavod.entity import Entity
-from zavod.exporters.common import Exporter, ExportView
+from zavod.exporters.common import Exporter, ExportView, append_shard
 from zavod.runtime.urls import make_entity_url
 from zavod.util import write_json
 
@@ -66,6 +67,7 @@ class SenzingExporter(Exporter):
     TITLE = "Senzing entity format"
     FILE_NAME = "senzing.json"
     MIME_TYPE = "application/json+senzing"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
@@ -268,6 +270,12 @@ class SenzingExporter(Exporter):
         # pprint(record)
         write_json(record, self.fh)
 
+    def finish_shard(self) -> None:
+        self.fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        append_shard(self.fh, path)
+
     def finish(self, view: ExportView) -> None:
         self.fh.close()
         super().finish(view)
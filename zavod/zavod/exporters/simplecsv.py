@@ -1,18 +1,20 @@
 import io
 import csv
+from pathlib import Path
 from collections.abc import Iterable
 from followthemoney import registry
 from followthemoney.util import join_text
 
 from zavod.entity import Entity
 from zavod.meta import get_catalog
-from zavod.exporters.common import Exporter, ExportView
+from zavod.exporters.common import Exporter, ExportView, append_shard
 
 
 class SimpleCSVExporter(Exporter):
     TITLE = "Targets as simplified CSV"
     FILE_NAME = "targets.simple.csv"
     MIME_TYPE = "text/csv"
+    SHARDED = True
 
     HEADERS = [
         "id",
@@ -110,6 +112,12 @@ class SimpleCSVExporter(Exporter):
         ]
         self.writer.writerow(row)
 
+    def finish_shard(self) -> None:
+        self.fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        append_shard(self.fh, path, skip_lines=1)
+
     def finish(self, view: ExportView) -> None:
         self.fh.close()
         super().finish(view)
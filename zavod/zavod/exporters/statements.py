@@ -1,15 +1,17 @@
+from pathlib import Path
 from normality.encoding import DEFAULT_ENCODING
 from followthemoney.statement.serialize import CSVStatementWriter
 from followthemoney.statement import Statement
 
 from zavod.entity import Entity
-from zavod.exporters.common import Exporter, ExportView
+from zavod.exporters.common import Exporter, ExportView, append_shard
 
 
 class StatementsCSVExporter(Exporter):
     TITLE = "Statement-based granular CSV"
     FILE_NAME = "statements.csv"
     MIME_TYPE = "text/csv+ftm-statements"
+    SHARDED = True
 
     def setup(self) -> None:
         super().setup()
@@ -25,6 +27,13 @@ class StatementsCSVExporter(Exporter):
                 continue
             self.writer.write(stmt)
 
+    def finish_shard(self) -> None:
+        self.writer.close()
+        self.fh.close()
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        append_shard(self.fh, path, skip_lines=1)
+
     def finish(self, view: ExportView) -> None:
         self.writer.close()
         super().finish(view)
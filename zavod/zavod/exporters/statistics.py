@@ -1,3 +1,5 @@
+from pathlib import Path
+
 from zavod.entity import Entity
 from zavod.archive import STATISTICS_FILE
 from zavod.exporters.common import Exporter, ExportView
@@ -13,10 +15,21 @@ class StatisticsExporter(Exporter):
     TITLE = "Dataset statistics"
     FILE_NAME = STATISTICS_FILE
     MIME_TYPE = "application/json"
+    SHARDED = True
 
     def feed(self, entity: Entity, view: ExportView) -> None:
         pass
 
+    def setup_shard(self, path: Path) -> None:
+        pass
+
+    def finish_shard(self) -> None:
+        pass
+
+    def merge_shard(self, path: Path, state: None) -> None:
+        # The statistics of each shard are merged by the export runner.
+        pass
+
     def finish(self, view: ExportView) -> None:
         with open(self.path, "wb") as fh:
             write_json(self.stats.as_dict(), fh)
@@ -0,0 +1,412 @@
+"""
+A compact, read-only projection of the entity graph in a store view.
+
+Graph rules (e.g. topic propagation in the analyzers) usually only need to know
+the schema and topics of each entity and which entities are linked to which. Doing
+that via `View.get_adjacent` assembles full entities for every edge and neighbour
+out of LevelDB. Instead, a `GraphProjection` is built by streaming the view once:
+
+- every entity, and every entity ID referenced by one, becomes an integer node,
+  which has a schema code (`NO_SCHEMA` for IDs not in the view) and a bitset of
+  its topics;
+- every edge entity (e.g. `Ownership`) becomes a directed edge from its source
+  to its target node, and every other entity-typed property value becomes an
+  edge from the referencing entity to the referenced one. Each edge records the
+  entity which defines it, the property which points at its target, and whether
+  that entity has an `endDate`.
+
+The nodes and edges are stored in NumPy arrays, with the edges indexed in a
+compressed sparse row (CSR) layout in both directions, so that masks and
+reachability can be computed vectorised over the whole graph.
+
+`project_graph` caches the projection of a `zavod.store.Store` view on disk,
+keyed by the linker and leaf versions the store was synced from.
+"""
+
+import math
+from array import array
+from hashlib import sha1
+from pathlib import Path
+from collections.abc import Iterable
+
+import numpy as np
+import orjson
+from numpy.typing import NDArray
+from followthemoney import model, registry
+from nomenklatura.store import View as BaseView
+
+from zavod.archive import dataset_state_path
+from zavod.entity import Entity
+from zavod.logs import get_logger
+from zavod.meta import Dataset
+from zavod.store import LEAF_PREFIX, LINKER_KEY, Store
+
+log = get_logger(__name__)
+View = BaseView[Dataset, Entity]
+
+# Schema code of nodes which are referenced, but not in the view:
+NO_SCHEMA = -1
+# Bump this when changing the layout of the cached projection:
+CACHE_FORMAT = 1
+CACHE_DIR = "graph"
+Mask = NDArray[np.bool_]
+Nodes = NDArray[np.int64]
+
+
+class GraphBuilder:
+    """Collect the nodes and edges of a graph projection from a stream of entities.
+
+    Topic statements from the datasets in `exclude` are ignored, e.g. so that an
+    analyzer does not see the topics it emitted itself."""
+
+    def __init__(self, exclude: Iterable[str] = ()) -> None:
+        self.exclude = set(exclude)
+        self.nodes: dict[str, int] = {}
+        self.schemata: dict[str, int] = {}
+        self.props: dict[str, int] = {}
+        self.topics: dict[str, int] = {}
+        self.node_schema = array("h")
+        self.node_topics: list[int] = []
+        self.edge_source = array("q")
+        self.edge_target = array("q")
+        self.edge_entity = array("q")
+        self.edge_prop = array("h")
+        self.edge_ended = array("b")
+
+    def node(self, entity_id: str) -> int:
+        node = self.nodes.get(entity_id)
+        if node is None:
+            node = self.nodes[entity_id] = len(self.node_schema)
+            self.node_schema.append(NO_SCHEMA)
+            self.node_topics.append(0)
+        return node
+
+    def _code(self, table: dict[str, int], name: str) -> int:
+        code = table.get(name)
+        if code is None:
+            code = table[name] = len(table)
+        return code
+
+    def _edge(
+        self, source: int, target: str, entity: int, prop: int, ended: bool
+    ) -> None:
+        self.edge_source.append(source)
+        self.edge_target.append(self.node(target))
+        self.edge_entity.append(entity)
+        self.edge_prop.append(prop)
+        self.edge_ended.append(ended)
+
+    def add(self, entity: Entity) -> None:
+        if entity.id is None:
+            return
+        node = self.node(entity.id)
+        schema = entity.schema
+        self.node_schema[node] = self._code(self.schemata, schema.name)
+        bits = 0
+        for topic_prop in entity.iterprops():
+            if topic_prop.type != registry.topic:
+                continue
+            for stmt in entity.get_statements(topic_prop):
+                if stmt.dataset not in self.exclude:
+                    bits |= 1 << self._code(self.topics, stmt.value)
+        self.node_topics[node] = bits
+        ended = len(entity.get("endDate", quiet=True)) > 0
+        source_prop, target_prop = schema.source_prop, schema.target_prop
+        is_edge = schema.edge and source_prop is not None and target_prop is not None
+        if is_edge and source_prop is not None and target_prop is not None:
+            prop = self._code(self.props, target_prop.qname)
+            for source in entity.get(source_prop):
+                for target in entity.get(target_prop):
+                    self._edge(self.node(source), target, node, prop, ended)
+        for prop_, value in entity.itervalues():
+            if prop_.type != registry.entity:
+                continue
+            if is_edge and prop_ in (source_prop, target_prop):
+                continue
+            self._edge(node, value, node, self._code(self.props, prop_.qname), ended)
+
+    def build(self) -> "GraphProjection":
+        words = max(1, math.ceil(len(self.topics) / 64))
+        node_topics = np.zeros((len(self.node_topics), words), dtype=np.uint64)
+        mask = (1 << 64) - 1
+        for word in range(words):
+            shift = word * 64
+            values = [(bits >> shift) & mask for bits in self.node_topics]
+            node_topics[:, word] = np.array(values, dtype=np.uint64)
+        # Copy the arrays, so that the builder can still be added to:
+        return GraphProjection(
+            ids=list(self.nodes.keys()),
+            schemata=list(self.schemata.keys()),
+            props=list(self.props.keys()),
+            topics=list(self.topics.keys()),
+            node_schema=np.frombuffer(self.node_schema, dtype=np.int16).copy(),
+            node_topics=node_topics,
+            edge_source=np.frombuffer(self.edge_source, dtype=np.int64).copy(),
+            edge_target=np.frombuffer(self.edge_target, dtype=np.int64).copy(),
+            edge_entity=np.frombuffer(self.edge_entity, dtype=np.int64).copy(),
+            edge_prop=np.frombuffer(self.edge_prop, dtype=np.int16).copy(),
+            edge_ended=np.frombuffer(self.edge_ended, dtype=np.bool_).copy(),
+        )
+
+
+class GraphProjection:
+    """The nodes and edges of an entity graph, as NumPy arrays. Node and edge
+    indices are positions in these arrays; `ids`, `schemata`, `props` and `topics`
+    map the integer codes back to names."""
+
+    def __init__(
+        self,
+        ids: list[str],
+        schemata: list[str],
+        props: list[str],
+        topics: list[str],
+        node_schema: NDArray[np.int16],
+        node_topics: NDArray[np.uint64],
+        edge_source: NDArray[np.int64],
+        edge_target: NDArray[np.int64],
+        edge_entity: NDArray[np.int64],
+        edge_prop: NDArray[np.int16],
+        edge_ended: NDArray[np.bool_],
+    ) -> None:
+        self.ids = ids
+        self.schemata = schemata
+        self.props = props
+        self.topics = topics
+        self.node_schema = node_schema
+        self.node_topics = node_topics
+        self.edge_source = edge_source
+        self.edge_target = edge_target
+        self.edge_entity = edge_entity
+        self.edge_prop = edge_prop
+        self.edge_ended = edge_ended
+        self._nodes: dict[str, int] | None = None
+        self.out_offsets, self.out_edges = self._index(edge_source)
+        self.in_offsets, self.in_edges = self._index(edge_target)
+
+    def _index(self, nodes: NDArray[np.int64]) -> tuple[Nodes, Nodes]:
+        """Build the CSR index of the edges by their source or target node."""
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(nodes, minlength=len(self)), out=offsets[1:])
+        edges = np.argsort(nodes, kind="stable").astype(np.int64)
+        return offsets, edges
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_source)
+
+    def node(self, entity_id: str) -> int | None:
+        """Get the node index of an entity ID, if it is in the graph."""
+        if self._nodes is None:
+            self._nodes = {id: idx for idx, id in enumerate(self.ids)}
+        return self._nodes.get(entity_id)
+
+    def exists(self) -> Mask:
+        """Mask of the nodes which are entities in the view (rather than only
+        referenced by one)."""
+        exists: Mask = self.node_schema != NO_SCHEMA
+        return exists
+
+    def schema_mask(self, schema: str) -> Mask:
+        """Mask of the nodes whose schema is, or extends, the given schema."""
+        codes: list[int] = []
+        for code, name in enumerate(self.schemata):
+            schema_ = model.get(name)
+            if schema_ is not None and schema_.is_a(schema):
+                codes.append(code)
+        mask: Mask = np.isin(self.node_schema, codes)
+        return mask
+
+    def _topic_bits(self, topics: Iterable[str]) -> NDArray[np.uint64]:
+        bits = np.zeros(self.node_topics.shape[1], dtype=np.uint64)
+        for topic in topics:
+            if topic in self.topics:
+                code = self.topics.index(topic)
+                bits[code // 64] |= np.uint64(1 << (code % 64))
+        return bits
+
+    def topic_mask(self, topics: Iterable[str]) -> Mask:
+        """Mask of the nodes which have any of the given topics."""
+        bits = self._topic_bits(topics)
+        mask: Mask = np.any(self.node_topics & bits, axis=1)
+        return mask
+
+    def get_topics(self, node: int) -> set[str]:
+        """Get the topics of a node."""
+        topics: set[str] = set()
+        for code, topic in enumerate(self.topics):
+            if int(self.node_topics[node, code // 64]) & (1 << (code % 64)):
+                topics.add(topic)
+        return topics
+
+    def edge_mask(
+        self,
+        schema: str | None = None,
+        prop: str | None = None,
+        ended: bool | None = None,
+    ) -> Mask:
+        """Mask of the edges defined by an entity of the given schema, which point
+        at their target via the given property (qualified name), and which have
+        (or have not) ended."""
+        mask: Mask = np.ones(self.edge_count, dtype=np.bool_)
+        if schema is not None:
+            mask &= self.schema_mask(schema)[self.edge_entity]
+        if prop is not None:
+            code = self.props.index(prop) if prop in self.props else NO_SCHEMA
+            mask &= self.edge_prop == code
+        if ended is not None:
+            mask &= self.edge_ended == ended
+        return mask
+
+    def _gather(self, offsets: Nodes, edges: Nodes, nodes: Nodes) -> Nodes:
+        """Get the edges in the CSR ranges of the given nodes."""
+        starts = offsets[nodes]
+        lengths = offsets[nodes + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        found: Nodes = edges[shifts + np.arange(total)]
+        return found
+
+    def out_edges_of(self, node: int) -> Nodes:
+        """Get the indices of the edges from a node."""
+        edges: Nodes = self.out_edges[
+            self.out_offsets[node] : self.out_offsets[node + 1]
+        ]
+        return edges
+
+    def in_edges_of(self, node: int) -> Nodes:
+        """Get the indices of the edges to a node."""
+        edges: Nodes = self.in_edges[self.in_offsets[node] : self.in_offsets[node + 1]]
+        return edges
+
+    def propagate(self, seeds: Mask, edges: Mask, reverse: bool = False) -> Nodes:
+        """Walk the given edges breadth-first from the seed nodes, forward (or in
+        `reverse`), only through nodes which are entities in the view.
+
+        Returns the node from which each node was first reached: seeds are their
+        own parent, and nodes which were not reached have a parent of -1."""
+        parents = np.full(len(self), -1, dtype=np.int64)
+        frontier = np.flatnonzero(seeds & self.exists())
+        parents[frontier] = frontier
+        offsets, index = self.out_offsets, self.out_edges
+        starts, ends = self.edge_source, self.edge_target
+        if reverse:
+            offsets, index = self.in_offsets, self.in_edges
+            starts, ends = self.edge_target, self.edge_source
+        exists = self.exists()
+        while len(frontier):
+            found = self._gather(offsets, index, frontier)
+            found = found[edges[found]]
+            targets = ends[found]
+            keep = (parents[targets] < 0) & exists[targets]
+            found, targets = found[keep], targets[keep]
+            targets, first = np.unique(targets, return_index=True)
+            parents[targets] = starts[found[first]]
+            frontier = targets
+        return parents
+
+    def save(self, path: Path) -> None:
+        tables = {
+            "format": CACHE_FORMAT,
+            "ids": self.ids,
+            "schemata": self.schemata,
+            "props": self.props,
+            "topics": self.topics,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "wb") as fh:
+            np.savez(
+                fh,
+                tables=np.frombuffer(orjson.dumps(tables), dtype=np.uint8),
+                node_schema=self.node_schema,
+                node_topics=self.node_topics,
+                edge_source=self.edge_source,
+                edge_target=self.edge_target,
+                edge_entity=self.edge_entity,
+                edge_prop=self.edge_prop,
+                edge_ended=self.edge_ended,
+            )
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "GraphProjection | None":
+        """Load a saved projection. Returns `None` if it is in an older format."""
+        with np.load(path) as data:
+            tables = orjson.loads(data["tables"].tobytes())
+            if tables.get("format") != CACHE_FORMAT:
+                return None
+            return cls(
+                ids=tables["ids"],
+                schemata=tables["schemata"],
+                props=tables["props"],
+                topics=tables["topics"],
+                node_schema=data["node_schema"],
+                node_topics=data["node_topics"],
+                edge_source=data["edge_source"],
+                edge_target=data["edge_target"],
+                edge_entity=data["edge_entity"],
+                edge_prop=data["edge_prop"],
+                edge_ended=data["edge_ended"],
+            )
+
+
+def _cache_path(view: View, exclude: Iterable[str]) -> Path | None:
+    """Identify the cached projection of a view by the versions of the linker and
+    the leaf datasets its store was synced from."""
+    store = view.store
+    if not isinstance(store, Store):
+        return None
+    digest = sha1(f"{CACHE_FORMAT}:{view.external}".encode())
+    linker_id = store.db.get(LINKER_KEY)
+    if linker_id is None:
+        return None
+    digest.update(linker_id)
+    leaves = 0
+    with store.db.iterator(prefix=LEAF_PREFIX) as it:
+        for key, version in it:
+            digest.update(b"\n" + key + b":" + version)
+            leaves += 1
+    if leaves == 0:
+        return None
+    for name in sorted(view.dataset_names):
+        digest.update(f"\nscope:{name}".encode())
+    for name in sorted(exclude):
+        digest.update(f"\nexclude:{name}".encode())
+    path = dataset_state_path(store.dataset.name) / CACHE_DIR
+    return path / f"{digest.hexdigest()}.npz"
+
+
+def project_graph(
+    view: View, exclude: Iterable[str] = (), cache: bool = True
+) -> GraphProjection:
+    """Build the graph projection of a view, or load it from the cache if the
+    view is of a synced `Store` which has not changed since it was projected."""
+    exclude = list(exclude)
+    path = _cache_path(view, exclude) if cache else None
+    if path is not None and path.exists():
+        projection = GraphProjection.load(path)
+        if projection is not None:
+            log.info("Loaded cached graph projection.", path=path.as_posix())
+            return projection
+    builder = GraphBuilder(exclude=exclude)
+    for idx, entity in enumerate(view.entities()):
+        if idx > 0 and idx % 100_000 == 0:
+            log.info("Projecting graph...", entities=idx)
+        builder.add(entity)
+    projection = builder.build()
+    log.info(
+        "Graph projection is ready.",
+        nodes=len(projection),
+        edges=projection.edge_count,
+    )
+    if path is not None:
+        # Only keep the projection of the current version of the store:
+        for stale in path.parent.glob("*.npz"):
+            stale.unlink()
+        projection.save(path)
+    return projection
@@ -1,4 +1,5 @@
 import mimetypes
+from copy import deepcopy
 from functools import cached_property
 from hashlib import sha1
 from pathlib import Path
@@ -119,9 +120,15 @@ class Dataset(FollowTheMoneyDataset):
         )
         """Which post-crawl validators are enabled for this dataset."""
 
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Pickle the metadata, rather than the state derived from it (e.g. the
+        # parsed lookups), so datasets can be passed to worker processes:
+        return (_restore_dataset, (self._data, self.base_path, self.children))
+
     @cached_property
     def lookups(self) -> dict[str, Lookup]:
-        config = self._data.get("lookups", {})
+        # Parsing the lookups consumes their options, keep the metadata intact:
+        config = deepcopy(self._data.get("lookups", {}))
         return get_lookups(config, debug=settings.DEBUG)
 
     @property
@@ -204,3 +211,12 @@ class Dataset(FollowTheMoneyDataset):
         if self.model.entry_point is not None:
             data["entry_point"] = self.model.entry_point
         return data
+
+
+def _restore_dataset(
+    data: dict[str, Any], base_path: Path | None, children: set[Dataset]
+) -> Dataset:
+    dataset = Dataset(data)
+    dataset.base_path = base_path
+    dataset.children = children
+    return dataset
@@ -37,3 +37,18 @@ class HTTP:
         )
         self.retry_methods: list[str] = retry_methods
         self.user_agent: str = data.get("user_agent") or USER_AGENT
+        # Concurrent requests to one host made by `Context.fetch_many`, and the
+        # minimum delay in seconds between the starts of two of them:
+        self.concurrency: int = int(data.get("concurrency", settings.HTTP_CONCURRENCY))
+        self.delay: float = float(data.get("delay", 0.0))
+        # Connection pools are kept for up to `pool_connections` hosts, each with up
+        # to `pool_size` connections kept alive between requests:
+        self.pool_connections: int = int(data.get("pool_connections", 10))
+        self.pool_size: int = int(data.get("pool_size", max(10, self.concurrency)))
+        # Requests per second sent to each host, with bursts of up to `rate_burst`
+        # requests after an idle period. No limit if unset.
+        rate_limit = data.get("rate_limit")
+        self.rate_limit: float | None = (
+            None if rate_limit is None else float(rate_limit)
+        )
+        self.rate_burst: float = float(data.get("rate_burst", 1.0))
@@ -8,8 +8,10 @@ from zavod.archive import publish_version_history, archive_artifact
 from zavod.archive import invalidate_dataset_urls
 from zavod.archive import INDEX_FILE, CATALOG_FILE
 from zavod.archive import STATEMENTS_FILE, RESOURCES_FILE, STATISTICS_FILE
+from zavod.archive import STATEMENTS_COLUMNS_FILE, TIMESTAMPS_FILE
+from zavod.archive import ENRICH_INDEX_FILE, ENRICH_SUBJECTS_FILE, SOURCES_FILE
 from zavod.archive import VERSIONS_FILE, EXTRA_ARTIFACTS, HASH_FILE
-from zavod.archive import DELTA_EXPORT_FILE, DELTA_INDEX_FILE
+from zavod.archive import DELTA_EXPORT_FILE, DELTA_INDEX_FILE, STATEMENTS_DELTA_FILE
 from zavod.runtime.resources import DatasetResources
 from zavod.runtime.versions import get_latest, set_last_successful_version
 from zavod.exporters import write_dataset_index
@@ -100,6 +102,11 @@ def archive_failure(dataset: Dataset) -> None:
     # issues.json, issues.log, versions.json) instead of unlinking everything
     # else.
     dataset_resource_path(dataset.name, STATEMENTS_FILE).unlink(missing_ok=True)
+    dataset_resource_path(dataset.name, STATEMENTS_COLUMNS_FILE).unlink(missing_ok=True)
+    dataset_resource_path(dataset.name, TIMESTAMPS_FILE).unlink(missing_ok=True)
+    dataset_resource_path(dataset.name, ENRICH_INDEX_FILE).unlink(missing_ok=True)
+    dataset_resource_path(dataset.name, ENRICH_SUBJECTS_FILE).unlink(missing_ok=True)
+    dataset_resource_path(dataset.name, SOURCES_FILE).unlink(missing_ok=True)
     # TODO: The statistics file gets pulled in by write_dataset_index,
     #  so they get published as part of the artifacts anyway.
     #  For a brief discussion of our currently broken failure semantics,
@@ -109,6 +116,7 @@ def archive_failure(dataset: Dataset) -> None:
     dataset_resource_path(dataset.name, CATALOG_FILE).unlink(missing_ok=True)
     dataset_resource_path(dataset.name, RESOURCES_FILE).unlink(missing_ok=True)
     dataset_resource_path(dataset.name, DELTA_EXPORT_FILE).unlink(missing_ok=True)
+    dataset_resource_path(dataset.name, STATEMENTS_DELTA_FILE).unlink(missing_ok=True)
     dataset_resource_path(dataset.name, DELTA_INDEX_FILE).unlink(missing_ok=True)
     dataset_resource_path(dataset.name, HASH_FILE).unlink(missing_ok=True)
 
@@ -0,0 +1,171 @@
+"""
+Run an analyzer function over every entity in a store view.
+
+Analyzers (e.g. `ann_graph_topics`) inspect each entity of a large scope and its
+neighbourhood, and emit patches. With `ZAVOD_ANALYZER_WORKERS` > 1, the entities
+are partitioned into key ranges of the store (see `Store.key_ranges`), and each
+range is analyzed in a worker process which reads from its own snapshot of the
+store (see `zavod.runtime.workers`). The workers buffer the entities they emit to a file; the parent
+process then emits them through its own context, range by range. Since the
+ranges cover the store in key order, the output is the same as that of a serial
+run.
+
+The analyzer function is pickled to be sent to the workers, so it must be defined
+at the top level of a module (or be a `functools.partial` of such a function). It
+must only communicate with the parent via `context.emit` and the issue log: any
+other state it keeps will not be shared between workers.
+"""
+
+import pickle
+import shutil
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+from collections.abc import Callable
+
+from followthemoney import Statement
+
+from zavod import settings
+from zavod.archive import ISSUES_LOG, dataset_state_path
+from zavod.context import Context
+from zavod.entity import Entity
+from zavod.logs import get_logger
+from zavod.meta import Dataset
+from zavod.runtime.issues import DatasetIssues
+from zavod.runtime.workers import dump_pickle, load_pickle, worker_pool
+from zavod.store import Store, View, iter_range_entities
+
+log = get_logger(__name__)
+Analyzer = Callable[[Context, View, Entity], None]
+EMITTED_FILE = "emitted.pickle"
+
+
+class ShardJob(NamedTuple):
+    """The inputs of a worker process which analyzes a range of the entities."""
+
+    shard: int
+    start: bytes
+    stop: bytes
+    dataset: Dataset
+    store_dataset: Dataset
+    scope: Dataset
+    external: bool
+    linker_path: Path
+    analyze: Analyzer
+    path: Path
+
+
+class ShardContext(Context):
+    """The context of an analyzer worker, which buffers the entities emitted by
+    the analyzer to a file, to be emitted by the parent process."""
+
+    def __init__(self, dataset: Dataset, path: Path) -> None:
+        super().__init__(dataset)
+        self.emitted_path = path / EMITTED_FILE
+        self.issues = DatasetIssues(dataset, path=path / ISSUES_LOG)
+        self._emitted: BinaryIO = open(self.emitted_path, "wb")
+
+    def emit(
+        self, entity: Entity, external: bool = False, origin: str | None = None
+    ) -> None:
+        if entity.id is None:
+            raise ValueError("Entity has no ID: %r", entity)
+        # Only the statements are pickled, not the entity and its dataset:
+        record = (list(entity.statements), external, origin)
+        pickle.dump(record, self._emitted, protocol=pickle.HIGHEST_PROTOCOL)
+        self.stats.entities += 1
+
+    def close(self) -> None:
+        self._emitted.close()
+        super().close()
+
+
+def _read_emitted(path: Path) -> list[tuple[list[Statement], bool, str | None]]:
+    records: list[tuple[list[Statement], bool, str | None]] = []
+    with open(path, "rb") as fh:
+        while True:
+            try:
+                records.append(pickle.load(fh))
+            except EOFError:
+                return records
+
+
+def _analyze_shard(job: ShardJob) -> Path:
+    """Worker process: run the analyzer on the entities in a key range of a
+    store snapshot."""
+    linker = load_pickle(job.linker_path)
+    store = Store(job.store_dataset, linker, job.path / f"{job.shard}.store")
+    shard_view = store.view(job.scope, external=job.external)
+    path = job.path / str(job.shard)
+    path.mkdir(parents=True, exist_ok=True)
+    context = ShardContext(job.dataset, path)
+    context.begin(clear=False)
+    try:
+        entities = iter_range_entities(shard_view, job.start, job.stop)
+        for idx, entity in enumerate(entities):
+            if idx > 0 and idx % 10000 == 0:
+                context.log.info(f"Analyzed {idx} entities", shard=job.shard)
+            job.analyze(context, shard_view, entity)
+    finally:
+        context.close()
+        store.close()
+    return path
+
+
+def _analyze_shards(
+    context: Context, view: View, analyze: Analyzer, workers: int
+) -> None:
+    store = view.store
+    assert isinstance(store, Store), "Parallel analysis requires a zavod store"
+    shards_path = dataset_state_path(context.dataset.name) / "analyze-shards"
+    shutil.rmtree(shards_path, ignore_errors=True)
+    ranges = store.key_ranges(workers)
+    for index in range(len(ranges)):
+        store.snapshot(shards_path / f"{index}.store")
+    log.info(
+        f"Analyzing entities in {len(ranges)} shards...",
+        scope=context.dataset.name,
+        workers=workers,
+    )
+    linker_path = dump_pickle(store.linker, shards_path / "linker.pickle")
+    jobs = [
+        ShardJob(
+            shard=idx,
+            start=start,
+            stop=stop,
+            dataset=context.dataset,
+            store_dataset=store.dataset,
+            scope=view.scope,
+            external=view.external,
+            linker_path=linker_path,
+            analyze=analyze,
+            path=shards_path,
+        )
+        for idx, (start, stop) in enumerate(ranges)
+    ]
+    try:
+        with worker_pool(workers) as executor:
+            # Results arrive in range order, so the earlier shards can be emitted
+            # while the later ones are still being analyzed:
+            for path in executor.map(_analyze_shard, jobs):
+                context.issues.merge(path / ISSUES_LOG)
+                for statements, external, origin in _read_emitted(path / EMITTED_FILE):
+                    entity = Entity.from_statements(context.dataset, statements)
+                    context.emit(entity, external=external, origin=origin)
+                shutil.rmtree(path, ignore_errors=True)
+    finally:
+        shutil.rmtree(shards_path, ignore_errors=True)
+
+
+def run_analyzer(
+    context: Context, view: View, analyze: Analyzer, workers: int | None = None
+) -> None:
+    """Call `analyze` for every entity in the view, in `workers` processes (by
+    default, `ZAVOD_ANALYZER_WORKERS`)."""
+    workers = settings.ANALYZER_WORKERS if workers is None else workers
+    if workers > 1 and isinstance(view.store, Store):
+        _analyze_shards(context, view, analyze, workers)
+        return
+    for idx, entity in enumerate(view.entities()):
+        if idx > 0 and idx % 10000 == 0:
+            context.log.info(f"Analyzed {idx} entities")
+        analyze(context, view, entity)
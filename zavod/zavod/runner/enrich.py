@@ -1,18 +1,49 @@
+"""
+Enrichment of a scope of datasets against a remote data source.
+
+Most enrichers spend their time waiting for the responses of the remote API. With
+`concurrency` set in the enricher's config, that many subject entities are queried
+at the same time by a pool of threads. The matches are still saved and emitted by
+the main thread, in the order of the subjects. `rate_limit` caps the number of
+HTTP requests sent per second to each host across all threads, allowing bursts
+of up to `rate_burst` requests (default: `concurrency`) after an idle period. It
+replaces the `http.rate_limit` of the enricher's metadata. The
+expansions of matches confirmed for several subjects are shared between them,
+keeping up to `expand_cache` (default: 1000) of them in memory:
+
+    config:
+      type: nomenklatura.enrich.openfigi:OpenFIGIEnricher
+      concurrency: 4
+      rate_limit: 4
+"""
+
+from collections import deque
+from collections.abc import Generator, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+from typing import Any
+
 from followthemoney import registry
 from followthemoney.helpers import check_person_cutoff
+from nomenklatura.cache import Cache, CacheValue, Value
 from nomenklatura.judgement import Judgement
 from nomenklatura.enrich import Enricher, EnrichmentException, make_enricher
 
 from zavod.meta import Dataset, get_catalog, get_multi_dataset
 from zavod.entity import Entity
 from zavod.context import Context
-from zavod.runner.util import check_publishability, is_analyzer_stub, should_promote
+from zavod.runner.incremental import SubjectLog
+from zavod.runtime.cache import DatasetCache
+from zavod.runtime.http_ import set_rate_limit
+from zavod.runner.util import ExpansionCache, check_publishability
+from zavod.runner.util import is_analyzer_stub, should_promote
 from zavod.store import get_store, View
 
 
 def save_match(
     context: Context,
-    enricher: Enricher[Dataset],
+    expansions: ExpansionCache,
     entity: Entity,
     match: Entity,
     subject_view: View,
@@ -29,7 +60,7 @@ def save_match(
     # Store previously confirmed matches to the database and make them visible:
     if judgement == Judgement.POSITIVE:
         context.log.info(f"Enrich [{entity}]: {match!r}")
-        expanded = [adjacent for adjacent in enricher.expand_wrapped(entity, match)]
+        expanded = expansions.expand(entity, match)
         if not expanded:
             return
 
@@ -48,6 +79,107 @@ def save_match(
             )
 
 
+class SharedCache(Cache):
+    """The cache of an enricher which is queried from several threads. All of them
+    use the same database connection, so every call is passed on to the wrapped
+    `cache` while holding `lock`. None of the state of the cache is copied."""
+
+    def __init__(self, cache: Cache, lock: Lock) -> None:
+        self.cache = cache
+        self.lock = lock
+        self.dataset = cache.dataset
+
+    def get(
+        self,
+        key: str,
+        max_age: int | None = None,
+        min_timestamp: datetime | None = None,
+    ) -> Value | None:
+        with self.lock:
+            return self.cache.get(key, max_age=max_age, min_timestamp=min_timestamp)
+
+    def get_json(self, key: str, max_age: int | None = None) -> Any | None:
+        with self.lock:
+            return self.cache.get_json(key, max_age=max_age)
+
+    def has(self, key: str) -> bool:
+        with self.lock:
+            return self.cache.has(key)
+
+    def set(self, key: str, value: Value) -> None:
+        with self.lock:
+            self.cache.set(key, value)
+
+    def set_json(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.cache.set_json(key, value)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.cache.delete(key)
+
+    def all(self, like: str | None) -> Generator[CacheValue, None, None]:
+        # Read the values up front, so the lock isn't held by a paused generator:
+        with self.lock:
+            values = list(self.cache.all(like))
+        yield from values
+
+    def preload(self, like: str | None = None) -> None:
+        with self.lock:
+            self.cache.preload(like=like)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.cache.clear()
+
+    def flush(self) -> None:
+        if isinstance(self.cache, DatasetCache):
+            with self.lock:
+                self.cache.flush()
+
+    def __repr__(self) -> str:
+        return f"<SharedCache({self.cache!r})>"
+
+    def __hash__(self) -> int:
+        return hash(self.cache)
+
+
+MatchResult = list[Entity] | EnrichmentException
+
+
+def _match(enricher: Enricher[Dataset], entity: Entity) -> MatchResult:
+    try:
+        return list(enricher.match_wrapped(entity))
+    except EnrichmentException as exc:
+        return exc
+
+
+def iter_matches(
+    enricher: Enricher[Dataset], entities: Iterable[Entity], concurrency: int = 1
+) -> Generator[tuple[Entity, MatchResult], None, None]:
+    """Query the enricher for the matches of each entity, using `concurrency`
+    threads. Yields the matches, or the error of the lookup, in the order of
+    `entities`."""
+    if concurrency <= 1:
+        for entity in entities:
+            yield entity, _match(enricher, entity)
+        return
+    pending: deque[tuple[Entity, Future[MatchResult]]] = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for entity in entities:
+                pending.append((entity, executor.submit(_match, enricher, entity)))
+                while len(pending) > concurrency * 2:
+                    subject, future = pending.popleft()
+                    yield subject, future.result()
+            while len(pending):
+                subject, future = pending.popleft()
+                yield subject, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
 def enrich(context: Context) -> None:
     scope = get_multi_dataset(get_catalog(), context.dataset.inputs)
     context.log.info(f"Enriching {scope.name} ({[d.name for d in scope.datasets]})")
@@ -57,26 +189,57 @@ def enrich(context: Context) -> None:
     context.flush()
     store.sync()
     view = store.view(scope, external=True)
-    enricher = make_enricher(
-        context.dataset,
-        context.cache,
-        dict(context.dataset.config),
-        http_session=context.http,
-    )
-    try:
+    config: dict[str, Any] = dict(context.dataset.config)
+    concurrency = int(config.pop("concurrency", 1))
+    rate_limit = config.pop("rate_limit", None)
+    rate_burst = float(config.pop("rate_burst", concurrency))
+    if rate_limit is not None:
+        set_rate_limit(context.http, float(rate_limit), rate_burst)
+    lock = Lock()
+    cache = context.cache if concurrency <= 1 else SharedCache(context.cache, lock)
+    expand_cache = int(config.pop("expand_cache", 1000))
+    enricher = make_enricher(context.dataset, cache, config, http_session=context.http)
+    # Remote enrichers cache their API responses, so expansions are only shared
+    # between the subjects of this run:
+    expansions = ExpansionCache(enricher, size=expand_cache)
+    subjects: SubjectLog | None = None
+    previous: dict[str, Entity] = {}
+    if context.dataset.config.get("incremental", False):
+        subjects = SubjectLog(context.dataset)
+        previous = subjects.load_previous_matches()
+
+    def _subjects() -> Generator[Entity, None, None]:
         for entity_idx, entity in enumerate(view.entities()):
             if entity_idx > 0 and entity_idx % 100 == 0:
-                context.flush()
+                with lock:
+                    context.flush()
             if entity_idx > 0 and entity_idx % 10000 == 0:
                 context.log.info(f"Enriched {entity_idx} entities...")
             if is_analyzer_stub(entity):
                 continue
+            if subjects is not None:
+                cached = subjects.get_matches(entity)
+                if cached is not None and all(id in previous for id in cached):
+                    for match_id in cached:
+                        save_match(
+                            context, expansions, entity, previous[match_id], view
+                        )
+                    subjects.keep(entity)
+                    continue
             context.log.debug(f"Enrich query: {entity!r}")
-            try:
-                for match in enricher.match_wrapped(entity):
-                    save_match(context, enricher, entity, match, view)
-            except EnrichmentException as exc:
-                context.log.error(f"Enrichment error {entity!r}: {str(exc)}")
+            yield entity
+
+    try:
+        for entity, result in iter_matches(enricher, _subjects(), concurrency):
+            if isinstance(result, EnrichmentException):
+                context.log.error(f"Enrichment error {entity!r}: {str(result)}")
+                continue
+            for match in result:
+                save_match(context, expansions, entity, match, view)
+            if subjects is not None:
+                subjects.record(entity, result)
         context.log.info("Enrichment process complete.")
     finally:
         enricher.close()
+        if subjects is not None:
+            subjects.close()
@@ -0,0 +1,178 @@
+"""
+A persistent blocking index of the target dataset of a local enricher.
+
+Building the index tokenizes every entity of the target dataset, which for large
+targets takes longer than the enrichment itself. The index therefore records the
+version of the target dataset it was built from, is archived as an artifact of
+the enricher dataset, and is backfilled from the archive on the next run. When
+the target dataset has been re-published since, the entities changed in between
+are taken from the target's delta files (`entities.delta.json`) and only those are
+re-tokenized. If a delta file is missing, the index is rebuilt from scratch. So is
+an index built with a different linker, since the deltas don't cover entities
+whose canonical IDs have changed.
+"""
+
+import shutil
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import orjson
+from followthemoney import model
+from followthemoney.dataset import Version
+from nomenklatura.blocker.index import Index
+
+from zavod.archive import DELTA_EXPORT_FILE, ENRICH_INDEX_FILE
+from zavod.archive import dataset_resource_path, get_dataset_artifact
+from zavod.archive import get_artifact_object, iter_dataset_versions
+from zavod.entity import Entity
+from zavod.logs import get_logger
+from zavod.meta import Dataset
+from zavod.runtime.versions import get_latest
+from zavod.store import LINKER_KEY, Store, View, get_entities, linker_fingerprint
+
+log = get_logger(__name__)
+INDEX_FILE = "index.duckdb"
+META_TABLE = "zavod_index_meta"
+# Bumped when the tokenization of entities changes, to force a rebuild:
+INDEX_FORMAT = "1"
+# Tables derived from the entries of the index, which are stale once they change:
+DERIVED_TABLES = ("token_schema_counts", "token_stats", "stopwords", "entries_filtered")
+ARCHIVED_TABLES = {"entries", "boosts", "schemata", "term_frequencies_all", META_TABLE}
+# Number of changed entities fetched from the target store at a time:
+FETCH_BATCH = 1_000
+
+
+def get_changed_ids(target: Dataset, since: str, until: Version) -> set[str] | None:
+    """Collect the IDs of the entities which were added, modified or deleted in the
+    versions of the target dataset after `since`, up to and including `until`.
+    Returns None if the delta of one of those versions isn't available."""
+    changed: set[str] = set()
+    # The delta of `until` itself must be archived, and so must all those since:
+    seen_until = False
+    for version in iter_dataset_versions(target.name):
+        if version.id == since:
+            return changed if seen_until else None
+        if version.id > until.id:
+            continue
+        seen_until = True
+        obj = get_artifact_object(target.name, DELTA_EXPORT_FILE, version.id)
+        if obj is None:
+            log.info("No delta for target version.", version=version.id)
+            return None
+        with obj.open() as fh:
+            for line in fh:
+                op = orjson.loads(line)
+                changed.add(op["entity"]["id"])
+    return None
+
+
+class EnrichIndex(Index):
+    """A blocking index of a target view which is kept across runs. `dataset` is
+    the enricher dataset, whose artifacts the index is archived with."""
+
+    def __init__(
+        self,
+        view: View,
+        data_dir: Path,
+        options: dict[str, Any] | None,
+        dataset: Dataset,
+        target: Dataset,
+    ) -> None:
+        self.dataset = dataset
+        self.target = target
+        self.target_view = view
+        path = data_dir / INDEX_FILE
+        if not path.exists():
+            # Restore the index archived by the previous run of the enricher:
+            archived = get_dataset_artifact(dataset.name, ENRICH_INDEX_FILE)
+            if archived.exists():
+                data_dir.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(archived, path)
+        super().__init__(view, data_dir, options)
+
+    def get_meta(self, key: str) -> str | None:
+        if not self._has_table(META_TABLE):
+            return None
+        q = f"SELECT value FROM {META_TABLE} WHERE key = ?"
+        res = self.con.execute(q, [key]).fetchone()
+        return res[0] if res is not None else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        q = f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT, value TEXT)"
+        self.con.execute(q)
+        self.con.execute(f"DELETE FROM {META_TABLE} WHERE key = ?", [key])
+        self.con.execute(f"INSERT INTO {META_TABLE} VALUES (?, ?)", [key, value])
+
+    def linker_id(self) -> str:
+        """Identify the linker of the target view, as recorded by the store when it
+        was synced (see `Store.content_key`)."""
+        store = self.target_view.store
+        linker_id: bytes | None = None
+        if isinstance(store, Store):
+            linker_id = store.db.get(LINKER_KEY)
+        if linker_id is None:
+            linker_id = linker_fingerprint(store.linker)
+        return linker_id.decode()
+
+    def build(self) -> None:
+        """Bring the index up to date with the latest version of the target dataset,
+        re-using or updating the existing index where possible."""
+        version = get_latest(self.target.name)
+        indexed = self.get_meta("version")
+        linker_id = self.linker_id()
+        valid = self.get_meta("format") == INDEX_FORMAT and self._has_table("entries")
+        valid = valid and self.get_meta("target") == self.target.name
+        if valid and self.get_meta("linker") != linker_id:
+            log.info("Linker has changed, rebuilding enrich index.")
+            valid = False
+        if version is not None and valid and indexed is not None:
+            if indexed == version.id:
+                log.info("Enrich index is up to date.", version=indexed)
+                return
+            changed = get_changed_ids(self.target, indexed, version)
+            if changed is not None:
+                self.update(changed)
+                self.set_meta("version", version.id)
+                return
+        super().build()
+        self.set_meta("format", INDEX_FORMAT)
+        self.set_meta("target", self.target.name)
+        self.set_meta("linker", linker_id)
+        if version is not None:
+            self.set_meta("version", version.id)
+
+    def update(self, ids: set[str]) -> None:
+        """Re-index the given entities, dropping those no longer in the view."""
+        log.info("Updating enrich index...", changed=len(ids))
+        self.con.execute("CREATE OR REPLACE TEMP TABLE changed (id TEXT)")
+        self.con.executemany("INSERT INTO changed VALUES (?)", [[i] for i in ids])
+        self.con.execute("DELETE FROM entries WHERE id IN (SELECT id FROM changed)")
+        self.load_entities("updates", self._iter_entities(sorted(ids)))
+        self.con.execute("INSERT INTO entries SELECT * FROM updates")
+        self.con.execute("DROP TABLE updates")
+        for table in DERIVED_TABLES:
+            self.con.execute(f"DROP TABLE IF EXISTS {table}")
+        self._build_frequencies()
+        self.con.execute("CHECKPOINT")
+
+    def _iter_entities(self, ids: list[str]) -> Generator[Entity, None, None]:
+        # Only index the schemata which a full build indexes (see `Index.build`):
+        schemata = model.matchable_schemata()
+        for offset in range(0, len(ids), FETCH_BATCH):
+            batch = ids[offset : offset + FETCH_BATCH]
+            for entity in get_entities(self.target_view, batch).values():
+                if entity.schema in schemata:
+                    yield entity
+
+    def archive(self) -> None:
+        """Copy the index into the enricher's data directory, to be archived with
+        the other artifacts of the run. Tables which are only used while matching
+        are dropped first."""
+        tables = self.con.execute("PRAGMA show_tables").fetchall()
+        for (table,) in tables:
+            if table not in ARCHIVED_TABLES:
+                self.con.execute(f"DROP TABLE IF EXISTS {table}")
+        self.con.execute("CHECKPOINT")
+        path = dataset_resource_path(self.dataset.name, ENRICH_INDEX_FILE)
+        shutil.copyfile(self.duckdb_path, path)
@@ -0,0 +1,148 @@
+"""
+Incremental enrichment: only match the subject entities which changed since the
+previous run of an enricher.
+
+With `incremental: true` in the enricher's config, each run records the content
+hash (see `zavod.runtime.delta.hash_entity`) and the match IDs of every subject
+entity it matched, and archives them as `enrich.subjects.json`. The next run
+looks up each subject in the record of the last successful run: if the subject's
+hash is unchanged, its previous matches are passed to `save_match` again instead
+of querying the enricher. Since `save_match` checks the current judgement of each
+match, decisions made since the previous run still take effect. Matches of
+remote enrichers are re-used from the previous run's `statements.pack`, those of
+local enrichers are read from the target store.
+
+Matches are re-used for at most `incremental_max_age` days (default 30), after
+which the subject is matched again to pick up changes to the target data. The
+file starts with a fingerprint of the matching options in the enricher's config
+(see `MATCH_CONFIG`): if they have changed, all subjects are matched again.
+"""
+
+from collections.abc import Iterable
+from datetime import timedelta
+from hashlib import sha1
+
+import orjson
+from followthemoney import Statement
+
+from zavod import settings
+from zavod.archive import ENRICH_SUBJECTS_FILE
+from zavod.archive import dataset_resource_path, get_artifact_object
+from zavod.archive import iter_previous_statements
+from zavod.entity import Entity
+from zavod.logs import get_logger
+from zavod.meta import Dataset
+from zavod.runtime.delta import hash_entity
+from zavod.util import write_json
+
+log = get_logger(__name__)
+DEFAULT_MAX_AGE = 30
+# The options of an enricher's config which change the matches it makes:
+MATCH_CONFIG = ("algorithm", "cutoff", "limit", "index_options", "topics", "schemata")
+
+
+def hash_match_config(dataset: Dataset) -> str:
+    """Compute the fingerprint of the matching options of an enricher."""
+    config = {key: dataset.config.get(key) for key in MATCH_CONFIG}
+    return sha1(orjson.dumps(config, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class SubjectLog:
+    """The record of the matches of each subject entity, read from the previous run
+    of an enricher and written for the current one."""
+
+    def __init__(self, dataset: Dataset) -> None:
+        self.dataset = dataset
+        max_age = int(dataset.config.get("incremental_max_age", DEFAULT_MAX_AGE))
+        self.min_time = (settings.RUN_TIME - timedelta(days=max_age)).isoformat(
+            sep="T", timespec="seconds"
+        )
+        self.config = hash_match_config(dataset)
+        # Subject ID -> (hash, time of the match, match IDs):
+        self.previous: dict[str, tuple[str, str, list[str]]] = {}
+        obj = get_artifact_object(dataset.name, ENRICH_SUBJECTS_FILE)
+        if obj is not None:
+            with obj.open() as fh:
+                header = orjson.loads(fh.readline() or "{}")
+                if header.get("config") == self.config:
+                    for line in fh:
+                        data = orjson.loads(line)
+                        record = (data["hash"], data["time"], data["matches"])
+                        self.previous[data["id"]] = record
+                else:
+                    log.info("Matching config has changed, matching all subjects.")
+        log.info("Loaded previous enrichment subjects.", subjects=len(self.previous))
+        self.path = dataset_resource_path(dataset.name, ENRICH_SUBJECTS_FILE)
+        self.fh = open(self.path, "wb")
+        write_json({"config": self.config}, self.fh)
+        self.reused = 0
+        # Subjects which are being matched, by ID, with their hashes:
+        self.expected: dict[str, str] = {}
+
+    def get_matches(self, entity: Entity) -> list[str] | None:
+        """Return the IDs of the previous matches of the subject entity, if the
+        subject is unchanged since they were made."""
+        assert entity.id is not None
+        previous = self.previous.get(entity.id)
+        if previous is None:
+            return None
+        entity_hash, time, matches = previous
+        if time < self.min_time or entity_hash != hash_entity(entity):
+            return None
+        return matches
+
+    def keep(self, entity: Entity) -> None:
+        """Record a subject entity whose previous matches were re-used in this run,
+        keeping the time they were made."""
+        assert entity.id is not None
+        entity_hash, time, matches = self.previous[entity.id]
+        self._write(entity.id, entity_hash, time, matches)
+        self.reused += 1
+
+    def expect(self, entity: Entity) -> None:
+        """Note a subject entity that is going to be matched in this run. Unless it
+        is recorded or discarded, it is recorded without matches on close, e.g. if
+        the blocking index found no candidates for it."""
+        assert entity.id is not None
+        self.expected[entity.id] = hash_entity(entity)
+
+    def discard(self, entity: Entity) -> None:
+        """Don't record a subject entity, e.g. because matching it failed."""
+        assert entity.id is not None
+        self.expected.pop(entity.id, None)
+
+    def record(self, entity: Entity, matches: Iterable[Entity]) -> None:
+        """Record the matches of a subject entity which was matched in this run."""
+        assert entity.id is not None
+        match_ids = [m.id for m in matches if m.id is not None]
+        entity_hash = self.expected.pop(entity.id, None) or hash_entity(entity)
+        self._write(entity.id, entity_hash, settings.RUN_TIME_ISO, match_ids)
+
+    def _write(self, id: str, entity_hash: str, time: str, matches: list[str]) -> None:
+        data = {"id": id, "hash": entity_hash, "time": time, "matches": matches}
+        write_json(data, self.fh)
+
+    def load_previous_matches(self) -> dict[str, Entity]:
+        """Load the entities which were matched in the previous run from its
+        statements, to be re-used for unchanged subjects."""
+        ids = {id for _, _, matches in self.previous.values() for id in matches}
+        statements: dict[str, list[Statement]] = {}
+        if len(ids):
+            for stmt in iter_previous_statements(self.dataset, external=True):
+                if stmt.entity_id in ids:
+                    statements.setdefault(stmt.entity_id, []).append(stmt)
+        return {
+            id: Entity.from_statements(self.dataset, stmts)
+            for id, stmts in statements.items()
+        }
+
+    def close(self) -> None:
+        for id, entity_hash in self.expected.items():
+            self._write(id, entity_hash, settings.RUN_TIME_ISO, [])
+        self.expected.clear()
+        self.fh.close()
+        log.info(
+            "Incremental enrichment complete.",
+            reused=self.reused,
+            previous=len(self.previous),
+        )
@@ -1,33 +1,129 @@
 import logging
+import multiprocessing
+import shutil
+from collections import OrderedDict, deque
 from collections.abc import Generator, Iterator
-from followthemoney import registry, model
+from concurrent.futures import Future
+from itertools import islice
+from multiprocessing.queues import SimpleQueue
+from pathlib import Path
+from typing import Any
+from followthemoney import Statement, registry, model
 from followthemoney.helpers import check_person_cutoff
 
 from nomenklatura.enrich.common import EnricherConfig
 from nomenklatura.enrich.common import EnrichmentException
 from nomenklatura.enrich.common import BaseEnricher
 from nomenklatura.matching import get_algorithm, EntityResolveRegression
-from nomenklatura.blocker.index import BlockingMatches, Index
+from nomenklatura.blocker.index import BlockingMatches
 from nomenklatura.resolver import Identifier
 from nomenklatura import Judgement
 from nomenklatura.cache import Cache
 
+from zavod import settings
 from zavod.archive import dataset_state_path
 from zavod.context import Context
 from zavod.integration.dedupe import get_dataset_linker
 from zavod.entity import Entity
 from zavod.meta import Dataset, get_multi_dataset, get_catalog
+from zavod.runner.enrich_index import EnrichIndex
+from zavod.runner.incremental import SubjectLog
 from zavod.runner.util import (
+    ExpansionCache,
     check_publishability,
     emit_external_reference_stub,
     is_analyzer_stub,
     prune_unpublishable_references,
     should_promote,
 )
-from zavod.store import get_store, View
+from zavod.runtime.workers import dump_pickle, load_pickle, worker_pool
+from zavod.store import Store, get_entities, get_store, View
 from zavod.reset import reset_caches
 
 log = logging.getLogger(__name__)
+# Number of subject entities sent to a matching worker at a time:
+MATCH_BATCH = 100
+# The match IDs of each subject in a batch, or the error message of the matcher:
+MatchBatch = list[list[str] | str]
+
+
+def copy_target(entity: Entity) -> Entity:
+    """Copy a cached target entity, including the time of its last change."""
+    copy = entity.clone()
+    copy.last_change = entity.last_change
+    return copy
+
+
+class TargetMatcher:
+    """Scores the candidates of subject entities against the entities of a target
+    view. Each matching worker process has one of its own, see `iter_matches`."""
+
+    def __init__(self, view: View, config: EnricherConfig):
+        self.view = view
+        algo_name = config.get("algorithm", EntityResolveRegression.NAME)
+        _algorithm = get_algorithm(algo_name)
+        if _algorithm is None:
+            raise Exception(f"Unknown algorithm: {algo_name}")
+        self._algorithm = _algorithm
+        self._algorithm_config = _algorithm.default_config()
+        self._cutoff = float(config.get("cutoff", 0.5))
+        self._limit = int(config.get("limit", 10))
+        self._target_cache_size = int(config.get("target_cache", 10_000))
+        self._targets: OrderedDict[str, Entity | None] = OrderedDict()
+
+    def get_targets(self, ids: list[str]) -> dict[str, Entity | None]:
+        """Get entities from the target view, fetching those which are not cached
+        in one batch. The entities are those in the cache, not copies."""
+        targets: dict[str, Entity | None] = {}
+        missing: list[str] = []
+        for id in ids:
+            if id in self._targets:
+                self._targets.move_to_end(id)
+                targets[id] = self._targets[id]
+            else:
+                missing.append(id)
+        if len(missing):
+            fetched = get_entities(self.view, missing)
+            for id in missing:
+                targets[id] = self._targets[id] = fetched.get(id)
+            while len(self._targets) > self._target_cache_size:
+                self._targets.popitem(last=False)
+        return targets
+
+    def match_candidates(
+        self, entity: Entity, candidates: BlockingMatches
+    ) -> Generator[Entity, None, None]:
+        """Yield copies of the target entities which match the subject entity, so
+        that the caller may modify them."""
+        assert entity.id is not None
+        ids = [entity.id]
+        ids.extend(match_id.id for match_id, _ in candidates)
+        targets = self.get_targets(ids)
+
+        # Make sure an entity with the same ID is yielded. E.g. a QID or ID scheme
+        # intentionally consistent between datasets.
+        same_id_match = targets[entity.id]
+        if same_id_match is not None:
+            yield copy_target(same_id_match)
+
+        scores: list[tuple[float, Entity]] = []
+        for match_id, _index_score in candidates:
+            match = targets[match_id.id]
+            if match is None:
+                continue
+
+            if not entity.schema.can_match(match.schema):
+                continue
+
+            result = self._algorithm.compare(entity, match, self._algorithm_config)
+            if result.score < self._cutoff:
+                continue
+
+            scores.append((result.score, match))
+
+        scores.sort(key=lambda s: s[0], reverse=True)
+        for algo_score, proxy in scores[: self._limit]:
+            yield copy_target(proxy)
 
 
 class LocalEnricher(BaseEnricher[Dataset]):
@@ -40,7 +136,17 @@ class LocalEnricher(BaseEnricher[Dataset]):
     scoring at least `index_options.min_score_ratio` (default 0.1) of that
     subject's best candidate. Every candidate in the list is then scored by the
     matching algorithm, so those two options directly set the matcher CPU cost
-    per subject.
+    per subject. The index is kept and archived between runs, and updated with
+    the changes to the target dataset (see `zavod.runner.enrich_index`).
+
+    The candidates of a subject are fetched from the target store in one batch,
+    and kept in an LRU cache: the same target entities tend to be candidates for
+    many subjects with similar names. Features the matching algorithm extracts
+    from an entity (e.g. its names) are memoised by entity ID, so re-using the
+    target entities also avoids re-computing them.
+
+    The expansions of confirmed matches are cached by the contents of the target
+    store, see `zavod.runner.util.ExpansionCache`.
 
     Args:
         `config`: a dictionary of configuration options.
@@ -51,6 +157,10 @@ class LocalEnricher(BaseEnricher[Dataset]):
           `algorithm`: `str` (default logic-v1) - the name of the algorithm
               to use for matching.
           `index_options`: `dict` - options to pass to the index.
+          `target_cache`: `int` - (default 10000) the number of target entities
+              to keep in memory between subjects.
+          `expand_cache`: `int` - (default 1000) the number of match expansions
+              to keep in memory between subjects.
 
     """
 
@@ -65,19 +175,16 @@ class LocalEnricher(BaseEnricher[Dataset]):
         self.target_store.sync()
         self.target_view = self.target_store.view(target_dataset)
         index_path = dataset_state_path(target_dataset.name) / "enrich-index"
-        self._index = Index(
-            self.target_view, index_path, config.get("index_options", {})
+        self._index = EnrichIndex(
+            self.target_view,
+            index_path,
+            config.get("index_options", {}),
+            dataset,
+            target_dataset,
         )
         self._index.build()
-
-        algo_name = config.get("algorithm", EntityResolveRegression.NAME)
-        _algorithm = get_algorithm(algo_name)
-        if _algorithm is None:
-            raise Exception(f"Unknown algorithm: {algo_name}")
-        self._algorithm = _algorithm
-        self._algorithm_config = _algorithm.default_config()
-        self._cutoff = float(config.get("cutoff", 0.5))
-        self._limit = int(config.get("limit", 10))
+        self._index.archive()
+        self.matcher = TargetMatcher(self.target_view, config)
 
     def close(self) -> None:
         self.target_store.close()
@@ -91,34 +198,20 @@ class LocalEnricher(BaseEnricher[Dataset]):
         )
         yield from self._index.match_entities(entity_generator)
 
+    def get_targets(self, ids: list[str]) -> dict[str, Entity | None]:
+        """Get copies of entities from the target view, which the caller may
+        modify (e.g. `prune_unpublishable_references`) without changing those
+        kept in the target cache."""
+        targets = self.matcher.get_targets(ids)
+        copies: dict[str, Entity | None] = {}
+        for id, target in targets.items():
+            copies[id] = copy_target(target) if target is not None else None
+        return copies
+
     def match_candidates(
         self, entity: Entity, candidates: BlockingMatches
     ) -> Generator[Entity, None, None]:
-        # Make sure an entity with the same ID is yielded. E.g. a QID or ID scheme
-        # intentionally consistent between datasets.
-        assert entity.id is not None
-        same_id_match = self.target_view.get_entity(entity.id)
-        if same_id_match is not None:
-            yield same_id_match
-
-        scores: list[tuple[float, Entity]] = []
-        for match_id, _index_score in candidates:
-            match = self.target_view.get_entity(match_id.id)
-            if match is None:
-                continue
-
-            if not entity.schema.can_match(match.schema):
-                continue
-
-            result = self._algorithm.compare(entity, match, self._algorithm_config)
-            if result.score < self._cutoff:
-                continue
-
-            scores.append((result.score, match))
-
-        scores.sort(key=lambda s: s[0], reverse=True)
-        for algo_score, proxy in scores[: self._limit]:
-            yield proxy
+        yield from self.matcher.match_candidates(entity, candidates)
 
     def _traverse_nested(
         self, entity: Entity, path: list[str] = []
@@ -160,7 +253,7 @@ class LocalEnricher(BaseEnricher[Dataset]):
 
 def save_match(
     context: Context,
-    enricher: LocalEnricher,
+    expansions: ExpansionCache,
     entity: Entity,
     match: Entity,
     subject_view: View,
@@ -180,7 +273,7 @@ def save_match(
     # them visible:
     if judgement == Judgement.POSITIVE:
         context.log.info(f"Enrich [{entity}]: {match!r}")
-        expanded = list(enricher.expand_wrapped(entity, match))
+        expanded = expansions.expand(entity, match)
         expanded = [adj for adj in expanded if not check_person_cutoff(adj)]
 
         if topic_gated:
@@ -199,6 +292,112 @@ def save_match(
                 context.emit(adj, external=False)
 
 
+# The subject dataset and the matcher of a matching worker process:
+_worker_matcher: tuple[Dataset, TargetMatcher] | None = None
+
+
+def _init_match_worker(
+    dataset: Dataset,
+    target_dataset: Dataset,
+    scope: Dataset,
+    linker_path: Path,
+    config: EnricherConfig,
+    snapshots: "SimpleQueue[Path]",
+) -> None:
+    """Worker process: open a snapshot of the target store of its own, since
+    LevelDB can't be shared between processes, and set up a matcher on it."""
+    global _worker_matcher
+    store = Store(target_dataset, load_pickle(linker_path), snapshots.get())
+    _worker_matcher = (dataset, TargetMatcher(store.view(scope), config))
+
+
+def _match_batch(batch: list[tuple[list[Statement], BlockingMatches]]) -> MatchBatch:
+    """Worker process: score the candidates of a batch of subject entities, and
+    return the IDs of the matches of each, or the error raised by the matcher."""
+    assert _worker_matcher is not None, "Matching worker is not initialized"
+    dataset, matcher = _worker_matcher
+    results: MatchBatch = []
+    for statements, candidates in batch:
+        entity = Entity.from_statements(dataset, statements)
+        try:
+            matches = matcher.match_candidates(entity, candidates)
+            results.append([m.id for m in matches if m.id is not None])
+        except EnrichmentException as exc:
+            results.append(str(exc))
+    return results
+
+
+def _iter_matches_parallel(
+    enricher: LocalEnricher,
+    subjects: Iterator[tuple[Entity, BlockingMatches]],
+    workers: int,
+) -> Generator[tuple[Entity, list[Entity] | str], None, None]:
+    path = dataset_state_path(enricher.dataset.name) / "enrich-workers"
+    shutil.rmtree(path, ignore_errors=True)
+    target_store = enricher.target_store
+    snapshots: SimpleQueue[Path] = multiprocessing.get_context(
+        "forkserver"
+    ).SimpleQueue()
+    for idx in range(workers):
+        snapshot = path / f"{idx}.store"
+        target_store.snapshot(snapshot)
+        snapshots.put(snapshot)
+    linker_path = dump_pickle(target_store.linker, path / "linker.pickle")
+    initargs: tuple[Any, ...] = (
+        enricher.dataset,
+        target_store.dataset,
+        enricher.target_view.scope,
+        linker_path,
+        dict(enricher.config),
+        snapshots,
+    )
+    try:
+        with worker_pool(
+            workers, initializer=_init_match_worker, initargs=initargs
+        ) as executor:
+            # Keep a bounded number of batches in flight, and collect their
+            # results in submission order:
+            pending: deque[tuple[list[Entity], Future[MatchBatch]]] = deque()
+            while True:
+                batch = list(islice(subjects, MATCH_BATCH))
+                if len(batch):
+                    entities = [entity for entity, _ in batch]
+                    args = [(list(e.statements), c) for e, c in batch]
+                    future = executor.submit(_match_batch, args)
+                    pending.append((entities, future))
+                if not len(pending):
+                    break
+                if len(batch) and len(pending) < workers * 2:
+                    continue
+                entities, future = pending.popleft()
+                for entity, result in zip(entities, future.result()):
+                    if isinstance(result, str):
+                        yield entity, result
+                        continue
+                    targets = enricher.get_targets(result)
+                    yield entity, [m for m in (targets[id] for id in result) if m]
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def iter_matches(
+    enricher: LocalEnricher,
+    subjects: Iterator[tuple[Entity, BlockingMatches]],
+    workers: int = 1,
+) -> Generator[tuple[Entity, list[Entity] | str], None, None]:
+    """Score the candidates of each subject entity, yielding the matches of each
+    subject in order, or the error raised by the matcher. With `workers` > 1, the
+    subjects are scored in batches by a pool of worker processes."""
+    if workers > 1:
+        yield from _iter_matches_parallel(enricher, subjects, workers)
+        return
+    for entity, candidates in subjects:
+        try:
+            yield entity, list(enricher.match_candidates(entity, candidates))
+        except EnrichmentException as exc:
+            yield entity, str(exc)
+
+
 def enrich(context: Context) -> None:
     scope = get_multi_dataset(get_catalog(), context.dataset.inputs)
     # The Context resolver is read-only here (save_match only reads judgements),
@@ -213,6 +412,11 @@ def enrich(context: Context) -> None:
     # (BaseEnricher._filter_entity). That coupling guarantees the confirmed match
     # always passes the gate, so supporting entities never publish disconnected.
     enrich_topics: frozenset[str] = frozenset(enricher.filter_topics)
+    expansions = ExpansionCache(
+        enricher,
+        version=enricher.target_store.content_key(),
+        size=int(config.get("expand_cache", 1000)),
+    )
     if topic_gated and not enrich_topics:
         raise ValueError(
             "topic_gated=True requires `topics` to be configured: without a "
@@ -233,36 +437,88 @@ def enrich(context: Context) -> None:
 
     reset_caches()
 
+    subjects: SubjectLog | None = None
+    if config.get("incremental", False):
+        subjects = SubjectLog(context.dataset)
     try:
         context.log.info("Matching candidates...")
         schemata = list(model.matchable_schemata())
         if len(enricher._filter_schemata):
             schemata = [s for s in schemata if s.name in enricher._filter_schemata]
         entities = subject_view.entities(include_schemata=schemata)
-        candidates = enricher.candidates(entities)
-        for entity_idx, (entity_id, candidate_set) in enumerate(candidates):
+        # In incremental mode, only subjects which changed since the previous run
+        # are matched. The previous matches of the others are saved again below:
+        unchanged: list[tuple[str, list[str]]] = []
+
+        def _changed(entities: Iterator[Entity]) -> Generator[Entity, None, None]:
+            for entity in entities:
+                if subjects is None or entity.id is None or is_analyzer_stub(entity):
+                    yield entity
+                    continue
+                if not enricher._filter_entity(entity):
+                    continue
+                cached = subjects.get_matches(entity)
+                if cached is not None:
+                    unchanged.append((entity.id, cached))
+                    continue
+                subjects.expect(entity)
+                yield entity
+
+        candidates = enricher.candidates(_changed(entities))
+
+        def _subjects() -> Generator[tuple[Entity, BlockingMatches], None, None]:
+            for entity_id, candidate_set in candidates:
+                subject_entity = subject_view.get_entity(entity_id.id)
+                if subject_entity is None:
+                    context.log.error(f"Missing entity: {entity_id!r}")
+                    continue
+                yield subject_entity, candidate_set
+
+        matches = iter_matches(enricher, _subjects(), settings.ENRICH_WORKERS)
+        for entity_idx, (subject_entity, subject_matches) in enumerate(matches):
             if entity_idx > 0 and entity_idx % 100 == 0:
                 context.flush()
             if entity_idx > 0 and entity_idx % 10000 == 0:
                 context.log.info(f"Enriched {entity_idx} entities...")
-            subject_entity = subject_view.get_entity(entity_id.id)
-            if subject_entity is None:
-                context.log.error(f"Missing entity: {entity_id!r}")
+            if isinstance(subject_matches, str):
+                msg = f"Enrichment error {subject_entity!r}: {subject_matches}"
+                context.log.error(msg)
+                if subjects is not None:
+                    subjects.discard(subject_entity)
+                continue
+            if subjects is not None:
+                subjects.record(subject_entity, subject_matches)
+            for match in subject_matches:
+                save_match(
+                    context,
+                    expansions,
+                    subject_entity,
+                    match,
+                    subject_view,
+                    topic_gated,
+                    enrich_topics,
+                )
+        for subject_id, match_ids in unchanged:
+            subject = subject_view.get_entity(subject_id)
+            if subject is None or subjects is None:
                 continue
-            try:
-                for match in enricher.match_candidates(subject_entity, candidate_set):
-                    save_match(
-                        context,
-                        enricher,
-                        subject_entity,
-                        match,
-                        subject_view,
-                        topic_gated,
-                        enrich_topics,
-                    )
-            except EnrichmentException as exc:
-                context.log.error(f"Enrichment error {subject_entity!r}: {str(exc)}")
+            targets = enricher.get_targets(match_ids)
+            for target in (targets[id] for id in match_ids):
+                if target is None:
+                    continue
+                save_match(
+                    context,
+                    expansions,
+                    subject,
+                    target,
+                    subject_view,
+                    topic_gated,
+                    enrich_topics,
+                )
+            subjects.keep(subject)
         context.log.info("Enrichment process complete.")
     finally:
         enricher.close()
         subject_store.close()
+        if subjects is not None:
+            subjects.close()
@@ -1,15 +1,22 @@
+from collections import OrderedDict
 from functools import cache
 from collections.abc import Iterable, Set
+from typing import TYPE_CHECKING, Any
 
-from followthemoney import registry
+from followthemoney import Statement, registry
 from followthemoney.property import Property
 from followthemoney.schema import Schema
 
 from zavod.constants import ANALYZER_DATASETS
 from zavod.context import Context
 from zavod.entity import Entity
+from zavod.meta import Dataset
 from zavod.store import View
 
+if TYPE_CHECKING:
+    from nomenklatura.enrich import Enricher
+    from zavod.runner.local_enricher import LocalEnricher
+
 SUPPORTING_SCHEMATA = {
     "Address",
     "Analyzable",
@@ -158,3 +165,66 @@ def emit_external_reference_stub(
     for prop, other_id in pruned:
         stub.add(prop, other_id)
     context.emit(stub, external=True)
+
+
+class ExpansionCache:
+    """The expansions of confirmed matches, shared by all subjects matched to the
+    same entity in a run. If `version` identifies the data the enricher expands
+    matches from (e.g. the contents of a local enricher's target store), the
+    expansions are also kept in the enricher's cache, so that matches aren't
+    expanded again on the next run unless that data has changed. They are kept
+    under one key per match, along with the version they were made from, so that
+    the cache doesn't grow with each version. `size` bounds the number of
+    expansions kept in memory."""
+
+    def __init__(
+        self,
+        enricher: "Enricher[Dataset] | LocalEnricher",
+        version: str | None = None,
+        size: int = 1000,
+    ) -> None:
+        self.enricher = enricher
+        self.version = version
+        self.size = size
+        self._memo: OrderedDict[str, list[Entity]] = OrderedDict()
+
+    def _key(self, match_id: str) -> str:
+        return f"expand:{match_id}"
+
+    def _load(self, match_id: str) -> list[Entity] | None:
+        if self.version is None:
+            return None
+        data: Any = self.enricher.cache.get_json(self._key(match_id))
+        # Expansions made from another version of the data are a miss:
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return None
+        dataset = self.enricher.dataset
+        return [
+            Entity.from_statements(dataset, [Statement.from_dict(s) for s in stmts])
+            for stmts in data["entities"]
+        ]
+
+    def _save(self, match_id: str, expanded: list[Entity]) -> None:
+        if self.version is None:
+            return
+        entities = [[s.to_dict() for s in entity.statements] for entity in expanded]
+        data = {"version": self.version, "entities": entities}
+        self.enricher.cache.set_json(self._key(match_id), data)
+
+    def expand(self, entity: Entity, match: Entity) -> list[Entity]:
+        """Expand a confirmed match of the subject entity, see `expand_wrapped`.
+        The entities returned are copies, which the caller may modify."""
+        assert match.id is not None
+        if not self.enricher._filter_entity(entity):
+            return []
+        expanded = self._memo.get(match.id)
+        if expanded is None:
+            expanded = self._load(match.id)
+        if expanded is None:
+            expanded = list(self.enricher.expand_wrapped(entity, match))
+            self._save(match.id, expanded)
+        self._memo[match.id] = expanded
+        self._memo.move_to_end(match.id)
+        while len(self._memo) > self.size:
+            self._memo.popitem(last=False)
+        return [adjacent.clone() for adjacent in expanded]
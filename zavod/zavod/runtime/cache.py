@@ -0,0 +1,248 @@
+"""
+The cache of a dataset's HTTP responses and other data.
+
+With `ZAVOD_CACHE_LOCAL`, `DatasetCache` puts a local tier in front of the cache
+table in the database: a LevelDB database in the dataset's state directory.
+
+* On first use in a run, the entries the dataset wrote to the cache table since
+  the local tier was last synced are copied into it in one query, rather than
+  being read one at a time.
+* Reads are served from the local tier. Keys it doesn't have (e.g. entries
+  written by other datasets), or only has stale entries for, are read from the
+  cache table and kept locally.
+* Writes go to the local tier at once, and are buffered for the cache table
+  until the context is flushed, to be written in batches.
+* Values larger than `COMPRESS_SIZE` bytes are compressed in the local tier.
+
+The cache table remains the record shared between hosts. The local tier only
+saves queries: if it can't be opened, e.g. because another process running the
+same dataset holds it, the cache table is used directly.
+"""
+
+import os
+import struct
+import zlib
+from collections.abc import Generator
+from datetime import UTC, datetime
+from pathlib import Path
+
+import plyvel  # type: ignore
+from followthemoney import Dataset
+from nomenklatura.cache import Cache, CacheValue, Value, randomize_cache
+from nomenklatura.db import Session
+from rigour.time import naive_now
+from sqlalchemy import select
+
+from zavod import settings
+from zavod.archive import dataset_state_path
+from zavod.logs import get_logger
+
+log = get_logger(__name__)
+LOCAL_DIR = "cache"
+ENTRY_PREFIX = b"c:"
+SYNCED_KEY = b"m:synced"
+# Values larger than this are compressed in the local tier:
+COMPRESS_SIZE = 4096
+# Buffered writes are written to the cache table when this many are pending:
+FLUSH_SIZE = 1000
+# Rows written to the cache table in one statement:
+WRITE_BATCH = 500
+# Entries copied to the local tier in one LevelDB write batch:
+SYNC_BATCH = 10_000
+# Encoding of the value (see `_pack`) and timestamp of a local cache entry:
+HEADER = struct.Struct(">cd")
+PLAIN, COMPRESSED, EMPTY = b"t", b"z", b"n"
+# The local databases opened by this process, and the number of their users:
+_LOCAL: dict[Path, tuple[plyvel.DB, int]] = {}
+
+
+def _pack(value: Value, timestamp: datetime) -> bytes:
+    # Timestamps in the cache table are naive, in UTC:
+    ts = timestamp.replace(tzinfo=UTC).timestamp()
+    if value is None:
+        return HEADER.pack(EMPTY, ts)
+    data = value.encode("utf-8")
+    if len(data) > COMPRESS_SIZE:
+        return HEADER.pack(COMPRESSED, ts) + zlib.compress(data)
+    return HEADER.pack(PLAIN, ts) + data
+
+
+def _unpack(data: bytes) -> tuple[Value, datetime]:
+    encoding, ts = HEADER.unpack_from(data)
+    timestamp = datetime.fromtimestamp(ts, UTC).replace(tzinfo=None)
+    body = data[HEADER.size :]
+    if encoding == EMPTY:
+        return None, timestamp
+    if encoding == COMPRESSED:
+        body = zlib.decompress(body)
+    return body.decode("utf-8"), timestamp
+
+
+def _cutoff(max_age: int | None, min_timestamp: datetime | None) -> datetime | None:
+    """The time before which cache entries are stale, like in `Cache.get`."""
+    cutoff: datetime | None = None
+    if max_age is not None:
+        cutoff = naive_now() - randomize_cache(max_age)
+    if min_timestamp is not None:
+        if min_timestamp.tzinfo is not None:
+            min_timestamp = min_timestamp.astimezone(UTC).replace(tzinfo=None)
+        if cutoff is None or min_timestamp > cutoff:
+            cutoff = min_timestamp
+    return cutoff
+
+
+class DatasetCache(Cache):
+    """A cache with a local tier and batched writes, see the module docstring."""
+
+    def __init__(self, session: Session, dataset: Dataset, create: bool = False):
+        super().__init__(session, dataset, create=create)
+        self._pending: dict[str, tuple[Value, datetime]] = {}
+        self._local_path = dataset_state_path(dataset.name) / LOCAL_DIR
+        self._local: plyvel.DB | None = None
+        self._local_pid = os.getpid()
+        self._use_local = settings.CACHE_LOCAL
+
+    def _get_local(self) -> plyvel.DB | None:
+        if not self._use_local or self._local_pid != os.getpid():
+            # Not enabled, or inherited by a forked process:
+            return None
+        if self._local is None:
+            db, users = _LOCAL.get(self._local_path, (None, 0))
+            if db is None:
+                try:
+                    db = plyvel.DB(self._local_path.as_posix(), create_if_missing=True)
+                except plyvel.IOError as exc:
+                    log.warning("Cannot open local cache.", error=str(exc))
+                    self._use_local = False
+                    return None
+            _LOCAL[self._local_path] = (db, users + 1)
+            self._local = db
+            self._sync(db)
+        return self._local
+
+    def _sync(self, db: plyvel.DB) -> None:
+        """Copy the entries of the dataset which were added to the cache table since
+        the last sync into the local tier."""
+        table = self._table
+        q = select(table.c.key, table.c.text, table.c.timestamp)
+        q = q.where(table.c.dataset == self.dataset.name)
+        synced = db.get(SYNCED_KEY)
+        latest: datetime | None = None
+        if synced is not None:
+            latest = datetime.fromisoformat(synced.decode())
+            q = q.where(table.c.timestamp >= latest)
+        count = 0
+        batch = db.write_batch()
+        for row in self._session.execute(q).yield_per(SYNC_BATCH):
+            batch.put(
+                ENTRY_PREFIX + row.key.encode("utf-8"), _pack(row.text, row.timestamp)
+            )
+            if latest is None or row.timestamp > latest:
+                latest = row.timestamp
+            count += 1
+            if count % SYNC_BATCH == 0:
+                batch.write()
+                batch = db.write_batch()
+        if latest is not None:
+            batch.put(SYNCED_KEY, latest.isoformat().encode())
+        batch.write()
+        if count > 0:
+            log.info("Synced local cache.", entries=count)
+
+    def get(
+        self,
+        key: str,
+        max_age: int | None = None,
+        min_timestamp: datetime | None = None,
+    ) -> Value | None:
+        if key in self._preload:
+            return super().get(key, max_age=max_age, min_timestamp=min_timestamp)
+        if max_age is not None and max_age < 1:
+            return None
+        cutoff = _cutoff(max_age, min_timestamp)
+        entry = self._pending.get(key)
+        local = self._get_local()
+        if entry is None and local is not None:
+            data = local.get(ENTRY_PREFIX + key.encode("utf-8"))
+            if data is not None:
+                entry = _unpack(data)
+                # The cache table may have a fresher entry, e.g. from another host:
+                if cutoff is not None and entry[1] <= cutoff:
+                    entry = None
+        if entry is None:
+            table = self._table
+            q = select(table.c.text, table.c.timestamp).where(table.c.key == key)
+            q = q.order_by(table.c.timestamp.desc()).limit(1)
+            row = self._session.execute(q).fetchone()
+            if row is None:
+                return None
+            entry = (row.text, row.timestamp)
+            if local is not None:
+                local.put(ENTRY_PREFIX + key.encode("utf-8"), _pack(*entry))
+        value, timestamp = entry
+        if cutoff is not None and timestamp <= cutoff:
+            return None
+        return value
+
+    def set(self, key: str, value: Value) -> None:
+        self._preload.pop(key, None)
+        now = naive_now()
+        self._pending[key] = (value, now)
+        local = self._get_local()
+        if local is not None:
+            local.put(ENTRY_PREFIX + key.encode("utf-8"), _pack(value, now))
+        if len(self._pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def delete(self, key: str) -> None:
+        self._pending.pop(key, None)
+        local = self._get_local()
+        if local is not None:
+            local.delete(ENTRY_PREFIX + key.encode("utf-8"))
+        super().delete(key)
+
+    def flush(self) -> None:
+        """Write the buffered entries to the cache table."""
+        if not len(self._pending):
+            return
+        rows = [
+            {"key": key, "text": text, "dataset": self.dataset.name, "timestamp": ts}
+            for key, (text, ts) in self._pending.items()
+        ]
+        for offset in range(0, len(rows), WRITE_BATCH):
+            istmt = self._session.insert(self._table)
+            istmt = istmt.values(rows[offset : offset + WRITE_BATCH])
+            values = dict(
+                timestamp=istmt.excluded.timestamp,
+                text=istmt.excluded.text,
+                dataset=istmt.excluded.dataset,
+            )
+            stmt = istmt.on_conflict_do_update(index_elements=["key"], set_=values)
+            self._session.execute(stmt)
+        self._pending.clear()
+
+    def all(self, like: str | None) -> Generator[CacheValue, None, None]:
+        self.flush()
+        yield from super().all(like)
+
+    def clear(self) -> None:
+        self._pending.clear()
+        local = self._get_local()
+        if local is not None:
+            with local.write_batch() as batch:
+                for key in local.iterator(prefix=ENTRY_PREFIX, include_value=False):
+                    batch.delete(key)
+                batch.delete(SYNCED_KEY)
+        super().clear()
+
+    def close(self) -> None:
+        """Flush the buffered entries and release the local tier."""
+        self.flush()
+        if self._local is not None:
+            db, users = _LOCAL[self._local_path]
+            if users <= 1:
+                db.close()
+                _LOCAL.pop(self._local_path)
+            else:
+                _LOCAL[self._local_path] = (db, users - 1)
+            self._local = None
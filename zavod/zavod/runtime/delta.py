@@ -1,94 +1,188 @@
-from hashlib import sha1
 import shutil
-import plyvel  # type: ignore
-from collections.abc import Generator
+import orjson
+from hashlib import sha1
+from collections.abc import Generator, Iterable
+from xxhash import xxh3_128_hexdigest
 from followthemoney.dataset import Version
+from followthemoney.statement.serialize import read_pack_statements_decoded
 
+from zavod import settings
+from zavod.exc import ConfigurationException
 from zavod.logs import get_logger
 from zavod.meta import Dataset
 from zavod.entity import Entity
 from zavod.archive import dataset_resource_path, dataset_state_path
 from zavod.archive import iter_dataset_versions, get_artifact_object, HASH_FILE
+from zavod.archive import iter_local_statements, STATEMENTS_FILE
+from zavod.archive.backend import ArchiveObject
+from zavod.runtime.sort import ExternalSorter, merge_join
 from zavod.runtime.versions import get_latest
 
 log = get_logger(__name__)
 
+SHA1 = "sha1"
+XXH3 = "xxh3"
+# Entity hash algorithms, by the length of their hex digests:
+HASH_LENGTHS = {SHA1: 40, XXH3: 32}
+
+
+def hash_entity(entity: Entity, algorithm: str = SHA1) -> str:
+    """Compute the content hash of an entity used to detect modifications."""
+    assert entity.id is not None
+    if algorithm == XXH3:
+        # Digest the entity in a single call, rather than one per value:
+        parts = [entity.id, entity.schema.name]
+        for prop, values in sorted(entity.properties.items()):
+            parts.append(prop)
+            parts.extend(sorted(values))
+        return xxh3_128_hexdigest("\x1f".join(parts).encode("utf-8"))
+    digest = sha1()
+    digest.update(entity.id.encode("utf-8"))
+    digest.update(entity.schema.name.encode("utf-8"))
+    for prop, values in sorted(entity.properties.items()):
+        digest.update(prop.encode("utf-8"))
+        for value in sorted(values):
+            digest.update(value.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_hash_algorithm(entity_hash: str) -> str:
+    """Identify the algorithm of an entity hash by the length of its hex digest."""
+    for algorithm, length in HASH_LENGTHS.items():
+        if len(entity_hash) == length:
+            return algorithm
+    raise ValueError(f"Unknown entity hash format: {entity_hash!r}")
+
+
+def get_previous_hashes(
+    dataset: Dataset, curr: Version | None
+) -> tuple[Version, ArchiveObject] | None:
+    """Find the entity hash file of the most recent previous version of a dataset."""
+    for version in iter_dataset_versions(dataset.name):
+        obj = get_artifact_object(dataset.name, HASH_FILE, version.id)
+        if obj is None or version == curr:
+            continue
+        return version, obj
+    return None
+
+
+def get_hash_algorithms(dataset: Dataset) -> tuple[str, str | None]:
+    """Return the configured entity hash algorithm and, if the previous version's
+    hashes were made with a different one, that algorithm. During such a migration,
+    entities are hashed with both: the configured algorithm for `entities.hash`, and
+    the previous one to compare against the previous version."""
+    algorithm = settings.DELTA_HASH
+    if algorithm not in HASH_LENGTHS:
+        raise ConfigurationException(f"Invalid entity hash algorithm: {algorithm}")
+    previous = get_previous_hashes(dataset, get_latest(dataset.name, backfill=False))
+    if previous is None:
+        return algorithm, None
+    with previous[1].open() as fh:
+        for _, entity_hash in read_hashes(fh):
+            compare = get_hash_algorithm(entity_hash)
+            if compare != algorithm:
+                return algorithm, compare
+            break
+    return algorithm, None
+
+
+def read_hashes(lines: Iterable[str]) -> Generator[tuple[str, str], None, None]:
+    """Parse the lines of an entity hash file into (entity_id, hash) pairs."""
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        # The hash is hex-encoded, so the last colon separates it from the ID:
+        entity_id, entity_hash = line.rsplit(":", 1)
+        yield entity_id, entity_hash
+
 
 class HashDelta:
+    """Compute the entity-level changes between the previous and the current version
+    of a dataset. The hashes of each version are kept in a text file sorted by entity
+    ID (`entities.hash`), so that the delta is a streaming merge-join of the two."""
+
     def __init__(self, dataset: Dataset):
         self.dataset = dataset
         self.curr = get_latest(dataset.name, backfill=False)
         self.prev: Version | None = None
         self.curr_path = dataset_resource_path(dataset.name, HASH_FILE)
-        self.fh = self.curr_path.open("w")
-        self.db_path = dataset_state_path(dataset.name) / "hashes"
-        shutil.rmtree(self.db_path, ignore_errors=True)
-        self.db = plyvel.DB(self.db_path.as_posix(), create_if_missing=True)
+        self.work_path = dataset_state_path(dataset.name) / "hashes"
+        shutil.rmtree(self.work_path, ignore_errors=True)
+        self.prev_path = self.work_path / "previous.hash"
+        self.sorter = ExternalSorter(self.work_path / "current")
+        self.written = False
+        self.algorithm, self.compare = get_hash_algorithms(dataset)
+        # Hashes made with the previous version's algorithm, when migrating:
+        self.compat: ExternalSorter | None = None
+        if self.compare is not None:
+            log.warning(
+                "Migrating entity hashes, comparing with the previous algorithm.",
+                algorithm=self.algorithm,
+                previous=self.compare,
+            )
+            self.compat = ExternalSorter(self.work_path / "compat")
 
     def backfill(self) -> None:
-        for version in iter_dataset_versions(self.dataset.name):
-            obj = get_artifact_object(self.dataset.name, HASH_FILE, version.id)
-            if obj is None or version == self.curr:
-                continue
-            self.prev = version
-            log.info(
-                "Loading previous hashes...",
-                version=version.id,
-            )
-            with obj.open() as fh:
-                for line in fh:
-                    entity_id, entity_hash = line.strip().split(":", 1)
-                    key = f"{entity_id}:{version.id}".encode()
-                    self.db.put(key, entity_hash.encode("utf-8"))
+        previous = get_previous_hashes(self.dataset, self.curr)
+        if previous is None:
+            log.info("No previous hash data found.")
             return
-        log.info("No previous hash data found.")
+        self.prev, obj = previous
+        log.info(
+            "Loading previous hashes...",
+            version=self.prev.id,
+        )
+        # Hash files from older versions may not be sorted:
+        sorter = ExternalSorter(self.work_path / "previous")
+        with obj.open() as fh:
+            for entity_id, entity_hash in read_hashes(fh):
+                sorter.add(entity_id, entity_hash)
+        sorter.write(self.prev_path)
 
     def feed(self, entity: Entity) -> None:
         if entity.id is None or self.curr is None:
             return
-        digest = sha1()
-        digest.update(entity.id.encode("utf-8"))
-        digest.update(entity.schema.name.encode("utf-8"))
-        for prop, values in sorted(entity.properties.items()):
-            digest.update(prop.encode("utf-8"))
-            for value in sorted(values):
-                digest.update(value.encode("utf-8"))
-        entity_hash = digest.hexdigest()
-        # entity_hash = hash_data((entity.id, entity.schema.name, entity.properties))
-        # assert entity_hash == digest.hexdigest(), (
-        #     f"Hash mismatch for {entity.id}: {entity_hash} != {digest.hexdigest()}"
-        # )
-        self.fh.write(f"{entity.id}:{entity_hash}\n")
-        key = f"{entity.id}:{self.curr.id}".encode()
-        self.db.put(key, entity_hash.encode("utf-8"))
+        compat_hash = None
+        if self.compare is not None:
+            compat_hash = hash_entity(entity, self.compare)
+        self.add(entity.id, hash_entity(entity, self.algorithm), compat_hash)
+
+    def add(
+        self, entity_id: str, entity_hash: str, compat_hash: str | None = None
+    ) -> None:
+        """Record the hash of an entity in the current version. While migrating
+        to another hash algorithm, `compat_hash` is the entity's hash made with
+        the previous version's algorithm."""
+        if self.curr is None:
+            return
+        self.sorter.add(entity_id, entity_hash)
+        if self.compat is not None:
+            assert compat_hash is not None, "Missing hash for migration"
+            self.compat.add(entity_id, compat_hash)
+
+    def _write(self) -> None:
+        if not self.written:
+            self.sorter.write(self.curr_path)
+            self.written = True
 
     def _collect(
         self,
     ) -> Generator[tuple[str, str | None, str | None], None, None]:
-        # Use entity_id:version key ordering to set prev_hash if available and
-        # compare with curr_hash in the final iteration for that entity_id.
-        # More efficient than random access.
-
-        with self.db.iterator(include_key=True, fill_cache=False) as it:
-            entity_id: str | None = None
-            prev_hash: str | None = None
-            curr_hash: str | None = None
-            for key, value in it:
-                new_id, version_id = key.decode("utf-8").split(":", 1)
-                hash = value.decode("utf-8")
-                if self.prev is None:
-                    yield new_id, None, hash
-                    continue
-                if new_id != entity_id:
-                    if entity_id is not None:
-                        yield entity_id, prev_hash, curr_hash
-                    entity_id, prev_hash, curr_hash = new_id, None, None
-                if self.curr is not None and version_id == self.curr.id:
-                    curr_hash = hash
-                else:
-                    prev_hash = hash
-            if entity_id is not None:
-                yield entity_id, prev_hash, curr_hash
+        # Both hash files are sorted by entity ID, so walk them in parallel and
+        # pair up the previous and current hash for each entity.
+        self._write()
+        if self.prev is None:
+            with open(self.curr_path) as curr_fh:
+                yield from merge_join([], read_hashes(curr_fh))
+            return
+        with open(self.prev_path) as prev_fh:
+            prev = read_hashes(prev_fh)
+            if self.compat is not None:
+                yield from merge_join(prev, self.compat.sorted())
+                return
+            with open(self.curr_path) as curr_fh:
+                yield from merge_join(prev, read_hashes(curr_fh))
 
     def generate(self) -> Generator[tuple[str, str], None, None]:
         for entity_id, prev_hash, curr_hash in self._collect():
@@ -102,6 +196,61 @@ class HashDelta:
                 yield "MOD", entity_id
 
     def close(self) -> None:
-        if not self.db.closed:
-            self.db.close()
-        self.fh.close()
+        self._write()
+        shutil.rmtree(self.work_path, ignore_errors=True)
+
+
+class StatementDelta:
+    """Compute the statements added to and removed from a dataset since its previous
+    version, keyed on the statement ID. Since the ID covers the statement's content,
+    a changed statement is reported as removed and added. Both versions' statements
+    are sorted by ID and merge-joined, so memory use is bounded."""
+
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.curr = get_latest(dataset.name, backfill=False)
+        self.prev: Version | None = None
+        self.work_path = dataset_state_path(dataset.name) / "statement-hashes"
+        shutil.rmtree(self.work_path, ignore_errors=True)
+
+    def _previous(self) -> ExternalSorter | None:
+        for version in iter_dataset_versions(self.dataset.name):
+            obj = get_artifact_object(self.dataset.name, STATEMENTS_FILE, version.id)
+            if obj is None or version == self.curr:
+                continue
+            self.prev = version
+            log.info("Loading previous statements...", version=version.id)
+            sorter = ExternalSorter(self.work_path / "previous")
+            with obj.open() as fh:
+                for stmt in read_pack_statements_decoded(fh):
+                    if stmt.id is not None:
+                        sorter.add(stmt.id, "")
+            return sorter
+        log.info("No previous statements found.")
+        return None
+
+    def _current(self) -> ExternalSorter:
+        sorter = ExternalSorter(self.work_path / "current")
+        for stmt in iter_local_statements(self.dataset):
+            if stmt.id is not None:
+                data = orjson.dumps(stmt.to_dict()).decode("utf-8")
+                sorter.add(stmt.id, data)
+        return sorter
+
+    def generate(self) -> Generator[tuple[str, str, str | None], None, None]:
+        """Yield (op, statement ID, statement JSON) for each changed statement; the
+        JSON is only given for added statements."""
+        curr = self._current()
+        prev = self._previous()
+        if prev is None:
+            for stmt_id, data in curr.sorted():
+                yield "ADD", stmt_id, data
+            return
+        for stmt_id, prev_data, curr_data in merge_join(prev.sorted(), curr.sorted()):
+            if prev_data is None:
+                yield "ADD", stmt_id, curr_data
+            elif curr_data is None:
+                yield "DEL", stmt_id, None
+
+    def close(self) -> None:
+        shutil.rmtree(self.work_path, ignore_errors=True)
@@ -1,11 +1,19 @@
+import os
+import shutil
 import warnings
+from hashlib import sha1, sha256
 from typing import Any
-from collections.abc import Mapping, Iterable
+from collections.abc import Generator, Mapping, Iterable
+from contextlib import contextmanager
 from functools import partial
 from pathlib import Path
+from threading import Lock, Semaphore
+from time import monotonic, sleep
+from urllib.parse import urlparse
 
+import orjson
 from banal import hash_data
-from requests import Session
+from requests import PreparedRequest, Response, Session
 from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning
 from urllib3.util import Retry
@@ -50,11 +58,124 @@ def make_session(http_conf: HTTP) -> Session:
         status_forcelist=http_conf.retry_statuses,
         allowed_methods=http_conf.retry_methods,
     )
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    session.mount("http://", HTTPAdapter(max_retries=retries))
+    throttle = None
+    if http_conf.rate_limit is not None:
+        throttle = HostThrottle(http_conf.rate_limit, http_conf.rate_burst)
+    for prefix in ("https://", "http://"):
+        adapter = ThrottledAdapter(
+            throttle,
+            max_retries=retries,
+            pool_connections=http_conf.pool_connections,
+            pool_maxsize=http_conf.pool_size,
+        )
+        session.mount(prefix, adapter)
     return session
 
 
+class TokenBucket:
+    """A rate limit shared by any number of threads. Each request takes a token;
+    tokens are added at `rate` per second, up to `burst` of them, so that after
+    an idle period up to `burst` requests can be sent at once."""
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def acquire(self) -> None:
+        """Take a token, waiting until one is available."""
+        with self.lock:
+            now = monotonic()
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+            # Reserve the token even if it is yet to be added, so that waiting
+            # threads are served in the order they arrived:
+            self.tokens -= 1.0
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            sleep(wait)
+
+
+def _host(url: str | None) -> str:
+    return urlparse(url or "").netloc.lower()
+
+
+class HostThrottle:
+    """A separate `TokenBucket` for each host."""
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.lock = Lock()
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def acquire(self, url: str | None) -> None:
+        """Take a token for the host of `url`, waiting until one is available."""
+        host = _host(url)
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            bucket = self.buckets[host]
+        bucket.acquire()
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """An adapter which waits for the rate limit of the host before sending each
+    request, including redirects. Retries of a request by urllib3 are not
+    throttled, they are spaced out by the retry backoff instead."""
+
+    def __init__(self, throttle: HostThrottle | None, **kwargs: Any) -> None:
+        self.throttle = throttle
+        super().__init__(**kwargs)
+
+    def send(self, request: PreparedRequest, *args: Any, **kwargs: Any) -> Response:
+        if self.throttle is not None:
+            self.throttle.acquire(request.url)
+        return super().send(request, *args, **kwargs)
+
+
+def set_rate_limit(session: Session, rate: float, burst: float = 1.0) -> None:
+    """Limit the requests sent by a session made by `make_session` to `rate` per
+    second to each host, replacing the rate limit from the HTTP metadata."""
+    throttle = HostThrottle(rate, burst)
+    for adapter in session.adapters.values():
+        if isinstance(adapter, ThrottledAdapter):
+            adapter.throttle = throttle
+
+
+class HostLimiter:
+    """Limit the concurrent requests to each host to `concurrency`, and space out
+    their starts by at least `delay` seconds."""
+
+    def __init__(self, concurrency: int, delay: float = 0.0) -> None:
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self.lock = Lock()
+        self.slots: dict[str, Semaphore] = {}
+        self.next_start: dict[str, float] = {}
+
+    @contextmanager
+    def request(self, url: str) -> Generator[None, None, None]:
+        """Wait until a request to the host of `url` may be sent."""
+        host = _host(url)
+        with self.lock:
+            if host not in self.slots:
+                self.slots[host] = Semaphore(self.concurrency)
+            slot = self.slots[host]
+        with slot:
+            if self.delay > 0:
+                with self.lock:
+                    now = monotonic()
+                    start = max(now, self.next_start.get(host, now))
+                    self.next_start[host] = start + self.delay
+                if start > now:
+                    sleep(start - now)
+            yield
+
+
 def request_hash(
     url: str,
     auth: _Auth | None = None,
@@ -87,6 +208,84 @@ def request_hash(
     return f"{url}[{hsh}]"
 
 
+def get_validators(response: Response) -> dict[str, Any] | None:
+    """Get the validators of a response, which can be sent back to the server with
+    `conditional_headers` to check whether the resource has changed since."""
+    validators: dict[str, Any] = {}
+    if response.headers.get("ETag"):
+        validators["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        validators["last_modified"] = response.headers["Last-Modified"]
+    return validators if len(validators) else None
+
+
+def conditional_headers(
+    headers: Mapping[str, str] | None, validators: Mapping[str, Any] | None
+) -> dict[str, str]:
+    """Add the headers of a conditional request to the given request headers."""
+    conditional = dict(headers or {})
+    if validators is not None:
+        if validators.get("etag"):
+            conditional["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            conditional["If-Modified-Since"] = validators["last_modified"]
+    return conditional
+
+
+def _file_cache_path(url: str, auth: Any, headers: Any) -> Path | None:
+    """The base path of the cached copy of a file, and of its validators."""
+    if not settings.HTTP_FILE_CACHE_PATH:
+        return None
+    fingerprint = request_hash(url, auth=auth, headers=headers)
+    digest = sha1(fingerprint.encode("utf-8")).hexdigest()
+    return Path(settings.HTTP_FILE_CACHE_PATH) / digest
+
+
+def _file_digest(path: Path) -> str:
+    digest = sha256()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace_file(src: Path, dest: Path, link: bool = False) -> None:
+    """Copy `src` to `dest`, or hard-link it if `link` is set and both are on the
+    same file system."""
+    tmp = dest.with_name(f"{dest.name}.tmp")
+    tmp.unlink(missing_ok=True)
+    if link:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            link = False
+    if not link:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def _load_file_cache(cache_path: Path | None) -> dict[str, Any] | None:
+    if cache_path is None:
+        return None
+    meta_path = cache_path.with_suffix(".json")
+    if not meta_path.exists() or not cache_path.exists():
+        return None
+    validators: dict[str, Any] = orjson.loads(meta_path.read_bytes())
+    return validators
+
+
+def _restore_file(cache_path: Path, validators: dict[str, Any], out_path: Path) -> bool:
+    """Link the cached file to `out_path`, if it is intact. Since the digest is
+    checked on each use, a cached file changed through `out_path` is fetched
+    again rather than used."""
+    if cache_path.stat().st_size != validators.get("length"):
+        return False
+    if _file_digest(cache_path) != validators.get("sha256"):
+        return False
+    _replace_file(cache_path, out_path, link=True)
+    return True
+
+
 def fetch_file(
     session: Session,
     url: str,
@@ -97,22 +296,56 @@ def fetch_file(
     method: str = "GET",
     data: _Body | None = None,
 ) -> Path:
-    """Fetch a (large) file via HTTP to the data path."""
+    """Fetch a (large) file via HTTP to the data path.
+
+    With `ZAVOD_HTTP_FILE_CACHE_PATH`, a copy of the file is kept in that directory
+    along with the validators returned by the server (`ETag`, `Last-Modified`), its
+    length and its SHA-256 digest. When the same file is fetched again, the
+    validators are sent along, and the cached copy is used if the server responds
+    that the file is unchanged (`304`)."""
     out_path = data_path.joinpath(name)
     if out_path.exists():
         return out_path
-    log.info("Fetching file", url=url)
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path: Path | None = None
+    if method == "GET" and data is None:
+        cache_path = _file_cache_path(url, auth, headers)
+    validators = _load_file_cache(cache_path)
+    log.info("Fetching file", url=url, conditional=validators is not None)
+    refetch = False
     with session.request(
         method=method,
         url=url,
         auth=auth,
-        headers=headers,
+        headers=conditional_headers(headers, validators),
         stream=True,
         data=data,
     ) as res:
-        res.raise_for_status()
-        with open(out_path, "wb") as fh:
-            for chunk in res.iter_content(chunk_size=8192 * 10):
-                fh.write(chunk)
+        if res.status_code == 304 and cache_path is not None and validators:
+            if _restore_file(cache_path, validators, out_path):
+                log.info("File not modified, using cached copy", url=url)
+                return out_path
+            # The cached copy is damaged, fetch the file again without validators:
+            cache_path.with_suffix(".json").unlink(missing_ok=True)
+            refetch = True
+        else:
+            res.raise_for_status()
+            digest = sha256()
+            with open(out_path, "wb") as fh:
+                for chunk in res.iter_content(chunk_size=8192 * 10):
+                    fh.write(chunk)
+                    digest.update(chunk)
+            new_validators = get_validators(res)
+    if refetch:
+        return fetch_file(session, url, name, data_path, auth, headers)
+    if cache_path is not None:
+        meta_path = cache_path.with_suffix(".json")
+        meta_path.unlink(missing_ok=True)
+        if new_validators is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # A copy, since the crawler may modify the file it fetched in place:
+            _replace_file(out_path, cache_path)
+            new_validators["length"] = out_path.stat().st_size
+            new_validators["sha256"] = digest.hexdigest()
+            meta_path.write_bytes(orjson.dumps(new_validators))
     return out_path
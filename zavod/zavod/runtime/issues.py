@@ -1,13 +1,14 @@
 import orjson
+import shutil
 from pathlib import Path
 from rigour.time import utc_now, datetime_iso
 from banal import is_mapping, hash_data
 from datetime import datetime
 from typing import Any, TypedDict, BinaryIO, cast
-from collections.abc import Generator
+from collections.abc import Generator, Iterable
 
 from zavod.meta import Dataset
-from zavod.archive import dataset_resource_path, get_dataset_artifact
+from zavod.archive import dataset_resource_path
 from zavod.archive import ISSUES_LOG, ISSUES_FILE
 
 
@@ -26,14 +27,21 @@ class Issue(TypedDict):
 class DatasetIssues:
     """A log of issues that occurred during the running and export of a dataset."""
 
-    def __init__(self, dataset: Dataset) -> None:
+    def __init__(self, dataset: Dataset, path: Path | None = None) -> None:
         self.dataset = dataset
+        self._path = path
         self.fh: BinaryIO | None = None
 
+    @property
+    def path(self) -> Path:
+        """Path of the issues log file."""
+        if self._path is not None:
+            return self._path
+        return dataset_resource_path(self.dataset.name, ISSUES_LOG)
+
     def write(self, event: dict[str, Any]) -> None:
         if self.fh is None:
-            path = dataset_resource_path(self.dataset.name, ISSUES_LOG)
-            self.fh = open(path, "ab")
+            self.fh = open(self.path, "ab")
 
         data = dict(event)  # copy so we can pop without side effects
         data.pop("_record", None)
@@ -60,15 +68,32 @@ class DatasetIssues:
         out = orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
         self.fh.write(out)
 
+    def extend(self, issues: Iterable[Issue]) -> None:
+        """Append issues recorded in a previous run, e.g. one whose statements are
+        re-used by this run."""
+        if self.fh is None:
+            self.fh = open(self.path, "ab")
+        for issue in issues:
+            self.fh.write(orjson.dumps(issue, option=orjson.OPT_APPEND_NEWLINE))
+
     def clear(self) -> None:
         """Clear (delete) the issues log file."""
         self.close()
-        log_path = dataset_resource_path(self.dataset.name, ISSUES_LOG)
-        with open(log_path, "w") as fh:
+        with open(self.path, "w") as fh:
             fh.flush()
-        file_path = dataset_resource_path(self.dataset.name, ISSUES_FILE)
+        file_path = self.path.with_name(ISSUES_FILE)
         file_path.unlink(missing_ok=True)
 
+    def merge(self, path: Path) -> None:
+        """Append the issues recorded in another issues log file, e.g. one written
+        by a worker process."""
+        if not path.is_file():
+            return
+        if self.fh is None:
+            self.fh = open(self.path, "ab")
+        with open(path, "rb") as fh:
+            shutil.copyfileobj(fh, self.fh)
+
     def close(self) -> None:
         """Close the issues log file."""
         if self.fh is not None:
@@ -81,10 +106,9 @@ class DatasetIssues:
         # Don't backfill the issues log, otherwise we'll get issues from a previous run for collections.
         # For data sources (that run crawl), that's not the case because they run clear() at the beginning
         # of the crawl stage.
-        path = get_dataset_artifact(self.dataset.name, ISSUES_LOG, backfill=False)
-        if not path.is_file():
+        if not self.path.is_file():
             return
-        with open(path, "rb") as fh:
+        with open(self.path, "rb") as fh:
             for line in fh:
                 yield cast(Issue, orjson.loads(line))
 
@@ -100,7 +124,7 @@ class DatasetIssues:
     def export(self, path: Path | None = None) -> None:
         """Export the issues log to a consolidated file."""
         if path is None:
-            path = dataset_resource_path(self.dataset.name, ISSUES_FILE)
+            path = self.path.with_name(ISSUES_FILE)
         with open(path, "wb") as fh:
             issues = list(self.all())
             fh.write(orjson.dumps({"issues": issues}))
@@ -10,6 +10,29 @@ from importlib.util import module_from_spec, spec_from_file_location
 from zavod.meta import Dataset
 
 MODULE_RE = re.compile(r"^[\w\.]+:[\w]+")
+# Prefix of the names of the modules loaded from dataset source files:
+MODULE_PREFIX = "_dataset_mod_"
+
+
+def load_module_file(name: str, file_path: Path) -> ModuleType | None:
+    """Load a Python source file as a module with the given name."""
+    spec = spec_from_file_location(name, file_path)
+    if spec is None or spec.loader is None:
+        return None
+    module = module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_module_files() -> dict[str, Path]:
+    """Get the source files of the dataset modules loaded by `load_entry_point`, so
+    they can be loaded under the same names in worker processes."""
+    files: dict[str, Path] = {}
+    for name, module in list(sys.modules.items()):
+        if name.startswith(MODULE_PREFIX) and module.__file__ is not None:
+            files[name] = Path(module.__file__)
+    return files
 
 
 def load_entry_point(dataset: Dataset, method: str = "crawl") -> Callable[[Any], None]:
@@ -33,12 +56,9 @@ def load_entry_point(dataset: Dataset, method: str = "crawl") -> Callable[[Any],
             if dataset.base_path is not None:
                 file_path = dataset.base_path.joinpath(file_path)
             if file_path.is_file():
-                name = f"_dataset_mod_{file_path.stem}"
-                spec = spec_from_file_location(name, file_path)
-                if spec is not None and spec.loader is not None:
-                    module = module_from_spec(spec)
-                    sys.modules[name] = module
-                    spec.loader.exec_module(module)
+                name = f"{MODULE_PREFIX}{file_path.stem}"
+                module = load_module_file(name, file_path)
+                if module is not None:
                     break
     if module is None:
         raise RuntimeError(f"Could not load entry point: {dataset.model.entry_point}")
@@ -0,0 +1,86 @@
+import heapq
+from pathlib import Path
+from typing import TextIO
+from collections.abc import Generator, Iterable, Iterator
+
+# Number of items held in memory by an external sort before spilling a sorted run:
+SORT_BUFFER = 500_000
+
+
+class ExternalSorter:
+    """Sort (key, value) pairs by key with bounded memory: when the buffer is full,
+    it is sorted and spilled to a run file in the given directory, and the runs are
+    merged when the sorted pairs are read. Keys must not contain tabs and values
+    must not contain line breaks."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.buffer: list[tuple[str, str]] = []
+        self.runs: list[Path] = []
+
+    def add(self, key: str, value: str) -> None:
+        self.buffer.append((key, value))
+        if len(self.buffer) >= SORT_BUFFER:
+            self._spill()
+
+    def _spill(self) -> None:
+        path = self.path / f"{len(self.runs)}.run"
+        with open(path, "w") as fh:
+            for key, value in sorted(self.buffer):
+                fh.write(f"{key}\t{value}\n")
+        self.runs.append(path)
+        self.buffer = []
+
+    def _read_run(self, fh: TextIO) -> Generator[tuple[str, str], None, None]:
+        for line in fh:
+            key, value = line.rstrip("\n").split("\t", 1)
+            yield key, value
+
+    def sorted(self) -> Generator[tuple[str, str], None, None]:
+        """Iterate over the pairs in key order, keeping one value per key."""
+        self.buffer.sort()
+        fhs = [open(run) for run in self.runs]
+        try:
+            streams: list[Iterator[tuple[str, str]]] = [self._read_run(f) for f in fhs]
+            streams.append(iter(self.buffer))
+            # Without spilled runs, there is nothing to merge:
+            merged = heapq.merge(*streams) if len(fhs) else streams[0]
+            last: str | None = None
+            for key, value in merged:
+                if key == last:
+                    continue
+                last = key
+                yield key, value
+        finally:
+            for fh in fhs:
+                fh.close()
+
+    def write(self, path: Path) -> None:
+        """Write the sorted pairs to a file, as `key:value` lines."""
+        with open(path, "w") as out:
+            for key, value in self.sorted():
+                out.write(f"{key}:{value}\n")
+
+
+def merge_join[T](
+    prev: Iterable[tuple[str, T]], curr: Iterable[tuple[str, T]]
+) -> Generator[tuple[str, T | None, T | None], None, None]:
+    """Pair up the values of two key-sorted streams, yielding (key, prev, curr)
+    for each key in either of them."""
+    prev_it = iter(prev)
+    curr_it = iter(curr)
+    p = next(prev_it, None)
+    c = next(curr_it, None)
+    while p is not None or c is not None:
+        if c is None or (p is not None and p[0] < c[0]):
+            assert p is not None
+            yield p[0], p[1], None
+            p = next(prev_it, None)
+        elif p is None or c[0] < p[0]:
+            yield c[0], None, c[1]
+            c = next(curr_it, None)
+        else:
+            yield c[0], p[1], c[1]
+            p = next(prev_it, None)
+            c = next(curr_it, None)
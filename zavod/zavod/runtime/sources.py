@@ -0,0 +1,129 @@
+"""
+Source fingerprints, which let a crawler skip its run when the data it crawls is
+unchanged since its previous run.
+
+A crawler registers each source it has fetched with `Context.register_source` and
+then calls `Context.skip_if_unchanged`. The fingerprints of the sources are
+archived as `sources.json` along with a fingerprint of the crawler's code and
+metadata, and the issues logged by its last full run. If all of them match those
+of the last successful run, the statements and issues of that run are re-used,
+updating the `last_seen` time of the statements, and the crawler returns. Since
+entity hashes don't include the statement times, the delta of the export is then
+empty.
+
+The previous statements are re-used for at most `ZAVOD_SOURCE_MAX_AGE` days after
+the last full run of the crawler, to pick up changes to the code it shares with
+other crawlers (e.g. the `zavod.helpers`).
+"""
+
+import inspect
+from collections.abc import Callable
+from datetime import timedelta
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+from collections.abc import Iterable
+
+import orjson
+
+import zavod
+from zavod import settings
+from zavod.archive import SOURCES_FILE, dataset_resource_path, get_artifact_object
+from zavod.logs import get_logger
+from zavod.meta import Dataset
+from zavod.runtime.issues import Issue
+
+log = get_logger(__name__)
+
+
+def hash_source(source: Path | bytes | str) -> str:
+    """Compute the fingerprint of a source file or of the fetched source data."""
+    digest = sha256()
+    if isinstance(source, Path):
+        with open(source, "rb") as fh:
+            while chunk := fh.read(1024 * 1024):
+                digest.update(chunk)
+    elif isinstance(source, str):
+        digest.update(source.encode("utf-8"))
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+
+def hash_code(dataset: Dataset, entry_point: Callable[[Any], None]) -> str:
+    """Compute the fingerprint of the code and metadata which a crawl's output
+    depends on, other than its sources."""
+    digest = sha256(zavod.__version__.encode("utf-8"))
+    metadata = orjson.dumps(dataset._data, option=orjson.OPT_SORT_KEYS, default=str)
+    digest.update(metadata)
+    file_name = inspect.getsourcefile(entry_point)
+    if file_name is not None:
+        digest.update(Path(file_name).read_bytes())
+    return digest.hexdigest()
+
+
+class DatasetSources:
+    """The fingerprints of the sources registered by a crawler in this run, to be
+    compared with those of its last successful run."""
+
+    def __init__(self, dataset: Dataset) -> None:
+        self.dataset = dataset
+        self.path = dataset_resource_path(dataset.name, SOURCES_FILE)
+        self.code: str | None = None
+        self.sources: dict[str, str] = {}
+        # The time of the last run in which the crawler was run in full:
+        self.time = settings.RUN_TIME_ISO
+        # The issues logged by the crawler in that run:
+        self.issues: list[Issue] | None = None
+
+    def add(self, name: str, source: Path | bytes | str) -> None:
+        self.sources[name] = hash_source(source)
+
+    def load_previous(self) -> dict[str, Any] | None:
+        obj = get_artifact_object(self.dataset.name, SOURCES_FILE)
+        if obj is None:
+            return None
+        with obj.open() as fh:
+            data: dict[str, Any] = orjson.loads(fh.read())
+        return data
+
+    def unchanged(self) -> bool:
+        """Check whether the registered sources, the code and the metadata of the
+        crawler are the same as in its last successful run."""
+        if self.code is None or not len(self.sources):
+            return False
+        previous = self.load_previous()
+        if previous is None:
+            log.info("No previous source fingerprints.")
+            return False
+        if previous.get("code") != self.code:
+            log.info("Crawler code or metadata has changed.")
+            return False
+        if previous.get("sources") != self.sources:
+            log.info("Sources have changed.", sources=len(self.sources))
+            return False
+        max_age = timedelta(days=settings.SOURCE_MAX_AGE)
+        min_time = (settings.RUN_TIME - max_age).isoformat(sep="T", timespec="seconds")
+        if previous.get("time", "") <= min_time:
+            log.info("Previous full run is too old.", time=previous.get("time"))
+            return False
+        self.time = previous["time"]
+        self.issues = previous.get("issues", [])
+        return True
+
+    def save(self, issues: Iterable[Issue]) -> None:
+        """Write the fingerprints to be archived with the run, or remove them if
+        the crawler didn't register any sources. The `issues` of the crawl are kept
+        unless it re-used those of a previous run."""
+        if self.code is None or not len(self.sources):
+            self.path.unlink(missing_ok=True)
+            return
+        if self.issues is None:
+            self.issues = list(issues)
+        data = {
+            "code": self.code,
+            "time": self.time,
+            "sources": self.sources,
+            "issues": self.issues,
+        }
+        self.path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
@@ -67,6 +67,11 @@ def get_entities_with_prop_facets(
     return facets
 
 
+def _add_counts[K](ours: dict[K, int], theirs: dict[K, int]) -> None:
+    for key, count in theirs.items():
+        ours[key] = ours.get(key, 0) + count
+
+
 class Statistics:
     def __init__(self) -> None:
         self.entity_count = 0
@@ -122,6 +127,27 @@ class Statistics:
             else:
                 self.last_change = max(self.last_change, entity.last_change)
 
+    def merge(self, other: "Statistics") -> None:
+        """Add the observations of another statistics object, e.g. one collected
+        on a shard of the entities by a worker process."""
+        self.entity_count += other.entity_count
+        self.schemata.update(other.schemata)
+        self.qnames.update(other.qnames)
+        self.thing_count += other.thing_count
+        self.target_count += other.target_count
+        _add_counts(self.entity_count_by_schema, other.entity_count_by_schema)
+        _add_counts(self.thing_countries, other.thing_countries)
+        _add_counts(self.thing_schemata, other.thing_schemata)
+        _add_counts(self.entities_with_prop_count, other.entities_with_prop_count)
+        _add_counts(self.target_countries, other.target_countries)
+        _add_counts(self.target_schemata, other.target_schemata)
+        _add_counts(self.sanctions_programs, other.sanctions_programs)
+        if other.last_change is not None:
+            if self.last_change is None:
+                self.last_change = other.last_change
+            else:
+                self.last_change = max(self.last_change, other.last_change)
+
     def as_dict(self) -> dict[str, Any]:
         return {
             "last_change": self.last_change,
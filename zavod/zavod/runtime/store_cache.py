@@ -0,0 +1,187 @@
+"""
+A host-wide cache of synced aggregator stores, shared between the enrichers and
+analyzers which read the same leaf datasets.
+
+A store's contents only depend on the statements of its leaf datasets and on the
+linker, not on the name of the scope it was built for. Cache entries are keyed
+by a digest of the leaf names, their statement versions and the linker
+fingerprint, so that two runs with the same inputs (e.g. two `scope_{hash}`
+collections of the same datasets) can use the same store.
+
+Entries are never opened in place: LevelDB only lets one process open a
+database. Instead, a store is checked out by hard-linking the entry's immutable
+table files into its own directory, which is cheap and leaves the entry intact
+when the store is later written to or compacted. Each checked out store holds a
+lease on its entry until it is closed; entries are evicted least recently used
+first once the cache exceeds `ZAVOD_STORE_CACHE_SIZE` gigabytes, skipping those
+with a live lease.
+"""
+
+import fcntl
+import os
+import shutil
+from collections.abc import Generator, Mapping
+from contextlib import contextmanager
+from hashlib import sha1
+from pathlib import Path
+from tempfile import mkdtemp
+
+from zavod import settings
+from zavod.logs import get_logger
+
+log = get_logger(__name__)
+# Bumped when the layout of the stores in the cache changes:
+CACHE_FORMAT = "1"
+LOCK_FILE = ".lock"
+LEASES_DIR = "leases"
+USED_FILE = "used"
+STORE_DIR = "store"
+_CACHE: "StoreCache | None" = None
+
+
+def link_tree(src: Path, dest: Path) -> None:
+    """Copy a LevelDB directory, hard-linking its table files. Table files are
+    never modified once written, so the copy can be used and changed independently
+    of the original. `src` must not be open for writing."""
+    shutil.rmtree(dest, ignore_errors=True)
+    dest.mkdir(parents=True)
+    for path in src.iterdir():
+        if path.name == "LOCK":
+            continue
+        target = dest / path.name
+        if path.suffix in (".ldb", ".sst"):
+            try:
+                os.link(path, target)
+                continue
+            except OSError:
+                pass
+        shutil.copy2(path, target)
+
+
+def store_cache_key(linker_id: bytes, versions: Mapping[str, bytes]) -> str:
+    """Identify the contents of a store by the statement versions of its leaf
+    datasets and the fingerprint of its linker."""
+    digest = sha1(CACHE_FORMAT.encode())
+    digest.update(linker_id)
+    for name, version in sorted(versions.items()):
+        digest.update(f"\0{name}:".encode())
+        digest.update(version)
+    return digest.hexdigest()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class StoreCache:
+    """A directory of store snapshots shared by the processes on a host."""
+
+    def __init__(self, path: Path, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _lock(self) -> Generator[None, None, None]:
+        """Serialize changes to the cache between processes."""
+        with open(self.path / LOCK_FILE, "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _entry(self, key: str) -> Path:
+        return self.path / key
+
+    def has(self, key: str) -> bool:
+        return self._entry(key).joinpath(USED_FILE).exists()
+
+    def checkout(self, key: str, dest: Path) -> Path | None:
+        """Copy the cached store into `dest` and lease the entry. Returns the lease,
+        to be passed to `release` once the store is closed, or None if the store
+        isn't cached."""
+        entry = self._entry(key)
+        with self._lock():
+            if not self.has(key):
+                return None
+            link_tree(entry / STORE_DIR, dest)
+            entry.joinpath(USED_FILE).touch()
+            leases = entry / LEASES_DIR
+            leases.mkdir(exist_ok=True)
+            lease = Path(mkdtemp(prefix=f"{os.getpid()}-", dir=leases))
+        log.info("Using cached store.", key=key, path=dest.as_posix())
+        return lease
+
+    def release(self, lease: Path) -> None:
+        shutil.rmtree(lease, ignore_errors=True)
+
+    def publish(self, key: str, src: Path) -> None:
+        """Add a copy of the store at `src`, which must not be open, to the cache."""
+        with self._lock():
+            if self.has(key):
+                return
+            entry = self._entry(key)
+            shutil.rmtree(entry, ignore_errors=True)
+            link_tree(src, entry / STORE_DIR)
+            entry.joinpath(USED_FILE).touch()
+            self.evict(keep=key)
+
+    def _leased(self, entry: Path) -> bool:
+        leases = entry / LEASES_DIR
+        if not leases.is_dir():
+            return False
+        leased = False
+        for lease in leases.iterdir():
+            pid = lease.name.split("-", 1)[0]
+            if pid.isdigit() and _pid_alive(int(pid)):
+                leased = True
+            else:
+                # Left behind by a process that didn't close its store:
+                shutil.rmtree(lease, ignore_errors=True)
+        return leased
+
+    def evict(self, keep: str | None = None) -> None:
+        """Delete the least recently used entries until the cache fits its size
+        limit. Entries which are leased by a store, and `keep`, are not deleted.
+        Must be called with the cache locked."""
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self.path.iterdir():
+            if not entry.is_dir():
+                continue
+            used = entry / USED_FILE
+            # Entries without a marker are incomplete, e.g. from an interrupted
+            # publish, and are treated as least recently used:
+            mtime = used.stat().st_mtime if used.exists() else 0.0
+            entries.append((mtime, _dir_size(entry), entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_size:
+                break
+            if entry.name == keep or self._leased(entry):
+                continue
+            log.info("Evicting cached store.", key=entry.name, size=size)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def get_store_cache() -> StoreCache | None:
+    """Get the store cache configured via `ZAVOD_STORE_CACHE_PATH`, if any."""
+    global _CACHE
+    if settings.STORE_CACHE_PATH is None:
+        return None
+    path = Path(settings.STORE_CACHE_PATH).resolve()
+    if _CACHE is None or _CACHE.path != path:
+        max_size = int(settings.STORE_CACHE_SIZE * 1024**3)
+        _CACHE = StoreCache(path, max_size)
+    return _CACHE
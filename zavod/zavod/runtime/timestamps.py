@@ -1,14 +1,45 @@
+import heapq
+import mmap
+import struct
+import orjson
 import plyvel  # type: ignore
 import shutil
-from collections.abc import Iterable
+from hashlib import sha1
+from pathlib import Path
+from typing import BinaryIO
+from collections.abc import Generator, Iterable, Iterator, Mapping
 from rigour.env import ENCODING as E
 from followthemoney import Statement
 
 from zavod.logs import get_logger
 from zavod.meta import Dataset
 from zavod.archive import dataset_state_path, iter_previous_statements
+from zavod.archive import TIMESTAMPS_FILE, get_artifact_object, get_previous_columns
+from zavod.archive import dataset_resource_path, iter_local_statements
+from zavod.archive.columns import StatementColumns
+from zavod.runtime.sort import SORT_BUFFER
 
 log = get_logger(__name__)
+Row = tuple[str | None, ...]
+
+
+def iter_previous_timestamps(dataset: Dataset) -> Generator[Row, None, None]:
+    """Yield (entity_id, statement_id, first_seen) for the non-external statements
+    of the previous release of the dataset."""
+    columns_path = get_previous_columns(dataset)
+    if columns_path is not None:
+        # Only decode the columns needed for the index:
+        try:
+            with StatementColumns(columns_path) as columns:
+                rows = columns.rows(("entity_id", "id", "first_seen", "external"))
+                for row in rows:
+                    if row[3] != "t":
+                        yield row[:3]
+        finally:
+            columns_path.unlink(missing_ok=True)
+        return
+    for stmt in iter_previous_statements(dataset, external=False):
+        yield stmt.entity_id, stmt.id, stmt.first_seen
 
 
 class TimeStampIndex:
@@ -24,17 +55,22 @@ class TimeStampIndex:
         )
 
     def index(self, statements: Iterable[Statement]) -> None:
+        rows = ((s.entity_id, s.id, s.first_seen) for s in statements)
+        self.index_rows(rows)
+
+    def index_rows(self, rows: Iterable[Row]) -> None:
+        """Index (entity_id, statement_id, first_seen) rows."""
         log.info("Building timestamp index...")
         batch = self.db.write_batch()
         batch_size = 0
         total_size = 0
-        for stmt in statements:
-            if stmt.first_seen is None or stmt.id is None or stmt.entity_id is None:
+        for entity_id, stmt_id, first_seen in rows:
+            if first_seen is None or stmt_id is None or entity_id is None:
                 continue
-            if len(stmt.first_seen.strip()) == 0:
+            if len(first_seen.strip()) == 0:
                 continue
-            key = f"{stmt.entity_id}:{stmt.id}"
-            batch.put(key.encode(E), stmt.first_seen.encode(E))
+            key = f"{entity_id}:{stmt_id}"
+            batch.put(key.encode(E), first_seen.encode(E))
             batch_size += 1
             total_size += 1
 
@@ -52,7 +88,7 @@ class TimeStampIndex:
     @classmethod
     def build(cls, dataset: Dataset) -> "TimeStampIndex":
         index = cls(dataset)
-        index.index(iter_previous_statements(dataset, external=False))
+        index.index_rows(iter_previous_timestamps(dataset))
         return index
 
     def get(self, entity_id: str) -> dict[str, str]:
@@ -73,3 +109,296 @@ class TimeStampIndex:
 
     def __repr__(self) -> str:
         return f"<TimeStampIndex({self.db.name!r})>"
+
+
+def _stmt_key(stmt_id: str) -> bytes:
+    # Statement IDs are SHA1 hex digests, stored as their 20 raw bytes. Any other
+    # ID is stored as its SHA1 digest.
+    if len(stmt_id) == 40:
+        try:
+            return bytes.fromhex(stmt_id)
+        except ValueError:
+            pass
+    return sha1(stmt_id.encode(E)).digest()
+
+
+class TimeStamps(Mapping[str, str]):
+    """The first_seen timestamps of the statements of an entity, by statement ID.
+    Lookups use the stored key of the statement ID (see `_stmt_key`)."""
+
+    def __init__(self) -> None:
+        self._stamps: dict[bytes, str] = {}
+
+    def add(self, stmt_key: bytes, stamp: str) -> None:
+        self._stamps[stmt_key] = stamp
+
+    def __getitem__(self, stmt_id: str) -> str:
+        return self._stamps[_stmt_key(stmt_id)]
+
+    def __iter__(self) -> Iterator[str]:
+        return (stmt_key.hex() for stmt_key in self._stamps)
+
+    def __len__(self) -> int:
+        return len(self._stamps)
+
+
+class TimeStampFile:
+    """A timestamp index stored as a sorted, compact binary file which is queried by
+    binary search over a memory map, instead of a LevelDB. Each statement is a
+    fixed-width record of its 20-byte ID and the ordinal of its first_seen value
+    in a table of the distinct timestamps. Records are grouped by entity, and the
+    entity IDs are kept in a sorted table with the offset of their first record.
+
+    Layout: `MAGIC`, the entity table (pairs of 64-bit offsets into the entity ID
+    blob and the records), the entity ID blob, the records, a JSON footer, the
+    footer offset as a 64-bit integer and `MAGIC` again.
+
+    Because the file is only mapped, not loaded, an index built at the end of a
+    crawl can be archived as an artifact (see `write_timestamps`): the next crawl
+    then backfills it and can look up timestamps right away, instead of scanning
+    all of the previous statements before its first emit."""
+
+    MAGIC = b"ZVSTAMP1"
+    BUFFER = 1024 * 1024
+    RECORD = struct.Struct("=20sI")
+    RUN_HEADER = struct.Struct("=II")
+    OFFSETS = struct.Struct("=QQ")
+
+    def __init__(self, dataset: Dataset, path: Path | None = None) -> None:
+        self.path = path or dataset_state_path(dataset.name) / TIMESTAMPS_FILE
+        self.path.unlink(missing_ok=True)
+        self.fh: BinaryIO | None = None
+        self.map: mmap.mmap | None = None
+        self.count = 0
+
+    def index(self, statements: Iterable[Statement]) -> None:
+        rows = ((s.entity_id, s.id, s.first_seen) for s in statements)
+        self.index_rows(rows)
+
+    def index_rows(self, rows: Iterable[Row]) -> None:
+        """Index (entity_id, statement_id, first_seen) rows."""
+        log.info("Building timestamp index...")
+        self._close()
+        work_path = self.path.with_name(f"{self.path.name}.tmp")
+        shutil.rmtree(work_path, ignore_errors=True)
+        work_path.mkdir(parents=True)
+        # Records are collected per entity, and spilled to a run file sorted by
+        # entity ID when the buffer is full. Only the entities need sorting.
+        stamps: dict[str, int] = {}
+        groups: dict[str, bytearray] = {}
+        runs: list[Path] = []
+        size = 0
+        pack_record = self.RECORD.pack
+        for entity_id, stmt_id, first_seen in rows:
+            if first_seen is None or stmt_id is None or entity_id is None:
+                continue
+            if len(first_seen.strip()) == 0:
+                continue
+            stamp = stamps.get(first_seen)
+            if stamp is None:
+                stamp = stamps[first_seen] = len(stamps)
+            group = groups.get(entity_id)
+            if group is None:
+                group = groups[entity_id] = bytearray()
+            group += pack_record(_stmt_key(stmt_id), stamp)
+            size += 1
+            if size >= SORT_BUFFER:
+                runs.append(self._spill(work_path, groups, len(runs)))
+                groups = {}
+                size = 0
+        if len(runs):
+            runs.append(self._spill(work_path, groups, len(runs)))
+            groups = {}
+
+        entities = 0
+        records = 0
+        names_size = 0
+        buffer = bytearray()
+        with (
+            open(work_path / "table", "wb") as table,
+            open(work_path / "names", "wb") as names,
+            open(work_path / "records", "wb") as recs,
+        ):
+            fhs = [open(run, "rb") for run in runs]
+            try:
+                if len(fhs):
+                    merged = heapq.merge(*[self._read_run(rfh) for rfh in fhs])
+                else:
+                    merged = (
+                        (e.encode(E), bytes(g)) for e, g in sorted(groups.items())
+                    )
+                last: bytes | None = None
+                for name, data in merged:
+                    if name != last:
+                        table.write(self.OFFSETS.pack(names_size, records))
+                        names.write(name)
+                        names_size += len(name)
+                        entities += 1
+                        last = name
+                    buffer += data
+                    records += len(data) // self.RECORD.size
+                    if len(buffer) > self.BUFFER:
+                        recs.write(buffer)
+                        buffer.clear()
+            finally:
+                for rfh in fhs:
+                    rfh.close()
+            recs.write(buffer)
+            table.write(self.OFFSETS.pack(names_size, records))
+
+        with open(self.path, "wb") as fh:
+            fh.write(self.MAGIC)
+            sections: dict[str, int] = {}
+            for section in ("table", "names", "records"):
+                sections[section] = fh.tell()
+                with open(work_path / section, "rb") as sfh:
+                    shutil.copyfileobj(sfh, fh)
+            footer = {
+                "entities": entities,
+                "records": records,
+                "sections": sections,
+                "stamps": list(stamps.keys()),
+            }
+            offset = fh.tell()
+            fh.write(orjson.dumps(footer))
+            fh.write(struct.pack("=Q", offset))
+            fh.write(self.MAGIC)
+        shutil.rmtree(work_path, ignore_errors=True)
+        self._open()
+        log.info("Index ready.", count=records)
+
+    def _spill(self, path: Path, groups: dict[str, bytearray], index: int) -> Path:
+        run_path = path / f"{index}.run"
+        with open(run_path, "wb") as fh:
+            for entity_id, group in sorted(groups.items()):
+                name = entity_id.encode(E)
+                fh.write(self.RUN_HEADER.pack(len(name), len(group)))
+                fh.write(name)
+                fh.write(group)
+        return run_path
+
+    def _read_run(self, fh: BinaryIO) -> Generator[tuple[bytes, bytes], None, None]:
+        while header := fh.read(self.RUN_HEADER.size):
+            name_size, group_size = self.RUN_HEADER.unpack(header)
+            yield fh.read(name_size), fh.read(group_size)
+
+    def _open(self) -> None:
+        fh = open(self.path, "rb")
+        map: mmap.mmap | None = None
+        try:
+            map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            magic = len(self.MAGIC)
+            tail = len(map) - magic
+            if map[:magic] != self.MAGIC or map[tail:] != self.MAGIC:
+                raise ValueError(f"Not a timestamp index: {self.path}")
+            (offset,) = struct.unpack("=Q", map[tail - 8 : tail])
+            try:
+                footer = orjson.loads(map[offset : tail - 8])
+                count = int(footer["entities"])
+                stamps: list[str] = list(footer["stamps"])
+                table, names, records = (
+                    int(footer["sections"][s]) for s in ("table", "names", "records")
+                )
+            except (KeyError, TypeError) as exc:
+                raise ValueError(f"Invalid timestamp index: {self.path}") from exc
+            # Check the sections before making views of them, which would keep the
+            # map from being closed:
+            table_size = (count + 1) * self.OFFSETS.size
+            if not magic <= table <= names <= records <= offset < tail:
+                raise ValueError(f"Invalid timestamp index: {self.path}")
+            if names - table != table_size:
+                raise ValueError(f"Invalid timestamp index: {self.path}")
+        except BaseException:
+            if map is not None:
+                map.close()
+            fh.close()
+            raise
+        self.fh, self.map = fh, map
+        self.count = count
+        self.stamps = stamps
+        # Zero-copy views of the sections of the file:
+        view = memoryview(self.map)
+        self.table = view[table:names].cast("Q")
+        self.names = view[names:records]
+        self.records = view[records:offset]
+
+    def _name(self, idx: int) -> bytes:
+        return self.names[self.table[idx * 2] : self.table[idx * 2 + 2]].tobytes()
+
+    def backfill(self, dataset: Dataset) -> bool:
+        """Fetch the index archived by the previous release of the dataset, if
+        there is one. Returns whether the index is ready to use."""
+        object = get_artifact_object(dataset.name, TIMESTAMPS_FILE)
+        if object is None:
+            return False
+        object.backfill(self.path)
+        try:
+            self._open()
+        except ValueError as exc:
+            log.warning("Invalid archived timestamp index", error=str(exc))
+            self.path.unlink(missing_ok=True)
+            return False
+        log.info("Using archived timestamp index.", object=object.name)
+        return True
+
+    @classmethod
+    def build(cls, dataset: Dataset) -> "TimeStampFile":
+        index = cls(dataset)
+        if not index.backfill(dataset):
+            index.index_rows(iter_previous_timestamps(dataset))
+        return index
+
+    def get(self, entity_id: str) -> TimeStamps:
+        timestamps = TimeStamps()
+        if self.map is None:
+            return timestamps
+        name = f"{entity_id}".encode(E)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.count or self._name(lo) != name:
+            return timestamps
+        size = self.RECORD.size
+        start = self.table[lo * 2 + 1] * size
+        end = self.table[lo * 2 + 3] * size
+        for stmt_key, stamp in self.RECORD.iter_unpack(self.records[start:end]):
+            timestamps.add(stmt_key, self.stamps[stamp])
+        return timestamps
+
+    def _close(self) -> None:
+        if self.map is not None:
+            # The views must be released before the map can be closed:
+            self.table.release()
+            self.names.release()
+            self.records.release()
+            self.map.close()
+            self.map = None
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def close(self) -> None:
+        self._close()
+        self.path.unlink(missing_ok=True)
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __repr__(self) -> str:
+        return f"<TimeStampFile({self.path.as_posix()!r})>"
+
+
+def write_timestamps(dataset: Dataset) -> Path:
+    """Index the timestamps of the statements written by the current crawl of the
+    dataset as an artifact, which the next crawl can backfill."""
+    path = dataset_resource_path(dataset.name, TIMESTAMPS_FILE)
+    index = TimeStampFile(dataset, path=path)
+    statements = iter_local_statements(dataset, external=False)
+    index.index_rows((s.entity_id, s.id, s.first_seen) for s in statements)
+    # Unmap the file, but keep it for publication:
+    index._close()
+    return path
@@ -0,0 +1,85 @@
+"""
+Pools of worker processes for the parallel stages of a run: indexing the store,
+exporting shards of it, running analyzers and scoring enrichment candidates.
+
+The parent process holds open LevelDB stores, database connections and threads,
+so workers are not forked from it. They are started by a fork server instead,
+and inherit none of the parent's state: the settings of the parent, the dataset
+modules it has loaded and the inputs of each job are passed to them explicitly.
+Large inputs, like the linker, are written to a file which each worker loads
+once (see `load_pickle`).
+"""
+
+import logging
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+from collections.abc import Callable
+
+from nomenklatura import settings as nk_settings
+
+from zavod import settings
+from zavod.logs import configure_logging
+from zavod.runtime.loader import get_module_files, load_module_file
+
+SETTINGS_MODULES: tuple[ModuleType, ...] = (settings, nk_settings)
+Settings = list[dict[str, Any]]
+
+
+def _get_settings() -> Settings:
+    return [
+        {k: v for k, v in vars(module).items() if k.isupper()}
+        for module in SETTINGS_MODULES
+    ]
+
+
+def _init_worker(
+    values: Settings,
+    level: int,
+    modules: dict[str, Path],
+    initializer: Callable[..., None] | None,
+    initargs: tuple[Any, ...],
+) -> None:
+    for module, module_values in zip(SETTINGS_MODULES, values):
+        for key, value in module_values.items():
+            setattr(module, key, value)
+    configure_logging(level)
+    # Functions defined in dataset modules are pickled by their module name:
+    for name, path in modules.items():
+        load_module_file(name, path)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def worker_pool(
+    workers: int,
+    initializer: Callable[..., None] | None = None,
+    initargs: tuple[Any, ...] = (),
+) -> ProcessPoolExecutor:
+    """Start a pool of worker processes with the settings of this process. The
+    `initializer` is called with `initargs` in each worker once it is set up."""
+    mp_context = multiprocessing.get_context("forkserver")
+    level = logging.getLogger().getEffectiveLevel()
+    args = (_get_settings(), level, get_module_files(), initializer, initargs)
+    return ProcessPoolExecutor(
+        workers, mp_context=mp_context, initializer=_init_worker, initargs=args
+    )
+
+
+def dump_pickle(obj: Any, path: Path) -> Path:
+    """Write an input of a job to a file, to be loaded by the workers."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as fh:
+        pickle.dump(obj, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+@lru_cache(maxsize=4)
+def load_pickle(path: Path) -> Any:
+    """Load an input of a job written by `dump_pickle`, once per worker."""
+    with open(path, "rb") as fh:
+        return pickle.load(fh)
@@ -63,6 +63,51 @@ ARCHIVE_BACKFILL_STATEMENTS = as_bool(
 )
 BACKFILL_RELEASE = env_str("ZAVOD_BACKFILL_RELEASE", "latest")
 
+# Also write the statements of a crawl as a columnar, block-indexed file, which
+# is faster to read than the statements pack (see `zavod.archive.columns`).
+STATEMENTS_COLUMNS = as_bool(env_str("ZAVOD_STATEMENTS_COLUMNS", "false"))
+
+# Backend of the index of previous statement timestamps used during a crawl:
+# `leveldb`, or `file` for a sorted binary file (see `TimeStampFile`).
+TIMESTAMP_INDEX = env_str("ZAVOD_TIMESTAMP_INDEX", "leveldb")
+# Also write the timestamp index of a crawl's own statements, to be archived with
+# them. The next crawl then backfills the index instead of building it, if it
+# uses the `file` backend.
+TIMESTAMP_ARCHIVE = as_bool(env_str("ZAVOD_TIMESTAMP_ARCHIVE", "false"))
+# Number of days for which a crawler may re-use the statements of its previous run
+# when its sources are unchanged (see `Context.skip_if_unchanged`), after which it
+# is run in full again. With 0, crawlers are always run in full.
+SOURCE_MAX_AGE = int(env.get("ZAVOD_SOURCE_MAX_AGE", 7))
+
+# Number of worker processes used to decode leaf dataset statements when building
+# the aggregator store. With 1, statements are indexed in the main process.
+STORE_WORKERS = int(env.get("ZAVOD_STORE_WORKERS", 1))
+# Directory of a cache of synced aggregator stores which is shared by all runs on
+# the host that read the same leaf datasets (see `zavod.runtime.store_cache`).
+# Disabled when unset. Least recently used stores are evicted beyond the cache
+# size, in gigabytes.
+STORE_CACHE_PATH = env.get("ZAVOD_STORE_CACHE_PATH", None)
+STORE_CACHE_SIZE = float(env.get("ZAVOD_STORE_CACHE_SIZE", 100))
+# Number of worker processes used to export a dataset, each of which traverses
+# a range of the entities in the store. With 1, the export runs in the main process.
+EXPORT_WORKERS = int(env.get("ZAVOD_EXPORT_WORKERS", 1))
+# Number of worker processes used by `zavod.runner.analyze` to run an analyzer, each
+# over a range of the entities in the store. With 1, the analyzer runs in the main process.
+ANALYZER_WORKERS = int(env.get("ZAVOD_ANALYZER_WORKERS", 1))
+# Number of worker processes used by the local enricher to score the candidates
+# of subject entities. With 1, candidates are scored in the main process.
+ENRICH_WORKERS = int(env.get("ZAVOD_ENRICH_WORKERS", 1))
+# Feed the exporters from per-exporter worker threads, each reading from a bounded
+# queue of entities, so that slow exporters overlap with the store traversal.
+EXPORT_PIPELINE = as_bool(env_str("ZAVOD_EXPORT_PIPELINE", "false"))
+# Number of entities each exporter may lag behind the traversal in pipelined mode.
+EXPORT_QUEUE_SIZE = int(env.get("ZAVOD_EXPORT_QUEUE_SIZE", 1000))
+
+# Algorithm used to hash entities for the delta export: `sha1` (the original format)
+# or `xxh3`. When changed, the next export compares against the previous version's
+# hashes using its algorithm, and publishes hashes made with the new one.
+DELTA_HASH = env_str("ZAVOD_DELTA_HASH", "sha1")
+
 # HTTP settings
 # Connect and read timeout in seconds for the context HTTP session. Can be
 # overridden per-dataset via the `http.timeout` metadata option.
@@ -78,11 +123,24 @@ HTTP_RETRY_TOTAL = int(env.get("ZAVOD_HTTP_RETRY_TOTAL", 3))
 HTTP_RETRY_BACKOFF_FACTOR = float(env.get("ZAVOD_HTTP_RETRY_BACKOFF_FACTOR", 1.0))
 # urllib.util.Retry.DEFAULT_BACKOFF_MAX is 120
 HTTP_RETRY_BACKOFF_MAX = int(env.get("ZAVOD_HTTP_RETRY_BACKOFF_MAX", 120))
+# Concurrent requests to a single host made by `Context.fetch_many`. Can be
+# overridden per-dataset via the `http.concurrency` metadata option.
+HTTP_CONCURRENCY = int(env.get("ZAVOD_HTTP_CONCURRENCY", 4))
+# Threads used by `Context.fetch_many` across all hosts.
+HTTP_FETCH_WORKERS = int(env.get("ZAVOD_HTTP_FETCH_WORKERS", 16))
+# Directory in which copies of the files fetched by `Context.fetch_resource` are
+# kept with their HTTP validators (ETag, Last-Modified), to be re-used by later
+# runs if the server reports them unchanged. Unset by default, which disables it.
+# Files are not evicted from it, so it should be cleaned up by the deployment.
+HTTP_FILE_CACHE_PATH = env.get("ZAVOD_HTTP_FILE_CACHE_PATH", None)
 
 # Database-backed cache settings
 nk.DB_URL = f"sqlite:///{DATA_PATH.joinpath('zavod.sqlite3').as_posix()}"
 nk.DB_URL = env.get("ZAVOD_DATABASE_URI", nk.DB_URL)
 nk.DB_URL = env.get("OPENSANCTIONS_DATABASE_URI", nk.DB_URL)
+# Keep a local copy of each dataset's cache entries in its state directory, in
+# front of the cache table in the database (see `zavod.runtime.cache`).
+CACHE_LOCAL = as_bool(env_str("ZAVOD_CACHE_LOCAL", "false"))
 
 ZYTE_API_KEY = env.get("OPENSANCTIONS_ZYTE_API_KEY", None)
 OPENAI_API_KEY = env.get("OPENAI_API_KEY", None)
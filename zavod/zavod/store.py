@@ -1,18 +1,101 @@
+import pickle
 import shutil
+from collections.abc import Generator, Iterable
+from hashlib import sha1
+from pathlib import Path
+from tempfile import mkdtemp
+import orjson
 import plyvel  # type: ignore
 from followthemoney.exc import InvalidData
-from followthemoney import Statement
+from followthemoney import Statement, registry
+from followthemoney.statement.util import get_prop_type
+from rigour.env import ENCODING as E
 from nomenklatura.resolver import Linker
-from nomenklatura.store.level import LevelDBStore, LevelDBView
+from nomenklatura import settings as nk_settings
+from nomenklatura.store.level import LevelDBStore, LevelDBView, unpack_statement
 
+from zavod import settings
 from zavod.logs import get_logger
 from zavod.entity import Entity
 from zavod.meta import Dataset
-from zavod.archive import dataset_state_path
-from zavod.archive import iter_dataset_statements
+from zavod.archive import dataset_state_path, STORE_DIR
+from zavod.archive import iter_dataset_statements, get_statements_version
+from zavod.runtime.store_cache import StoreCache, get_store_cache, link_tree
+from zavod.runtime.store_cache import store_cache_key
+from zavod.runtime.workers import dump_pickle, load_pickle, worker_pool
 
 log = get_logger(__name__)
 View = LevelDBView[Dataset, Entity]
+LEAF_PREFIX = b"leaf:"
+LINKER_KEY = b"linker"
+# Number of store rows a worker sorts and spills to disk in one run:
+SPILL_ROWS = 200_000
+# Sample every n-th statement key when partitioning the store into key ranges:
+RANGE_SAMPLE = 1_000
+
+
+def linker_fingerprint(linker: Linker[Entity]) -> bytes:
+    """Compute an order-independent digest of the entity ID mappings in a linker,
+    used to tell if the canonical IDs in a store are still valid."""
+    digest = 0
+    for canonical in linker.canonicals():
+        for referent in linker.get_referents(canonical.id):
+            pair = sha1(f"{referent}:{canonical.id}".encode()).digest()
+            digest ^= int.from_bytes(pair)
+    return digest.to_bytes(20).hex().encode()
+
+
+def _statement_rows(
+    linker: Linker[Entity], stmt: Statement
+) -> list[tuple[bytes, bytes]]:
+    """Generate the LevelDB keys and values for a statement, mirroring the
+    encoding used by `LevelDBWriter.add_statement`."""
+    canonical_id = linker.get_canonical(stmt.entity_id)
+    ext = "x" if stmt.external else ""
+    key = f"s:{canonical_id}:{ext}:{stmt.dataset}:{stmt.schema}:{stmt.id}"
+    values = (
+        stmt.entity_id,
+        stmt.prop,
+        stmt.value,
+        stmt.lang or 0,
+        stmt.original_value or 0,
+        stmt.origin or 0,
+        stmt.first_seen,
+        stmt.last_seen,
+    )
+    rows = [(key.encode(E), orjson.dumps(values))]
+    if get_prop_type(stmt.schema, stmt.prop) == registry.entity.name:
+        vc = linker.get_canonical(stmt.value)
+        rows.append((f"i:{vc}:{canonical_id}".encode(E), b""))
+    return rows
+
+
+def _spill_leaf(args: tuple[Dataset, Path, Path]) -> list[Path]:
+    """Worker process: decode the statements of a leaf dataset into sorted runs of
+    store keys and values, written to the spill directory."""
+    leaf, linker_path, spill_path = args
+    linker: Linker[Entity] = load_pickle(linker_path)
+    name = leaf.name
+    runs: list[Path] = []
+    rows: list[tuple[bytes, bytes]] = []
+
+    def _spill() -> None:
+        rows.sort()
+        run_path = spill_path / f"{name}.{len(runs)}.pickle"
+        with open(run_path, "wb") as fh:
+            pickle.dump(rows, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        runs.append(run_path)
+        rows.clear()
+
+    for stmt in iter_dataset_statements(leaf, external=True):
+        if stmt.entity_id is None:
+            continue
+        rows.extend(_statement_rows(linker, stmt))
+        if len(rows) >= SPILL_ROWS:
+            _spill()
+    if len(rows):
+        _spill()
+    return runs
 
 
 def get_store(dataset: Dataset, linker: Linker[Entity]) -> "Store":
@@ -25,10 +108,13 @@ class Store(LevelDBStore[Dataset, Entity]):
         self,
         dataset: Dataset,
         linker: Linker[Entity],
+        path: Path | None = None,
     ):
-        path = dataset_state_path(dataset.name) / "store"
+        if path is None:
+            path = dataset_state_path(dataset.name) / STORE_DIR
         super().__init__(dataset, linker, path)
         self.entity_class = Entity
+        self._lease: tuple[StoreCache, Path] | None = None
 
     def view(self, scope: Dataset, external: bool = False) -> View:
         return LevelDBView(self, scope, external=external)
@@ -47,35 +133,288 @@ class Store(LevelDBStore[Dataset, Entity]):
         return entity
 
     def sync(self, clear: bool = False) -> None:
+        """Bring the store up to date with the statements of the leaf datasets in
+        scope. The store records which version of its statements each leaf was
+        indexed from, so that only leaves which were added, removed or re-published
+        since the last sync need to be dropped and re-indexed. A change to the
+        linker affects the canonical IDs of all statements and forces a rebuild.
+        If a store cache is configured, a store with the same contents is checked
+        out from the cache rather than rebuilt, and rebuilt stores are added to it."""
+        linker_id = linker_fingerprint(self.linker)
+        stored_id = self.db.get(LINKER_KEY)
+        if stored_id != linker_id:
+            if stored_id is not None and not clear:
+                log.info(
+                    "Linker has changed, rebuilding store.", scope=self.dataset.name
+                )
+            clear = True
         if clear:
             self.clear()
-        ds_key = f"dataset:{self.dataset.name}".encode()
-        if self.db.get(ds_key):
+            self.db.put(LINKER_KEY, linker_id)
+
+        indexed: dict[str, bytes] = {}
+        with self.db.iterator(prefix=LEAF_PREFIX) as it:
+            for key, value in it:
+                indexed[key[len(LEAF_PREFIX) :].decode()] = value
+        leaves = sorted(self.dataset.leaves, key=lambda d: d.name)
+        versions: dict[str, bytes] = {}
+        for leaf in leaves:
+            version = get_statements_version(leaf)
+            if version is None:
+                log.error(f"Cannot load statements for: {leaf.name}")
+                continue
+            versions[leaf.name] = version.encode()
+        stale = {n for n, v in indexed.items() if versions.get(n) != v}
+        pending = [
+            ds
+            for ds in leaves
+            if ds.name in versions and indexed.get(ds.name) != versions[ds.name]
+        ]
+        if not len(pending) and not len(stale):
+            return
+
+        cache = get_store_cache()
+        cache_key = store_cache_key(linker_id, versions)
+        if cache is not None and self._checkout(cache, cache_key):
             return
-        log.info("Building local LevelDB aggregator...", scope=self.dataset.name)
+        if len(stale):
+            self._drop_leaves(stale)
+        log.info(
+            "Building local LevelDB aggregator...",
+            scope=self.dataset.name,
+            leaves=len(pending),
+            unchanged=len(leaves) - len(pending),
+        )
+        workers = min(settings.STORE_WORKERS, len(pending))
+        if workers > 1:
+            count = self._ingest_parallel(pending, versions, workers)
+        else:
+            count = self._ingest(pending, versions)
+        self.optimize()
+        log.info(
+            "Local LevelDB aggregator is ready.",
+            scope=self.dataset.name,
+            statements=count,
+        )
+        if cache is not None:
+            self.db.close()
+            try:
+                cache.publish(cache_key, self.path)
+            finally:
+                self.db = self._open_db()
+
+    def _checkout(self, cache: StoreCache, key: str) -> bool:
+        """Replace the contents of the store with a copy of a cached store, if
+        there is one for the given key."""
+        self.db.close()
+        try:
+            lease = cache.checkout(key, self.path)
+        finally:
+            self.db = self._open_db()
+        if lease is None:
+            return False
+        self._release()
+        self._lease = (cache, lease)
+        return True
+
+    def _release(self) -> None:
+        if self._lease is not None:
+            cache, lease = self._lease
+            cache.release(lease)
+        self._lease = None
+
+    def _ingest(self, leaves: list[Dataset], versions: dict[str, bytes]) -> int:
         idx = 0
         with self.writer() as writer:
-            stmts = iter_dataset_statements(self.dataset, external=True)
-            for idx, stmt in enumerate(stmts):
-                if idx > 0 and idx % 50_000 == 0:
+            for leaf in leaves:
+                # Mark the leaf as incomplete, so that an interrupted sync is
+                # cleaned up the next time around:
+                leaf_key = LEAF_PREFIX + leaf.name.encode()
+                self.db.put(leaf_key, b"")
+                for stmt in iter_dataset_statements(leaf, external=True):
+                    if idx > 0 and idx % 50_000 == 0:
+                        log.info(
+                            "Indexing aggregator...",
+                            statements=idx,
+                            scope=self.dataset.name,
+                            leaf=stmt.dataset,
+                        )
+                    writer.add_statement(stmt)
+                    idx += 1
+                writer.flush()
+                self.db.put(leaf_key, versions[leaf.name])
+        return idx
+
+    def _ingest_parallel(
+        self, leaves: list[Dataset], versions: dict[str, bytes], workers: int
+    ) -> int:
+        """Decode the statements of each leaf in a pool of worker processes. The
+        workers spill sorted runs of LevelDB keys and values to disk, so that the
+        parent process only needs to write them in bulk."""
+        spill_path = Path(
+            mkdtemp(prefix="ingest-", dir=dataset_state_path(self.dataset.name))
+        )
+        names = [leaf.name for leaf in leaves]
+        for name in names:
+            self.db.put(LEAF_PREFIX + name.encode(), b"")
+        idx = 0
+        try:
+            linker_path = dump_pickle(self.linker, spill_path / "linker.pickle")
+            with worker_pool(workers) as executor:
+                spill_args = [(leaf, linker_path, spill_path) for leaf in leaves]
+                for name, runs in zip(names, executor.map(_spill_leaf, spill_args)):
+                    for run_path in runs:
+                        with open(run_path, "rb") as fh:
+                            rows: list[tuple[bytes, bytes]] = pickle.load(fh)
+                        with self.db.write_batch() as batch:
+                            for key, value in rows:
+                                batch.put(key, value)
+                        idx += sum(1 for k, _ in rows if k.startswith(b"s:"))
+                        run_path.unlink()
+                    self.db.put(LEAF_PREFIX + name.encode(), versions[name])
                     log.info(
-                        "Indexing aggregator...",
+                        "Indexed leaf dataset.",
                         statements=idx,
                         scope=self.dataset.name,
-                        leaf=stmt.dataset,
+                        leaf=name,
                     )
-                writer.add_statement(stmt)
-        self.db.put(ds_key, b"1")
-        self.optimize()
-        log.info(
-            "Local LevelDB aggregator is ready.",
-            scope=self.dataset.name,
-            statements=idx,
+        finally:
+            shutil.rmtree(spill_path, ignore_errors=True)
+        return idx
+
+    def _drop_leaves(self, names: set[str]) -> None:
+        """Remove the statements of the given leaf datasets from the store. Inverted
+        index keys are kept, since they are shared between datasets and a stale key
+        is ignored by `View.get_inverted`."""
+        log.info("Dropping outdated leaves from store...", leaves=sorted(names))
+        batch = self.db.write_batch()
+        dropped = 0
+        with self.db.iterator(prefix=b"s:", include_value=False) as it:
+            for key in it:
+                dataset = key.split(b":", 4)[3].decode()
+                if dataset not in names:
+                    continue
+                batch.delete(key)
+                dropped += 1
+                if dropped % 100_000 == 0:
+                    batch.write()
+                    batch = self.db.write_batch()
+        for name in names:
+            batch.delete(LEAF_PREFIX + name.encode())
+        batch.write()
+        log.info("Dropped outdated statements.", statements=dropped)
+
+    def key_ranges(self, count: int) -> list[tuple[bytes, bytes]]:
+        """Partition the statement keys of the store into up to `count` contiguous
+        ranges of roughly equal size. Range boundaries always fall between two
+        entities, so each range can be traversed independently using
+        `iter_range_entities`."""
+        samples: list[bytes] = []
+        with self.db.iterator(prefix=b"s:", include_value=False) as it:
+            for idx, key in enumerate(it):
+                if idx % RANGE_SAMPLE == 0:
+                    canonical_id = key.split(b":", 2)[1]
+                    samples.append(b"s:" + canonical_id + b":")
+        bounds: list[bytes] = [b"s:"]
+        for part in range(1, count):
+            bound = samples[(len(samples) * part) // count] if samples else b""
+            if bound > bounds[-1]:
+                bounds.append(bound)
+        bounds.append(b"s;")
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def content_key(self) -> str:
+        """Identify the contents of the synced store by the versions of its leaf
+        datasets and its linker, like the keys of the store cache."""
+        linker_id = self.db.get(LINKER_KEY) or b""
+        versions: dict[str, bytes] = {}
+        with self.db.iterator(prefix=LEAF_PREFIX) as it:
+            for key, value in it:
+                versions[key[len(LEAF_PREFIX) :].decode()] = value
+        return store_cache_key(linker_id, versions)
+
+    def snapshot(self, path: Path) -> None:
+        """Make a copy of the store at the given path, which can be opened as a
+        separate `Store` by another process. Table files are immutable in LevelDB,
+        so they are hard-linked instead of being copied."""
+        self.db.close()
+        try:
+            link_tree(self.path, path)
+        finally:
+            self.db = self._open_db()
+
+    def _open_db(self) -> plyvel.DB:
+        return plyvel.DB(
+            self.path.as_posix(),
+            create_if_missing=True,
+            max_open_files=nk_settings.LEVELDB_MAX_FILES,
+            write_buffer_size=self.buffer_size,
+            lru_cache_size=self.buffer_size,
         )
 
+    def close(self) -> None:
+        self._release()
+        super().close()
+
     def clear(self) -> None:
         """Delete the working directory data for the latest version of the dataset
         from this store."""
+        self._release()
         self.db.close()
         shutil.rmtree(self.path, ignore_errors=True)
-        self.db = plyvel.DB(self.path.as_posix(), create_if_missing=True)
+        self.db = self._open_db()
+
+
+def get_entities(view: View, ids: Iterable[str]) -> dict[str, Entity]:
+    """Fetch a batch of entities from a view. The IDs are looked up in key order
+    using a single store iterator, rather than one iterator per entity as in
+    `View.get_entity`. Entities which aren't in the view are left out."""
+    entities: dict[str, Entity] = {}
+    prefixes = sorted((f"s:{id}:".encode(E), id) for id in set(ids))
+    with view.store.db.iterator() as it:
+        for prefix, id in prefixes:
+            it.seek(prefix)
+            statements: list[Statement] = []
+            for k, v in it:
+                if not k.startswith(prefix):
+                    break
+                keys = k.decode(E).split(":")
+                _, _, ext, dataset, _, _ = keys
+                if dataset not in view.dataset_names:
+                    continue
+                if ext == "x" and not view.external:
+                    continue
+                statements.append(unpack_statement(keys, v))
+            entity = view.store.assemble(statements)
+            if entity is not None:
+                entities[id] = entity
+    return entities
+
+
+def iter_range_entities(
+    view: View, start: bytes, stop: bytes
+) -> Generator[Entity, None, None]:
+    """Iterate over the entities in a view whose statement keys fall into one of
+    the ranges produced by `Store.key_ranges`."""
+    current_id: str | None = None
+    statements: list[Statement] = []
+    with view.store.db.iterator(start=start, stop=stop, fill_cache=False) as it:
+        for k, v in it:
+            keys = k.decode(E).split(":")
+            _, canonical_id, ext, dataset, _, _ = keys
+            if ext == "x" and not view.external:
+                continue
+            if dataset not in view.dataset_names:
+                continue
+            if canonical_id != current_id:
+                if len(statements):
+                    entity = view.store.assemble(statements)
+                    if entity is not None:
+                        yield entity
+                current_id = canonical_id
+                statements = []
+            statements.append(unpack_statement(keys, v))
+    if len(statements):
+        entity = view.store.assemble(statements)
+        if entity is not None:
+            yield entity
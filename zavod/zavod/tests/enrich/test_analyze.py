@@ -0,0 +1,58 @@
+from followthemoney.statement.serialize import read_pack_statements_decoded
+
+from zavod.archive import STATEMENTS_FILE, dataset_resource_path
+from zavod.context import Context
+from zavod.crawl import crawl_dataset
+from zavod.entity import Entity
+from zavod.integration import get_dataset_linker
+from zavod.meta import Dataset
+from zavod.runner.analyze import run_analyzer
+from zavod.store import View, get_store
+
+
+def tag_entity(context: Context, view: View, entity: Entity) -> None:
+    if not entity.schema.is_a("LegalEntity"):
+        return
+    if len(list(view.get_adjacent(entity))):
+        # Written directly, since the issue log processor needs configured logging:
+        event = {"level": "warning", "event": "Adjacent entities", "entity": entity.id}
+        context.issues.write(event)
+    patch = context.make(entity.schema)
+    patch.id = entity.id
+    patch.add("topics", "poi", origin="test")
+    context.emit(patch, external=entity.schema.is_a("Person"))
+
+
+def _analyze(
+    analyzer: Dataset, testdataset1: Dataset, workers: int
+) -> tuple[list[tuple[str, ...]], int]:
+    linker = get_dataset_linker(testdataset1)
+    store = get_store(testdataset1, linker)
+    store.sync()
+    view = store.view(testdataset1, external=True)
+    context = Context(analyzer)
+    context.begin(clear=True)
+    try:
+        run_analyzer(context, view, tag_entity, workers=workers)
+        assert context.stats.entities > 0
+    finally:
+        context.close()
+        store.close()
+    path = dataset_resource_path(analyzer.name, STATEMENTS_FILE)
+    with open(path) as fh:
+        rows = [
+            (s.entity_id, s.prop, s.value, s.origin or "", str(s.external))
+            for s in read_pack_statements_decoded(fh)
+        ]
+    return rows, len(list(context.issues.all()))
+
+
+def test_run_analyzer_parallel(analyzer: Dataset, testdataset1: Dataset):
+    crawl_dataset(testdataset1)
+    serial, serial_issues = _analyze(analyzer, testdataset1, 1)
+    assert len(serial) > 5
+    assert ("osv-john-doe", "topics", "poi", "test", "True") in serial
+    assert serial_issues > 0
+    parallel, parallel_issues = _analyze(analyzer, testdataset1, 3)
+    assert parallel == serial
+    assert parallel_issues == serial_issues
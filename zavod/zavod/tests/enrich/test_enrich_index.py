@@ -0,0 +1,98 @@
+from unittest.mock import patch
+
+from followthemoney.dataset import Version
+
+from zavod.archive import DELTA_EXPORT_FILE, ENRICH_INDEX_FILE
+from zavod.archive import archive_artifact, dataset_resource_path, dataset_state_path
+from zavod.crawl import crawl_dataset
+from zavod.integration import get_dataset_linker
+from zavod.meta import Dataset
+from zavod.runner import enrich_index
+from zavod.runner.enrich_index import EnrichIndex
+from zavod.runtime.versions import get_latest
+from zavod.store import get_store
+
+ENRICHER = Dataset({"name": "test_index_enricher", "title": "Enricher"})
+
+
+def _load_index(target: Dataset) -> EnrichIndex:
+    store = get_store(target, get_dataset_linker(target))
+    store.sync()
+    path = dataset_state_path(target.name) / "enrich-index"
+    return EnrichIndex(store.view(target), path, {}, ENRICHER, target)
+
+
+def _entry_ids(index: EnrichIndex) -> list[str]:
+    rows = index.con.execute("SELECT DISTINCT id FROM entries ORDER BY id")
+    return [r[0] for r in rows.fetchall()]
+
+
+def _entries(index: EnrichIndex) -> list[tuple[str, str, str, str, int]]:
+    rows = index.con.execute("SELECT * FROM entries ORDER BY ALL")
+    return rows.fetchall()
+
+
+def test_enrich_index_versions(testdataset1: Dataset):
+    crawl_dataset(testdataset1)
+    latest = get_latest(testdataset1.name)
+    assert latest is not None
+    index = _load_index(testdataset1)
+    index.build()
+    assert index.get_meta("version") == latest.id
+    ids = _entry_ids(index)
+    assert "osv-john-doe" in ids
+
+    # An index of the current target version is re-used:
+    with patch.object(index, "load_entities", side_effect=AssertionError):
+        index.build()
+
+    # Archive the index, and restore it when the local copy is gone:
+    index.con.execute("CREATE TABLE matching (id TEXT)")
+    index.archive()
+    assert not index._has_table("matching")
+    index.close()
+    index.view.store.close()
+    assert dataset_resource_path(ENRICHER.name, ENRICH_INDEX_FILE).exists()
+    dataset_state_path(testdataset1.name).joinpath("enrich-index").joinpath(
+        enrich_index.INDEX_FILE
+    ).unlink()
+    index = _load_index(testdataset1)
+    assert index.get_meta("version") == latest.id
+    assert _entry_ids(index) == ids
+
+    # Apply the delta of a newer target version:
+    index.set_meta("version", "20000101000000-old")
+    index.con.execute("INSERT INTO entries VALUES ('Person', 'osv-gone', 'w', 'x', 1)")
+    other = next(e for e in index.view.entities() if not e.schema.matchable)
+    delta = dataset_resource_path(testdataset1.name, DELTA_EXPORT_FILE)
+    delta.write_text(
+        '{"op": "DEL", "entity": {"id": "osv-gone"}}\n'
+        '{"op": "MOD", "entity": {"id": "osv-john-doe"}}\n'
+        f'{{"op": "MOD", "entity": {{"id": "{other.id}"}}}}\n'
+    )
+    archive_artifact(delta, testdataset1.name, latest, DELTA_EXPORT_FILE)
+    versions = [latest, Version.from_string("20000101000000-old")]
+    with patch.object(enrich_index, "iter_dataset_versions", return_value=versions):
+        index.build()
+    assert index.get_meta("version") == latest.id
+    assert _entry_ids(index) == ids
+    updated = _entries(index)
+
+    # Without the delta of one of the versions, the index is rebuilt:
+    index.set_meta("version", "20000101000000-old")
+    versions = [latest, Version.from_string("20010101000000-mid"), versions[1]]
+    with patch.object(enrich_index, "iter_dataset_versions", return_value=versions):
+        with patch.object(index, "update", side_effect=AssertionError):
+            index.build()
+    assert index.get_meta("version") == latest.id
+    assert _entries(index) == updated
+
+    # An index built with another linker is rebuilt, even for the same version:
+    assert index.get_meta("linker") == index.linker_id()
+    index.set_meta("linker", "other")
+    with patch.object(index, "update", side_effect=AssertionError):
+        index.build()
+    assert index.get_meta("linker") == index.linker_id()
+    assert _entry_ids(index) == ids
+    index.close()
+    index.view.store.close()
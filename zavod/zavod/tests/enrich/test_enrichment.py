@@ -1,15 +1,19 @@
 from collections.abc import Generator
+from pathlib import Path
+from unittest.mock import patch
 
-from followthemoney import SE
+from followthemoney import SE, Statement
 from nomenklatura.enrich import Enricher
 from nomenklatura.judgement import Judgement
 from normality import slugify
 
-from zavod.archive import iter_dataset_statements
+from zavod import settings
+from zavod.archive import get_versions_data, iter_dataset_statements
 from zavod.crawl import crawl_dataset
 from nomenklatura.db import make_session
 from zavod.integration.dedupe import get_resolver
 from zavod.meta import Dataset
+from zavod.publish import publish_dataset
 
 
 class StubEnricher(Enricher):
@@ -87,3 +91,97 @@ def test_enrich_process(testdataset1: Dataset, enricher: Dataset):
     }
     assert "enrich-john-doe-relative" in external_ids
     assert "enrich-john-doe-family" in external_ids
+
+
+def test_enrich_incremental(testdataset1: Dataset, enricher: Dataset):
+    enricher.config["incremental"] = True
+    crawl_dataset(testdataset1)
+    crawl_dataset(enricher)
+    # The checksums of the entities are left out, since they are computed from the
+    # IDs of their statements as emitted by the enricher:
+    first = sorted(
+        (s.entity_id, s.prop, s.value, s.external)
+        for s in iter_dataset_statements(enricher)
+        if s.prop != Statement.BASE
+    )
+    assert len(first) > 5, first
+    publish_dataset(enricher)
+    get_versions_data.cache_clear()
+
+    # Unchanged subjects re-use the matches of the previous run:
+    with patch.object(StubEnricher, "match", side_effect=AssertionError):
+        crawl_dataset(enricher)
+    second = sorted(
+        (s.entity_id, s.prop, s.value, s.external)
+        for s in iter_dataset_statements(enricher)
+        if s.prop != Statement.BASE
+    )
+    assert second == first
+
+    # Judgements made since the previous run apply to the re-used matches:
+    with make_session() as session:
+        resolver = get_resolver(session)
+        resolver.load_into_memory()
+        resolver.decide("osv-john-doe", "enrich-john-doe", Judgement.NEGATIVE)
+    with patch.object(StubEnricher, "match", side_effect=AssertionError):
+        crawl_dataset(enricher)
+    ids = {s.entity_id for s in iter_dataset_statements(enricher)}
+    assert "enrich-john-doe" not in ids
+    assert "enrich-hans-gruber" in ids
+
+    # So are all subjects once the matching config changes:
+    enricher.config["cutoff"] = 0.1
+    with patch.object(
+        StubEnricher, "match", autospec=True, side_effect=StubEnricher.match
+    ) as match:
+        crawl_dataset(enricher)
+    assert match.call_count > 5
+    del enricher.config["cutoff"]
+
+    # Subjects whose matches are too old are matched again:
+    enricher.config["incremental_max_age"] = -1
+    with patch.object(
+        StubEnricher, "match", autospec=True, side_effect=StubEnricher.match
+    ) as match:
+        crawl_dataset(enricher)
+    assert match.call_count > 5
+    ids = {s.entity_id for s in iter_dataset_statements(enricher)}
+    assert "enrich-hans-gruber" in ids
+
+
+def test_enrich_concurrent(
+    testdataset1: Dataset, enricher: Dataset, tmp_path: Path, monkeypatch
+):
+    # Connections to in-memory SQLite databases can't be used from other threads:
+    db_url = f"sqlite:///{tmp_path.joinpath('zavod.sqlite3').as_posix()}"
+    monkeypatch.setattr(settings.nk, "DB_URL", db_url)
+    crawl_dataset(testdataset1)
+    crawl_dataset(enricher)
+    sequential = sorted(
+        (s.entity_id, s.prop, s.value, s.external)
+        for s in iter_dataset_statements(enricher)
+        if s.prop != Statement.BASE
+    )
+
+    match = StubEnricher.match
+
+    def cached_match(self: StubEnricher, entity: SE) -> Generator[SE, None, None]:
+        # The worker threads share the enricher's cache:
+        self.cache.set(f"match:{entity.id}", entity.id)
+        assert self.cache.get(f"match:{entity.id}") == entity.id
+        assert self.cache.has(f"match:{entity.id}")
+        self.cache.set_json(f"json:{entity.id}", [entity.id])
+        assert self.cache.get_json(f"json:{entity.id}") == [entity.id]
+        assert not hasattr(self.cache, "_session")
+        yield from match(self, entity)
+
+    enricher.config["concurrency"] = 4
+    enricher.config["rate_limit"] = 1000
+    with patch.object(StubEnricher, "match", cached_match):
+        crawl_dataset(enricher)
+    concurrent = sorted(
+        (s.entity_id, s.prop, s.value, s.external)
+        for s in iter_dataset_statements(enricher)
+        if s.prop != Statement.BASE
+    )
+    assert concurrent == sequential
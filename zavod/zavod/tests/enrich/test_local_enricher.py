@@ -1,22 +1,27 @@
 import shutil
 from copy import deepcopy
+from unittest.mock import patch
 
 import pytest
 from nomenklatura.blocker.index import BlockingMatches
 from nomenklatura.judgement import Judgement
 from nomenklatura.resolver import Identifier
+from followthemoney import Statement
 from structlog.testing import capture_logs
 
 from zavod import settings
 from zavod.entity import Entity
-from zavod.archive import clear_data_path, dataset_state_path
+from zavod.archive import clear_data_path, dataset_state_path, get_versions_data
+from zavod.archive import iter_dataset_statements
 from zavod.context import Context
 from nomenklatura.db import make_session
 from zavod.crawl import crawl_dataset
 from zavod.exc import RunFailedException
 from zavod.integration.dedupe import get_resolver
 from zavod.meta import Dataset
-from zavod.runner.local_enricher import LocalEnricher
+from zavod.publish import publish_dataset
+from zavod.runner import local_enricher
+from zavod.runner.local_enricher import LocalEnricher, iter_matches
 from zavod.store import get_store
 
 DATASET_DATA = {
@@ -120,6 +125,38 @@ def test_enrich_process(testdataset1: Dataset, testdataset_enrich_subject: Datas
     shutil.rmtree(settings.DATA_PATH, ignore_errors=True)
 
 
+def test_enrich_incremental(testdataset1: Dataset, testdataset_enrich_subject: Dataset):
+    """Unchanged subjects re-use the matches of the previous run"""
+    crawl_dataset(testdataset_enrich_subject)
+    crawl_dataset(testdataset1)
+    data = deepcopy(DATASET_DATA)
+    data["config"]["incremental"] = True
+    enricher_ds = make_enricher_dataset(data, testdataset1.name)
+    with make_session() as session:
+        resolver = get_resolver(session)
+        resolver.load_into_memory()
+        resolver.decide("osv-umbrella-corp", "xxx", Judgement.POSITIVE)
+    crawl_dataset(enricher_ds)
+    first = sorted(
+        (s.entity_id, s.prop, s.value)
+        for s in iter_dataset_statements(enricher_ds)
+        if s.prop != Statement.BASE
+    )
+    assert "osv-oswell-spencer" in {entity_id for entity_id, _, _ in first}
+    publish_dataset(enricher_ds)
+    get_versions_data.cache_clear()
+
+    with patch.object(LocalEnricher, "match_candidates", side_effect=AssertionError):
+        crawl_dataset(enricher_ds)
+    second = sorted(
+        (s.entity_id, s.prop, s.value)
+        for s in iter_dataset_statements(enricher_ds)
+        if s.prop != Statement.BASE
+    )
+    assert second == first
+    shutil.rmtree(settings.DATA_PATH, ignore_errors=True)
+
+
 def test_enrich_id_match(vcontext: Context):
     """We match an entity with same ID"""
     crawl_dataset(vcontext.dataset)
@@ -212,6 +249,64 @@ def test_full_candidate_list_scored(vcontext: Context):
     shutil.rmtree(settings.DATA_PATH, ignore_errors=True)
 
 
+def test_target_cache(vcontext: Context):
+    """Candidates are fetched in batches and the most recent ones are cached."""
+    crawl_dataset(vcontext.dataset)
+    dataset_data = deepcopy(DATASET_DATA)
+    dataset_data["config"]["target_cache"] = 2
+    enricher = load_enricher(vcontext, dataset_data, "testdataset1")
+    ids = ["osv-john-doe", "osv-no-such-entity", "osv-umbrella-corp"]
+    targets = enricher.get_targets(ids)
+    assert targets["osv-no-such-entity"] is None
+    john = enricher.target_view.get_entity("osv-john-doe")
+    assert john is not None
+    assert targets["osv-john-doe"].to_dict() == john.to_dict()
+    assert list(enricher.matcher._targets) == ids[1:]
+    cached = enricher.matcher._targets["osv-umbrella-corp"]
+    again = enricher.get_targets(["osv-umbrella-corp"])
+    assert enricher.matcher._targets["osv-umbrella-corp"] is cached
+    # Entities are copied out of the cache, so callers may modify them:
+    assert again["osv-umbrella-corp"] is not cached
+    again["osv-umbrella-corp"].pop("name")
+    assert cached.get("name")
+
+    entity = Entity.from_data(vcontext.dataset, UMBRELLA_CORP)
+    candidates: BlockingMatches = [(Identifier.get("osv-umbrella-corp"), 3.0)]
+    results = list(enricher.match_candidates(entity, candidates))
+    assert [r.to_dict() for r in results] == [cached.to_dict()]
+    assert results[0] is not cached
+
+    shutil.rmtree(settings.DATA_PATH, ignore_errors=True)
+
+
+def test_iter_matches_parallel(vcontext: Context):
+    """Scoring candidates in worker processes gives the same matches, in the
+    same order, as scoring them in the main process."""
+    crawl_dataset(vcontext.dataset)
+    enricher = load_enricher(vcontext, DATASET_DATA, "testdataset1")
+    entities = [
+        Entity.from_data(vcontext.dataset, d) for d in (UMBRELLA_CORP, JON_DOVER)
+    ]
+    same_id = Entity.from_data(vcontext.dataset, JON_DOVER)
+    same_id.id = "osv-john-doe"
+    entities.append(same_id)
+    candidates = dict(enricher.candidates(entities))
+    subjects = [(e, candidates.get(Identifier.get(e.id), [])) for e in entities]
+
+    def _ids(workers: int) -> list[tuple[str, list[str]]]:
+        matches = iter_matches(enricher, iter(subjects), workers=workers)
+        return [(e.id, [m.id for m in ms]) for e, ms in matches]
+
+    serial = _ids(1)
+    assert serial[0] == ("xxx", ["osv-umbrella-corp"])
+    assert serial[2] == ("osv-john-doe", ["osv-john-doe"])
+    with patch.object(local_enricher, "MATCH_BATCH", 2):
+        assert _ids(2) == serial
+    enricher.close()
+
+    shutil.rmtree(settings.DATA_PATH, ignore_errors=True)
+
+
 def test_cutoff(vcontext: Context):
     """We don't match an entity if its score is lower than the cutoff."""
     crawl_dataset(vcontext.dataset)
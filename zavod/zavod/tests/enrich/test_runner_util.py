@@ -1,6 +1,12 @@
+from unittest.mock import patch
+
+from nomenklatura.cache import Cache
+from nomenklatura.db import Session
+
 from zavod.entity import Entity
 from zavod.meta import Dataset
-from zavod.runner.util import is_analyzer_stub
+from zavod.runner.util import ExpansionCache, is_analyzer_stub
+from zavod.tests.enrich.test_enrichment import StubEnricher
 
 GRAPH = Dataset({"name": "ann_graph_topics", "title": "Graph"})
 SOURCE = Dataset({"name": "src", "title": "Source"})
@@ -28,3 +34,34 @@ def test_mixed_entity_is_not_stub() -> None:
     assert prop is not None
     entity.unsafe_add(prop, "John Doe", dataset="src")
     assert not is_analyzer_stub(entity)
+
+
+def test_expansion_cache(session: Session) -> None:
+    cache = Cache(session, SOURCE, create=True)
+    enricher = StubEnricher(SOURCE, cache, {"schemata": ["Person"]})
+    subject = _entity(SOURCE, {"name": ["John Doe"]})
+    match = Entity.from_data(SOURCE, {"schema": "Person", "id": "m"})
+    match.add("name", "John Doe")
+    expansions = ExpansionCache(enricher, version="v1")
+    expanded = expansions.expand(subject, match)
+    assert [e.id for e in expanded] == ["m", "m-relative", "m-family"]
+
+    # Expansions are copies, and are re-used within the run and across runs:
+    expanded[0].set("name", "Jane Doe")
+    with patch.object(StubEnricher, "expand", side_effect=AssertionError):
+        again = expansions.expand(subject, match)
+        assert again[0].get("name") == ["John Doe"]
+        restored = ExpansionCache(enricher, version="v1").expand(subject, match)
+        assert [e.to_dict() for e in restored] == [e.to_dict() for e in again]
+    assert ExpansionCache(enricher, version="v2").expand(subject, match) != []
+
+    # The expansions of a match are kept under one key, for the latest version:
+    keys = [v.key for v in cache.all("expand:%")]
+    assert keys == ["expand:m"]
+    assert cache.get_json("expand:m")["version"] == "v2"
+    with patch.object(StubEnricher, "expand", side_effect=AssertionError):
+        ExpansionCache(enricher, version="v2").expand(subject, match)
+
+    # Subjects are filtered before using the cache:
+    company = Entity.from_data(SOURCE, {"schema": "Company", "id": "c"})
+    assert expansions.expand(company, match) == []
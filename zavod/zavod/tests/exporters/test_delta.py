@@ -2,12 +2,16 @@ import json
 from copy import deepcopy
 from pathlib import Path
 from typing import Any
+from unittest.mock import patch
 
 from followthemoney.dataset import Version
+from followthemoney.statement import PACK, write_statements
 from nomenklatura.judgement import Judgement
 from nomenklatura.resolver import Resolver
 from zavod import settings
 from zavod.archive import DELTA_EXPORT_FILE, DATASETS, DELTA_INDEX_FILE
+from zavod.archive import STATEMENTS_DELTA_FILE, STATEMENTS_FILE, dataset_resource_path
+from zavod.archive import HASH_FILE
 from zavod.entity import Entity
 from zavod.exporters import export_dataset
 from zavod.meta import Dataset
@@ -150,3 +154,87 @@ def test_delta_exporter(testdataset1: Dataset, resolver: Resolver):
     _assert_delta_index_matches_expected(
         dataset_path / DELTA_INDEX_FILE, expected_versions
     )
+
+
+def _write_pack(dataset: Dataset, entities: list[dict[str, Any]]) -> set[str]:
+    statements = []
+    for data in entities:
+        entity = Entity.from_data(dataset, data)
+        statements.extend(entity.statements)
+    path = dataset_resource_path(dataset.name, STATEMENTS_FILE)
+    with open(path, "wb") as fh:
+        write_statements(fh, PACK, statements)
+    return {s.id for s in statements if s.id is not None}
+
+
+def test_statement_delta_exporter(testdataset1: Dataset, resolver: Resolver):
+    testdataset1.model.exports = {STATEMENTS_DELTA_FILE}
+    dataset_path = settings.DATA_PATH / DATASETS / testdataset1.name
+    store = get_store(testdataset1, resolver)
+    store.clear()
+    view = store.view(testdataset1)
+
+    make_version(testdataset1, Version.new("aaa"), append_new_version_to_history=True)
+    first = _write_pack(testdataset1, [ENTITY_B, ENTITY_C])
+    export_dataset(testdataset1, view)
+    with open(dataset_path.joinpath(STATEMENTS_DELTA_FILE)) as fh:
+        objects = [json.loads(line) for line in fh.readlines()]
+    assert {o["id"] for o in objects} == first
+    assert all(o["op"] == "ADD" for o in objects)
+    assert all(o["statement"]["id"] == o["id"] for o in objects)
+    _archive_artifacts(testdataset1)
+
+    make_version(testdataset1, Version.new("bbb"), append_new_version_to_history=True)
+    changed = deepcopy(ENTITY_C)
+    changed["properties"] = {"name": ["Charlie"]}
+    second = _write_pack(testdataset1, [ENTITY_A, ENTITY_B, changed])
+    export_dataset(testdataset1, view)
+    with open(dataset_path.joinpath(STATEMENTS_DELTA_FILE)) as fh:
+        objects = [json.loads(line) for line in fh.readlines()]
+    added = {o["id"] for o in objects if o["op"] == "ADD"}
+    deleted = {o["id"] for o in objects if o["op"] == "DEL"}
+    assert added == second - first
+    assert deleted == first - second
+    assert len(added) > 0 and len(deleted) > 0
+    ids = [o["id"] for o in objects]
+    assert ids == sorted(ids)
+
+
+def test_delta_hash_migration(testdataset1: Dataset, resolver: Resolver):
+    testdataset1.model.exports = {DELTA_EXPORT_FILE}
+    dataset_path = settings.DATA_PATH / DATASETS / testdataset1.name
+    store = get_store(testdataset1, resolver)
+
+    def export_version(name: str, entities: list[dict[str, Any]]) -> list[Any]:
+        make_version(
+            testdataset1, Version.new(name), append_new_version_to_history=True
+        )
+        store.clear()
+        writer = store.writer()
+        for data in entities:
+            writer.add_entity(Entity.from_data(testdataset1, data))
+        writer.flush()
+        export_dataset(testdataset1, store.view(testdataset1))
+        _archive_artifacts(testdataset1)
+        with open(dataset_path.joinpath(DELTA_EXPORT_FILE)) as fh:
+            return [json.loads(line) for line in fh.readlines()]
+
+    def hash_lengths() -> set[int]:
+        with open(dataset_path.joinpath(HASH_FILE)) as fh:
+            return {len(line.strip().rsplit(":", 1)[1]) for line in fh}
+
+    export_version("aaa", [ENTITY_A, ENTITY_B])
+    assert hash_lengths() == {40}
+
+    with patch.object(settings, "DELTA_HASH", "xxh3"):
+        # The previous version used sha1, so it is compared using sha1:
+        objects = export_version("bbb", [ENTITY_A, ENTITY_B, ENTITY_C])
+        assert [(o["op"], o["entity"]["id"]) for o in objects] == [("ADD", "EC")]
+        assert hash_lengths() == {32}
+
+        changed = deepcopy(ENTITY_C)
+        changed["properties"] = {"name": ["Charlie"]}
+        objects = export_version("ccc", [ENTITY_A, changed])
+        ops = [(o["op"], o["entity"]["id"]) for o in objects]
+        assert ops == [("DEL", "EB"), ("MOD", "EC")]
+        assert hash_lengths() == {32}
@@ -1,5 +1,6 @@
 from csv import DictReader
 import uuid
+from typing import Any
 from followthemoney.cli.util import path_entities
 from followthemoney import Statement, ValueEntity
 from followthemoney.statement import CSV, read_path_statements
@@ -7,10 +8,14 @@ from json import load, loads
 from nomenklatura import Resolver
 from nomenklatura.judgement import Judgement
 from datetime import datetime
+from unittest.mock import patch
+import pytest
 
 from zavod import Context, settings
 from zavod.entity import Entity
+from zavod.exc import RunFailedException
 from zavod.exporters import export_dataset
+from zavod.exporters.common import Exporter
 from zavod.archive import clear_data_path, DATASETS
 from zavod.exporters.ftm import FtMExporter
 from zavod.exporters.names import NamesExporter
@@ -403,3 +408,79 @@ def test_consolidate_names_never_remove_ofac_names():
     assert set(entities[0].get("name")) == {"John Doe", "The Tiger"}
     # "Tigger" is demoted (even though it's a name in xx_garbage) because it's a weakAlias in xx_garbage
     assert set(entities[0].get("weakAlias")) == {"Tigger", "The Tiger"}
+
+
+def _sort_values(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _sort_values(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return sorted((_sort_values(v) for v in obj), key=repr)
+    return obj
+
+
+def _canonical(text: str) -> list[Any]:
+    """The lines of an export file, ignoring the order of the values of each entity
+    property, which depends on the hash seed of the exporting process."""
+    if text.startswith(("{", "[")):
+        return [_sort_values(loads(line)) for line in text.splitlines()]
+    return sorted(";".join(sorted(line.split(";"))) for line in text.splitlines())
+
+
+def test_sharded_export(testdataset1: Dataset):
+    dataset_path = settings.DATA_PATH / DATASETS / testdataset1.name
+    crawl_dataset(testdataset1)
+    files = [
+        "entities.ftm.json",
+        "names.txt",
+        "senzing.json",
+        "targets.nested.json",
+        "targets.simple.csv",
+        "statistics.json",
+        "entities.hash",
+    ]
+    export(testdataset1)
+    serial = {name: (dataset_path / name).read_text() for name in files}
+
+    with patch.object(settings, "EXPORT_WORKERS", 3):
+        with patch("zavod.store.RANGE_SAMPLE", 1):
+            export(testdataset1)
+    assert not (dataset_path / "_state" / "export-shards").exists()
+    for name in files:
+        sharded = (dataset_path / name).read_text()
+        if name == "statistics.json":
+            assert loads(sharded)["entity_count"] == loads(serial[name])["entity_count"]
+            assert loads(sharded)["targets"] == loads(serial[name])["targets"]
+            continue
+        assert _canonical(sharded) == _canonical(serial[name]), name
+
+
+def test_exporter_is_sharded():
+    assert FtMExporter.is_sharded()
+
+    class PartialExporter(FtMExporter):
+        finish_shard = Exporter.finish_shard
+
+    assert not PartialExporter.is_sharded()
+
+
+def test_pipelined_export(testdataset1: Dataset):
+    dataset_path = settings.DATA_PATH / DATASETS / testdataset1.name
+    crawl_dataset(testdataset1)
+    files = ["entities.ftm.json", "names.txt", "targets.nested.json", "senzing.json"]
+    export(testdataset1)
+    serial = {name: (dataset_path / name).read_text() for name in files}
+
+    with patch.object(settings, "EXPORT_PIPELINE", True):
+        with patch.object(settings, "EXPORT_QUEUE_SIZE", 2):
+            export(testdataset1)
+    for name in files:
+        assert (dataset_path / name).read_text() == serial[name], name
+
+    def fail(self, entity, view) -> None:
+        raise ValueError("Exporter broke")
+
+    with patch.object(settings, "EXPORT_PIPELINE", True):
+        with patch.object(NamesExporter, "feed", fail):
+            with pytest.raises(RunFailedException) as exc:
+                export(testdataset1)
+    assert isinstance(exc.value.__cause__, ValueError)
@@ -0,0 +1,68 @@
+from datetime import UTC, datetime, timedelta
+
+import plyvel  # type: ignore
+from nomenklatura.cache import Cache
+from nomenklatura.db import Session
+
+from zavod.meta import Dataset
+from zavod.runtime import cache as cache_
+from zavod.runtime.cache import DatasetCache
+
+
+def test_dataset_cache(testdataset1: Dataset, session: Session, monkeypatch):
+    monkeypatch.setattr(cache_.settings, "CACHE_LOCAL", True)
+    table = Cache(session, testdataset1, create=True)
+    table.set("https://previous.com", "previous")
+    cache = DatasetCache(session, testdataset1)
+
+    # Entries in the cache table are synced into the local tier on first use:
+    assert cache.get("https://previous.com") == "previous"
+    assert cache.get("https://previous.com", max_age=0) is None
+    future = datetime.now() + timedelta(days=1)
+    assert cache.get("https://previous.com", min_timestamp=future) is None
+
+    # Writes are buffered until the cache is flushed:
+    body = "<html>" + "x" * cache_.COMPRESS_SIZE + "</html>"
+    cache.set("https://page.com", body)
+    cache.set("https://empty.com", None)
+    assert cache.get("https://page.com", max_age=1) == body
+    assert table.get("https://page.com") is None
+    cache.flush()
+    assert table.get("https://page.com") == body
+    assert cache.has("https://page.com")
+
+    cache.delete("https://previous.com")
+    assert cache.get("https://previous.com") is None
+    assert table.get("https://previous.com") is None
+    cache.close()
+
+    # Large values are compressed in the local tier:
+    db = plyvel.DB(cache._local_path.as_posix())
+    data = db.get(cache_.ENTRY_PREFIX + b"https://page.com")
+    assert data is not None and data[:1] == cache_.COMPRESSED
+    assert len(data) < len(body)
+    assert db.get(cache_.ENTRY_PREFIX + b"https://previous.com") is None
+    db.close()
+
+    # The local tier is kept between runs:
+    cache = DatasetCache(session, testdataset1)
+    assert cache.get("https://page.com") == body
+
+    # A stale local entry is read again from the cache table:
+    changed = datetime.now(UTC)
+    table.set("https://page.com", "fresh")
+    assert cache.get("https://page.com", min_timestamp=changed) == "fresh"
+    assert cache.get("https://page.com") == "fresh"
+    cache.clear()
+    assert cache.get("https://page.com") is None
+    cache.close()
+
+
+def test_dataset_cache_no_local(testdataset1: Dataset, session: Session, monkeypatch):
+    monkeypatch.setattr(cache_.settings, "CACHE_LOCAL", False)
+    cache = DatasetCache(session, testdataset1, create=True)
+    cache.set("https://page.com", "page")
+    assert cache.get("https://page.com") == "page"
+    assert [c.key for c in cache.all("https://page%")] == ["https://page.com"]
+    cache.close()
+    assert not cache._local_path.exists()
@@ -0,0 +1,41 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from zavod.entity import Entity
+from zavod.meta import Dataset
+from zavod.runtime import sort
+from zavod.runtime.delta import SHA1, XXH3, read_hashes
+from zavod.runtime.delta import get_hash_algorithm, hash_entity
+from zavod.runtime.sort import ExternalSorter
+
+
+def test_hash_sorter(tmp_path: Path):
+    pairs = [("c", "3"), ("a", "1"), ("e:x", "5"), ("b", "2"), ("d", "4"), ("a", "1")]
+    with patch.object(sort, "SORT_BUFFER", 2):
+        sorter = ExternalSorter(tmp_path / "runs")
+        for entity_id, entity_hash in pairs:
+            sorter.add(entity_id, entity_hash)
+        assert len(sorter.runs) == 3
+        sorter.write(tmp_path / "sorted.hash")
+    with open(tmp_path / "sorted.hash") as fh:
+        hashes = list(read_hashes(fh))
+    assert hashes == sorted(set(pairs))
+
+
+def test_hash_entity(testdataset1: Dataset):
+    data = {"id": "EA", "schema": "Person", "properties": {"name": ["Alice", "Al"]}}
+    entity = Entity.from_data(testdataset1, data)
+    sha1_hash = hash_entity(entity)
+    xxh3_hash = hash_entity(entity, XXH3)
+    assert get_hash_algorithm(sha1_hash) == SHA1
+    assert get_hash_algorithm(xxh3_hash) == XXH3
+    # Value order does not matter:
+    data["properties"]["name"].reverse()
+    other = Entity.from_data(testdataset1, data)
+    assert hash_entity(other, XXH3) == xxh3_hash
+    other.add("name", "Alicia")
+    assert hash_entity(other, XXH3) != xxh3_hash
+    with pytest.raises(ValueError):
+        get_hash_algorithm("banana")
@@ -0,0 +1,91 @@
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from zavod.meta.http import HTTP
+from zavod.runtime.http_ import HostLimiter, ThrottledAdapter, TokenBucket
+from zavod.runtime.http_ import make_session, set_rate_limit
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=50, burst=5)
+    start = monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert monotonic() - start < 0.05
+
+    # Once the burst is used up, tokens are handed out at the rate, also when
+    # they are taken from several threads:
+    start = monotonic()
+    threads = [Thread(target=bucket.acquire) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert monotonic() - start >= 0.18
+
+
+def _run_requests(limiter: HostLimiter, hosts: list[str]) -> dict[str, int]:
+    """Send a request to each of the hosts from its own thread, returning the
+    maximum number of concurrent requests to each host."""
+    active = {host: 0 for host in hosts}
+    peak = {host: 0 for host in hosts}
+    lock = Lock()
+
+    def request(host: str) -> None:
+        with limiter.request(f"https://{host}/page"):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            sleep(0.05)
+            with lock:
+                active[host] -= 1
+
+    threads = [Thread(target=request, args=(host,)) for host in hosts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return peak
+
+
+def test_host_limiter():
+    limiter = HostLimiter(concurrency=2)
+    assert _run_requests(limiter, ["a.com", "b.com"] * 4) == {"a.com": 2, "b.com": 2}
+
+    # Requests to the same host are started at least `delay` seconds apart:
+    limiter = HostLimiter(concurrency=4, delay=0.1)
+    start = monotonic()
+    _run_requests(limiter, ["a.com"] * 3)
+    assert monotonic() - start >= 0.2
+
+
+def test_session_throttle():
+    session = make_session(HTTP({}))
+    adapter = session.get_adapter("https://a.com/")
+    assert isinstance(adapter, ThrottledAdapter)
+    assert adapter.throttle is None
+    assert adapter._pool_maxsize == 10  # type: ignore
+
+    session = make_session(HTTP({"rate_limit": 20, "pool_size": 3}))
+    adapter = session.get_adapter("https://a.com/")
+    assert isinstance(adapter, ThrottledAdapter)
+    assert adapter._pool_maxsize == 3  # type: ignore
+    assert adapter.throttle is not None
+    assert session.get_adapter("http://a.com/").throttle is adapter.throttle  # type: ignore
+
+    # Each host has its own rate limit:
+    start = monotonic()
+    adapter.throttle.acquire("https://a.com/1")
+    adapter.throttle.acquire("https://b.com/1")
+    assert monotonic() - start < 0.04
+    adapter.throttle.acquire("https://a.com/2")
+    adapter.throttle.acquire("https://a.com/3")
+    assert monotonic() - start >= 0.09
+
+    # The rate limit of a session can be replaced, e.g. from an enricher's config:
+    set_rate_limit(session, 1000, 5)
+    adapter = session.get_adapter("https://a.com/")
+    assert isinstance(adapter, ThrottledAdapter)
+    assert adapter.throttle is not None
+    assert adapter.throttle.rate == 1000
+    assert session.get_adapter("http://a.com/").throttle is adapter.throttle  # type: ignore
@@ -1,4 +1,8 @@
+import struct
 from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
 from rigour.time import utc_now
 
 from zavod import settings
@@ -6,13 +10,15 @@ from zavod.exporters import export_dataset
 from zavod.integration.dedupe import get_dataset_linker
 from zavod.meta import Dataset
 from zavod.crawl import crawl_dataset
-from zavod.archive import iter_dataset_statements
+from zavod.archive import TIMESTAMPS_FILE, dataset_resource_path
+from zavod.archive import get_artifact_object, iter_dataset_statements
 from zavod.publish import publish_dataset
-from zavod.runtime.timestamps import TimeStampIndex
+from zavod.runtime.timestamps import TimeStampFile, TimeStampIndex
 from zavod.store import get_store
 
 
-def test_timestamps(testdataset1: Dataset):
+@pytest.mark.parametrize("clazz", [TimeStampIndex, TimeStampFile])
+def test_timestamps(testdataset1: Dataset, clazz: type[TimeStampIndex]):
     crawl_dataset(testdataset1)
 
     prev_time = str(settings.RUN_TIME_ISO)
@@ -23,7 +29,8 @@ def test_timestamps(testdataset1: Dataset):
     dt = utc_now().replace(microsecond=0) + timedelta(days=1)
     default = dt.isoformat(sep="T", timespec="seconds")
 
-    index = TimeStampIndex(dataset=testdataset1)
+    index = clazz(dataset=testdataset1)
+    assert index.get("osv-john-doe") == {}
     index.index(stmts)
     stamps = index.get("osv-john-doe")
     assert len(stamps), stamps
@@ -34,11 +41,40 @@ def test_timestamps(testdataset1: Dataset):
         assert stamps.get(stmt.id, default) != ""
         assert stamps.get(stmt.id, default) == prev_time
 
-    assert "TimeStampIndex" in repr(index), repr(index)
+    assert clazz.__name__ in repr(index), repr(index)
+    index.close()
+
 
+def test_timestamp_file_runs(testdataset1: Dataset):
+    rows = [
+        ("b", "1" * 40, "2024-01-01T00:00:00"),
+        ("a", "2" * 40, "2024-01-02T00:00:00"),
+        ("c", "custom-id", "2024-01-01T00:00:00"),
+        ("b", "3" * 40, "2024-01-03T00:00:00"),
+        ("a", "4" * 40, ""),
+        ("a", "5" * 40, "2024-01-02T00:00:00"),
+    ]
+    with patch("zavod.runtime.timestamps.SORT_BUFFER", 2):
+        index = TimeStampFile(dataset=testdataset1)
+        index.index_rows(rows)
+    assert index.get("a") == {"2" * 40: "2024-01-02T00:00:00", "5" * 40: rows[1][2]}
+    assert index.get("b") == {"1" * 40: rows[0][2], "3" * 40: rows[3][2]}
+    # IDs which are not SHA1 digests are found by their hash:
+    assert index.get("c").get("custom-id") == rows[2][2]
+    assert index.get("c")["custom-id"] == rows[2][2]
+    assert "custom-id" in index.get("c")
+    assert "other-id" not in index.get("c")
+    assert index.get("0") == {}
+    assert index.get("d") == {}
+    index.close()
+    assert not index.path.exists()
 
-def test_backfill(testdataset1: Dataset):
+
+@pytest.mark.parametrize("columns", [False, True])
+def test_backfill(testdataset1: Dataset, columns: bool, monkeypatch):
     prev_time = settings.RUN_TIME_ISO
+    # With columns, the previous statements are read from statements.columns:
+    monkeypatch.setattr(settings, "STATEMENTS_COLUMNS", columns)
     # Run the dataset once to output statements.pack
     # Publish to archive statements and make them discoverable by the next run.
     linker = get_dataset_linker(testdataset1)
@@ -64,3 +100,48 @@ def test_backfill(testdataset1: Dataset):
             continue
         assert stamps.get(stmt.id, second_time) != ""
         assert stamps.get(stmt.id, second_time) == prev_time
+
+
+def test_archived_index(testdataset1: Dataset):
+    prev_time = settings.RUN_TIME_ISO
+    linker = get_dataset_linker(testdataset1)
+    with patch.object(settings, "TIMESTAMP_ARCHIVE", True):
+        crawl_dataset(testdataset1)
+    path = dataset_resource_path(testdataset1.name, TIMESTAMPS_FILE)
+    assert path.is_file()
+    store = get_store(testdataset1, linker)
+    store.sync()
+    export_dataset(testdataset1, store.view(testdataset1))
+    publish_dataset(testdataset1)
+    stmts = list(iter_dataset_statements(testdataset1, external=False))
+
+    # The next run backfills the archived index instead of reading statements:
+    with patch("zavod.runtime.timestamps.iter_previous_timestamps") as rows:
+        index = TimeStampFile.build(dataset=testdataset1)
+        assert not rows.called
+    stamps = index.get("osv-john-doe")
+    assert len(stamps), stamps
+    for stmt in stmts:
+        if stmt.entity_id == "osv-john-doe":
+            assert stamps.get(stmt.id) == prev_time
+    index.close()
+    assert path.is_file()
+
+    # An invalid archived index is rebuilt from the statements:
+    archived = get_artifact_object(testdataset1.name, TIMESTAMPS_FILE)
+    assert archived is not None
+    path.write_bytes(b"invalid")
+    archived.publish(path)
+    index = TimeStampFile.build(dataset=testdataset1)
+    assert index.get("osv-john-doe") == stamps
+    index.close()
+
+    # So is one with a damaged footer:
+    magic = TimeStampFile.MAGIC
+    for footer in (b"{}", b'{"entities": 1, "stamps": [], "sections": {}}'):
+        data = magic + footer + struct.pack("=Q", len(magic)) + magic
+        path.write_bytes(data)
+        archived.publish(path)
+        index = TimeStampFile.build(dataset=testdataset1)
+        assert index.get("osv-john-doe") == stamps
+        index.close()
@@ -1,6 +1,8 @@
 import pytest
+from unittest.mock import patch
 
 from followthemoney.dataset import Version
+from followthemoney.statement.serialize import read_pack_statements_decoded
 
 from zavod import settings
 from zavod.meta import Dataset
@@ -11,6 +13,10 @@ from zavod.archive import clear_data_path, dataset_data_path, dataset_resource_p
 from zavod.archive import publish_version_history, get_archive_backend
 from zavod.archive import get_artifact_object
 from zavod.archive import ARTIFACTS, DATASETS, LATEST, VERSIONS_FILE
+from zavod.archive import STATEMENTS_FILE, STATEMENTS_COLUMNS_FILE
+from zavod.archive import iter_dataset_statements
+from zavod.archive.columns import StatementColumns
+from zavod.crawl import crawl_dataset
 
 RESOURCE_NAME = "foo.json"
 
@@ -142,3 +148,47 @@ def test_artifact_backfill(testdataset1: Dataset):
     assert versions_file.exists()
     local_path = get_dataset_artifact(testdataset1.name, name)
     assert local_path.exists()
+
+
+def test_statement_columns(testdataset1: Dataset):
+    with patch.object(settings, "STATEMENTS_COLUMNS", True):
+        with patch("zavod.archive.columns.BLOCK_SIZE", 5):
+            crawl_dataset(testdataset1)
+    path = dataset_resource_path(testdataset1.name, STATEMENTS_FILE)
+    columns_path = dataset_resource_path(testdataset1.name, STATEMENTS_COLUMNS_FILE)
+    assert columns_path.exists()
+    with open(path) as fh:
+        packed = {s.id: s for s in read_pack_statements_decoded(fh)}
+
+    with StatementColumns(columns_path) as columns:
+        assert len(columns) == len(packed)
+        assert len(columns.blocks) > 1
+        # Blocks are sorted and don't split entities:
+        for prev, block in zip(columns.blocks, columns.blocks[1:]):
+            assert prev["last"] < block["first"]
+        stmts = list(columns.statements())
+        assert [s.entity_id for s in stmts] == sorted(s.entity_id for s in stmts)
+        for stmt in stmts:
+            assert stmt == packed[stmt.id]
+            assert stmt.first_seen == packed[stmt.id].first_seen
+        rows = list(columns.rows(("id", "first_seen")))
+        assert {r[0] for r in rows} == set(packed.keys())
+
+        john = columns.entity_statements("osv-john-doe")
+        expected = {s.id for s in packed.values() if s.entity_id == "osv-john-doe"}
+        assert {s.id for s in john} == expected
+        assert columns.entity_statements("no-such-entity") == []
+
+    # Statements are read from the columns file when the setting is enabled:
+    with patch.object(StatementColumns, "statements", side_effect=RuntimeError):
+        with patch.object(settings, "STATEMENTS_COLUMNS", True):
+            with pytest.raises(RuntimeError):
+                list(iter_dataset_statements(testdataset1))
+        assert len(list(iter_dataset_statements(testdataset1))) == len(packed)
+
+    # A crawl without the setting removes the columns of the earlier run:
+    crawl_dataset(testdataset1)
+    assert not columns_path.exists()
+
+    with pytest.raises(ValueError):
+        StatementColumns(path)
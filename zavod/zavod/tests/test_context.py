@@ -5,6 +5,7 @@ import pytest
 import requests_mock
 import structlog
 from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
 from rigour.urls import build_url
 from followthemoney.statement import read_statements, PACK
 
@@ -202,6 +203,79 @@ def test_context_fetch_text_encoding_cache(testdataset1: Dataset):
     context.close()
 
 
+def test_context_conditional_fetchers(testdataset1: Dataset, monkeypatch):
+    file_cache = settings.DATA_PATH / "_http"
+    monkeypatch.setattr(settings, "HTTP_FILE_CACHE_PATH", file_cache.as_posix())
+    context = Context(testdataset1)
+    url = "https://test.com/conditional"
+    headers = {"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}
+
+    with requests_mock.Mocker() as m:
+        m.get(url, text="Hello, World!", headers=headers)
+        assert context.fetch_text(url, cache_days=0) == "Hello, World!"
+        assert "If-None-Match" not in m.last_request.headers
+
+        # An expired response is re-validated, and re-used if it's unchanged:
+        m.get(url, status_code=304)
+        assert context.fetch_text(url, cache_days=0) == "Hello, World!"
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+        assert m.last_request.headers["If-Modified-Since"] == headers["Last-Modified"]
+        assert context.fetch_text(url, cache_days=14) == "Hello, World!"
+        assert m.call_count == 2
+
+        m.get(url, text="Hello, again!")
+        assert context.fetch_text(url, cache_days=0) == "Hello, again!"
+
+    long = "Hello, World!\n" * 1000
+    with requests_mock.Mocker() as m:
+        m.get(url, text=long, headers=headers)
+        path = context.fetch_resource("world.txt", url)
+        assert "If-None-Match" not in m.last_request.headers
+        # The cached copy is not changed with the fetched file:
+        with open(path, "r+") as fh:
+            fh.write("Goodbye")
+        path.unlink()
+
+        m.get(url, status_code=304)
+        path = context.fetch_resource("world.txt", url)
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+        assert path.read_text() == long
+        path.unlink()
+
+        # A damaged copy in the file cache is fetched again:
+        cached = list(file_cache.glob("*.json"))
+        assert len(cached) == 1
+        cached[0].with_suffix("").write_text("Hello")
+        m.get(url, [{"status_code": 304}, {"text": long, "headers": headers}])
+        path = context.fetch_resource("world.txt", url)
+        assert path.read_text() == long
+        assert "If-None-Match" not in m.last_request.headers
+    context.close()
+
+
+def test_context_fetch_many(testdataset1: Dataset):
+    context = Context(testdataset1)
+    urls = [f"https://test.com/page/{i}" for i in range(50)]
+
+    with requests_mock.Mocker() as m:
+        for url in urls:
+            m.get(url, text=url.upper())
+        results = list(context.fetch_many(urls, cache_days=14))
+        assert results == [(url, url.upper()) for url in urls]
+        assert m.call_count == 50
+
+        # Cached under the same fingerprints as fetch_text:
+        assert context.fetch_text(urls[3], cache_days=14) == urls[3].upper()
+        unordered = dict(context.fetch_many(urls, cache_days=14, ordered=False))
+        assert unordered == dict(results)
+        assert m.call_count == 50
+
+        m.get(urls[0], status_code=404)
+        with pytest.raises(HTTPError):
+            list(context.fetch_many(urls[:2]))
+    context.close()
+
+
 def test_context_post_fetchers(testdataset1: Dataset):
     context = Context(testdataset1)
 
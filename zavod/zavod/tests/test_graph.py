@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+import numpy as np
+
+from zavod.crawl import crawl_dataset
+from zavod.entity import Entity
+from zavod.graph import NO_SCHEMA, GraphBuilder, project_graph
+from zavod.integration import get_dataset_linker
+from zavod.meta import Dataset
+from zavod.store import get_store
+
+OTHER = Dataset({"name": "other", "title": "Other"})
+
+
+def _entity(dataset: Dataset, schema: str, id: str, **props: list[str]) -> Entity:
+    data = {"schema": schema, "id": id, "properties": props}
+    return Entity.from_data(dataset, data)
+
+
+def test_graph_projection(testdataset1: Dataset):
+    builder = GraphBuilder(exclude=[OTHER.name])
+    builder.add(_entity(testdataset1, "Person", "boss", topics=["sanction"]))
+    builder.add(_entity(OTHER, "Company", "a", topics=["sanction.control"]))
+    builder.add(_entity(testdataset1, "Company", "b", topics=["role.pep", "poi"]))
+    builder.add(_entity(testdataset1, "Ownership", "o1", owner=["boss"], asset=["a"]))
+    builder.add(_entity(testdataset1, "Ownership", "o2", owner=["a"], asset=["b"]))
+    builder.add(
+        _entity(
+            testdataset1,
+            "Ownership",
+            "o3",
+            owner=["b"],
+            asset=["c"],
+            endDate=["2020"],
+        )
+    )
+    builder.add(_entity(testdataset1, "Ownership", "o4", owner=["a"], asset=["gone"]))
+    builder.add(_entity(testdataset1, "Security", "sec", issuer=["b"]))
+    graph = builder.build()
+
+    boss, a, b, gone = (graph.node(id) for id in ("boss", "a", "b", "gone"))
+    assert boss is not None and a is not None and b is not None
+    assert gone is not None
+    assert graph.node("missing") is None
+    assert graph.node_schema[gone] == NO_SCHEMA
+    assert not graph.exists()[gone]
+    assert graph.schema_mask("LegalEntity")[[boss, a, b]].all()
+    assert not graph.schema_mask("Company")[boss]
+
+    # Topics from excluded datasets are ignored:
+    assert graph.get_topics(a) == set()
+    assert graph.get_topics(b) == {"role.pep", "poi"}
+    seeds = graph.topic_mask(["sanction", "sanction.control"])
+    assert list(np.flatnonzero(seeds)) == [boss]
+
+    ownership = graph.edge_mask(schema="Ownership", prop="Ownership:asset")
+    assert ownership.sum() == 4
+    assert graph.edge_mask(schema="Ownership", ended=True).sum() == 1
+    issuer = graph.edge_mask(prop="Security:issuer")
+    assert issuer.sum() == 1
+    assert graph.edge_target[issuer][0] == b
+    assert len(graph.out_edges_of(a)) == 2
+    assert len(graph.in_edges_of(b)) == 2
+
+    live = graph.edge_mask(schema="Ownership", ended=False)
+    parents = graph.propagate(seeds, live)
+    assert parents[boss] == boss
+    assert parents[a] == boss
+    assert parents[b] == a
+    # Ended edges are not walked, and nodes not in the view are not reached:
+    assert parents[graph.node("c")] == -1
+    assert parents[gone] == -1
+
+    up = graph.propagate(graph.topic_mask(["poi"]), live, reverse=True)
+    assert set(np.flatnonzero(up >= 0)) == {boss, a, b}
+    assert up[boss] == a
+
+
+def test_project_graph_cache(testdataset1: Dataset):
+    linker = get_dataset_linker(testdataset1)
+    crawl_dataset(testdataset1)
+    store = get_store(testdataset1, linker)
+    store.sync()
+    view = store.view(testdataset1, external=True)
+    graph = project_graph(view)
+    assert len(graph) > 5
+    assert graph.edge_count > 0
+    node = graph.node("osv-john-doe")
+    assert node is not None
+    assert graph.schemata[graph.node_schema[node]] == "Person"
+    cached = list(store.path.parent.joinpath("graph").glob("*.npz"))
+    assert len(cached) == 1, cached
+
+    with patch.object(view, "entities", side_effect=AssertionError):
+        loaded = project_graph(view)
+    assert loaded.ids == graph.ids
+    assert loaded.topics == graph.topics
+    assert np.array_equal(loaded.node_topics, graph.node_topics)
+    assert np.array_equal(loaded.edge_target, graph.edge_target)
+    assert np.array_equal(loaded.out_edges, graph.out_edges)
+
+    # A different scope of the store is projected separately:
+    internal = project_graph(store.view(testdataset1, external=False))
+    assert len(internal) <= len(graph)
+    cached = list(store.path.parent.joinpath("graph").glob("*.npz"))
+    assert len(cached) == 1, cached
+    store.close()
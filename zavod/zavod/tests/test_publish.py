@@ -1,4 +1,5 @@
 import json
+from datetime import datetime
 
 import pytest
 from followthemoney.dataset import Version, VersionHistory
@@ -13,13 +14,15 @@ from zavod.archive import iter_dataset_statements, iter_previous_statements
 from zavod.archive import STATISTICS_FILE, INDEX_FILE, STATEMENTS_FILE
 from zavod.archive import DATASETS, ARTIFACTS, VERSIONS_FILE
 from zavod.archive import ISSUES_FILE, ISSUES_LOG, RESOURCES_FILE
-from zavod.archive import HASH_FILE, DELTA_INDEX_FILE, CATALOG_FILE
+from zavod.archive import HASH_FILE, DELTA_INDEX_FILE, CATALOG_FILE, SOURCES_FILE
 from zavod.crawl import crawl_dataset
 from zavod.store import get_store
 from zavod.exporters import export_dataset
 from zavod.exporters.metadata import get_catalog_dataset
 from zavod.integration import get_dataset_linker
 from zavod.publish import publish_dataset, archive_failure
+from zavod.logs import configure_logging, reset_logging
+from zavod.runtime.issues import DatasetIssues
 from zavod.exc import RunFailedException
 
 STANDARD_EXPORTS = {
@@ -197,6 +200,84 @@ def test_empty_crawl_does_not_resurrect_archived_statements(
     store.close()
 
 
+def test_crawl_unchanged_sources(
+    testdataset1: Dataset, monkeypatch: pytest.MonkeyPatch
+):
+    """A crawler whose sources are unchanged re-uses the statements of its previous
+    run, which then produce an empty delta."""
+    linker = get_dataset_linker(testdataset1)
+    assert testdataset1.data is not None
+    testdataset1.data.format = "SKIP"
+
+    def _run() -> int:
+        stats = crawl_dataset(testdataset1)
+        store = get_store(testdataset1, linker)
+        store.sync(clear=True)
+        export_dataset(testdataset1, store.view(testdataset1))
+        publish_dataset(testdataset1)
+        store.close()
+        return stats.statements
+
+    first_time = settings.RUN_TIME_ISO
+    logger = configure_logging()
+    try:
+        statements = _run()
+    finally:
+        reset_logging(logger)
+    archived = settings.ARCHIVE_PATH / ARTIFACTS / testdataset1.name
+    assert len(list(archived.glob(f"*/{SOURCES_FILE}"))) == 1
+    first_seen = {s.id: s.first_seen for s in iter_dataset_statements(testdataset1)}
+    issues = [
+        issue
+        for issue in DatasetIssues(testdataset1).all()
+        if issue["message"] == "This is a test warning"
+    ]
+    assert len(issues) == 1
+
+    clear_data_path(testdataset1.name)
+    monkeypatch.setattr(settings, "RUN_VERSION", Version.new())
+    monkeypatch.setattr(settings, "RUN_TIME_ISO", "2100-01-01T00:00:00")
+    with capture_logs() as cap_logs:
+        assert _run() == statements
+    messages = [log["event"] for log in cap_logs]
+    assert "Sources are unchanged, re-using previous statements" in messages
+    assert "This is a test warning" not in messages
+    # The issues logged by the skipped crawler are carried over:
+    assert issues[0] in list(DatasetIssues(testdataset1).all())
+    for stmt in iter_dataset_statements(testdataset1):
+        assert stmt.first_seen == first_seen[stmt.id]
+        assert stmt.last_seen == "2100-01-01T00:00:00"
+    assert (
+        dataset_resource_path(testdataset1.name, DELTA_EXPORT_FILE).stat().st_size == 0
+    )
+    sources = json.loads(
+        dataset_resource_path(testdataset1.name, SOURCES_FILE).read_text()
+    )
+    assert sources["time"] == first_time
+
+    # A change to the dataset metadata requires a full run:
+    clear_data_path(testdataset1.name)
+    monkeypatch.setattr(settings, "RUN_VERSION", Version.new())
+    monkeypatch.setitem(testdataset1._data, "summary", "Changed")
+    with capture_logs() as cap_logs:
+        assert _run() == statements
+    messages = [log["event"] for log in cap_logs]
+    assert "Crawler code or metadata has changed." in messages
+    sources = json.loads(
+        dataset_resource_path(testdataset1.name, SOURCES_FILE).read_text()
+    )
+    assert sources["time"] == "2100-01-01T00:00:00"
+
+    # ... as does a previous full run older than the maximum age:
+    clear_data_path(testdataset1.name)
+    monkeypatch.setattr(settings, "RUN_VERSION", Version.new())
+    monkeypatch.setattr(settings, "RUN_TIME", datetime(2100, 1, 9))
+    with capture_logs() as cap_logs:
+        _run()
+    messages = [log["event"] for log in cap_logs]
+    assert "Previous full run is too old." in messages
+
+
 def test_failed_run_does_not_replace_latest_metadata(
     testdataset1: Dataset, monkeypatch: pytest.MonkeyPatch
 ):
@@ -1,8 +1,14 @@
+from pathlib import Path
+from unittest.mock import patch
+from nomenklatura.resolver import Linker
+
 from zavod import settings
+from zavod.entity import Entity
 from zavod.integration import get_dataset_linker
-from zavod.meta import Dataset
+from zavod.meta import Dataset, get_catalog, get_multi_dataset
 from zavod.crawl import crawl_dataset
-from zavod.store import get_store
+from zavod.runtime.store_cache import get_store_cache
+from zavod.store import Store, get_entities, get_store, linker_fingerprint, LEAF_PREFIX
 
 
 def test_store_access(testdataset1: Dataset):
@@ -15,6 +21,9 @@ def test_store_access(testdataset1: Dataset):
     entity = view.get_entity("osv-john-doe")
     assert entity is not None, entity
     assert entity.id == "osv-john-doe"
+    batch = get_entities(view, ["osv-john-doe", "osv-no-such-entity", "osv-john-doe"])
+    assert list(batch) == ["osv-john-doe"]
+    assert batch["osv-john-doe"].to_dict() == entity.to_dict()
     store.close()
 
     store = get_store(testdataset1, linker)
@@ -33,3 +42,110 @@ def test_store_access(testdataset1: Dataset):
     store.clear()
     empty = store.view(testdataset1, external=False)
     assert len(list(empty.entities())) == 0
+
+
+def test_store_incremental_sync(testdataset1: Dataset, testdataset2: Dataset):
+    collection = get_multi_dataset(
+        get_catalog(), [testdataset1.name, testdataset2.name]
+    )
+    linker = get_dataset_linker(collection)
+    crawl_dataset(testdataset1)
+    crawl_dataset(testdataset2)
+    store = get_store(collection, linker)
+    store.sync()
+    leaves = dict(store.db.iterator(prefix=LEAF_PREFIX))
+    assert len(leaves) == 2, leaves
+    count = len(list(store.default_view(external=True).entities()))
+    assert count > 5, count
+
+    # A sync without changes to the leaves doesn't touch the data:
+    marker = b"s:test-marker::testdataset2:Person:x"
+    store.db.put(marker, b"")
+    store.sync()
+    assert store.db.get(marker) == b""
+
+    # Re-crawling a leaf drops and re-indexes only its statements:
+    crawl_dataset(testdataset2)
+    store.sync()
+    assert store.db.get(marker) is None
+    after = dict(store.db.iterator(prefix=LEAF_PREFIX))
+    key1 = LEAF_PREFIX + testdataset1.name.encode()
+    key2 = LEAF_PREFIX + testdataset2.name.encode()
+    assert after[key1] == leaves[key1]
+    assert after[key2] != leaves[key2]
+    assert len(list(store.default_view(external=True).entities())) == count
+
+    # A changed linker forces a full rebuild:
+    changed = Linker[Entity]({})
+    changed.add("osv-john-doe", "NK-johndoe")
+    assert linker_fingerprint(changed) != linker_fingerprint(linker)
+    store.close()
+    store = get_store(collection, changed)
+    store.db.put(marker, b"")
+    store.sync()
+    assert store.db.get(marker) is None
+    store.close()
+
+
+def test_store_parallel_sync(testdataset1: Dataset, testdataset2: Dataset):
+    collection = get_multi_dataset(
+        get_catalog(), [testdataset1.name, testdataset2.name]
+    )
+    linker = get_dataset_linker(collection)
+    crawl_dataset(testdataset1)
+    crawl_dataset(testdataset2)
+    store = get_store(collection, linker)
+    store.sync()
+    serial = dict(store.db.iterator())
+    store.close()
+
+    store = get_store(collection, linker)
+    with patch.object(settings, "STORE_WORKERS", 2):
+        store.sync(clear=True)
+    parallel = dict(store.db.iterator())
+    assert parallel == serial
+    view = store.default_view(external=True)
+    entity = view.get_entity("osv-john-doe")
+    assert entity is not None, entity
+    assert entity.schema.name == "Person"
+    store.close()
+
+
+def test_store_cache(testdataset1: Dataset, testdataset2: Dataset, tmp_path: Path):
+    collection = get_multi_dataset(
+        get_catalog(), [testdataset1.name, testdataset2.name]
+    )
+    linker = get_dataset_linker(collection)
+    crawl_dataset(testdataset1)
+    crawl_dataset(testdataset2)
+    with patch.object(settings, "STORE_CACHE_PATH", tmp_path / "cache"):
+        store = get_store(collection, linker)
+        store.sync(clear=True)
+        built = dict(store.db.iterator())
+        store.close()
+        cache = get_store_cache()
+        assert cache is not None
+        entries = [p for p in cache.path.iterdir() if p.is_dir()]
+        assert len(entries) == 1, entries
+
+        # Another store with the same leaves and linker is checked out, not built:
+        other = Store(collection, linker, path=tmp_path / "other")
+        with patch.object(Store, "_ingest", side_effect=AssertionError):
+            other.sync()
+        assert dict(other.db.iterator()) == built
+        assert cache._leased(entries[0])
+        other.db.put(b"s:test-marker::testdataset2:Person:x", b"")
+        other.close()
+        assert not cache._leased(entries[0])
+
+        # Leased entries survive eviction, others are evicted oldest first:
+        lease = cache.checkout(entries[0].name, tmp_path / "leased")
+        assert lease is not None
+        cache.max_size = 0
+        cache.publish("other", tmp_path / "other")
+        assert entries[0].exists()
+        cache.release(lease)
+        cache.publish("third", tmp_path / "other")
+        assert not entries[0].exists()
+        assert not cache.has("other")
+        assert cache.has("third")
@@ -1,3 +1,4 @@
+from typing import Any
 from collections import Counter, defaultdict
 from followthemoney import registry, Property, Schema
 from nomenklatura.store import View
@@ -61,6 +62,16 @@ class EntityReferenceValidator(BaseValidator):
                 if len(examples) < MAX_RANGE_EXAMPLES:
                     examples.append(f"{entity.id} -> {other_id}")
 
+    def finish_shard(self) -> Any:
+        return (self.out_of_range, self.examples)
+
+    def merge_shard(self, state: Any) -> None:
+        out_of_range, examples = state
+        self.out_of_range.update(out_of_range)
+        for key, shard_examples in examples.items():
+            missing = MAX_RANGE_EXAMPLES - len(self.examples[key])
+            self.examples[key].extend(shard_examples[:missing])
+
     def finish(self) -> None:
         for (prop, schema), count in self.out_of_range.most_common():
             assert prop.range is not None
@@ -104,6 +115,12 @@ class EmptyValidator(BaseValidator):
     def feed(self, entity: Entity, view: View[Dataset, Entity]) -> None:
         self.is_empty = False
 
+    def finish_shard(self) -> Any:
+        return self.is_empty
+
+    def merge_shard(self, state: Any) -> None:
+        self.is_empty = self.is_empty and state
+
     def finish(self) -> None:
         if self.is_empty:
             self.context.log.warning("No entities validated.")
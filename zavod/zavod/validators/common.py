@@ -1,3 +1,4 @@
+from typing import Any
 from nomenklatura.store import View
 
 from zavod.context import Context
@@ -26,3 +27,12 @@ class BaseValidator:
 
     def finish(self) -> None:
         return None
+
+    def finish_shard(self) -> Any:
+        """Return the state collected while validating a shard of the entities in
+        a worker process, to be combined via `merge_shard`."""
+        return None
+
+    def merge_shard(self, state: Any) -> None:
+        """Combine the state of a shard into this validator, before `finish`."""
+        return None